@@ -0,0 +1,67 @@
+"""
+Benchmark del tiempo de arranque.
+
+Mide, en procesos nuevos, cuánto tarda en importarse cada ruta de uso y qué
+dependencias pesadas quedan cargadas. La ruta "solo carga" (`import funciones`
++ `loading_por_hora`) no debería cargar matplotlib, pyomo ni plotly.
+
+Uso:
+    python benchmarks/importacion.py [--repeticiones 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PESADOS = ["matplotlib", "pyomo", "plotly", "openpyxl", "scipy.optimize"]
+
+RUTAS = {
+    "pandapower": "import pandapower",
+    "modulo_pf": "import modulo_pf",
+    "funciones": "import funciones",
+    "solo_carga": "import funciones, numpy as np; funciones.loading_por_hora(np.zeros(24))",
+    "graficos": "import funciones; import matplotlib.pyplot",
+    "bess_pyomo": "import funciones; import pyomo.environ",
+}
+
+_PLANTILLA = """
+import sys, time, json
+t0 = time.perf_counter()
+{codigo}
+t = time.perf_counter() - t0
+print(json.dumps({{"segundos": t, "cargados": [m for m in {pesados!r} if m in sys.modules]}}))
+"""
+
+
+def medir(codigo, repeticiones=5):
+    """Ejecuta `codigo` en procesos nuevos y retorna (mediana en s, módulos pesados cargados)."""
+    tiempos = []
+    cargados = []
+    for _ in range(repeticiones):
+        salida = subprocess.run(
+            [sys.executable, "-c", _PLANTILLA.format(codigo=codigo, pesados=PESADOS)],
+            cwd=RAIZ, capture_output=True, text=True, check=True
+        )
+        resultado = json.loads(salida.stdout.strip().splitlines()[-1])
+        tiempos.append(resultado["segundos"])
+        cargados = resultado["cargados"]
+    tiempos.sort()
+    return tiempos[len(tiempos) // 2], cargados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importación por ruta de uso")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'ruta':<12} {'mediana [s]':>12}  dependencias pesadas cargadas")
+    for nombre, codigo in RUTAS.items():
+        segundos, cargados = medir(codigo, args.repeticiones)
+        print(f"{nombre:<12} {segundos:>12.2f}  {', '.join(cargados) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Suite de benchmarks de las rutas críticas: flujo de potencia, barridos y despacho.
+
+Mide tiempo (mínimo y mediana de varias repeticiones) y memoria máxima
+(tracemalloc, en una repetición aparte) de cada caso, a varios tamaños de
+problema: 24, 168 y 8760 horas, y 1, 100 y 1000 hogares. Los resultados se
+guardan en JSON y se pueden comparar contra una línea base guardada antes,
+marcando los casos que se pusieron más lentos o usan más memoria.
+
+Todo corre sin red: usa solo la red CIGRE incluida en pandapower y perfiles
+sintéticos generados con semilla fija a partir de los perfiles de proyecto.py.
+
+Uso:
+    python benchmarks/suite.py --guardar benchmarks/linea_base.json
+    python benchmarks/suite.py --comparar benchmarks/linea_base.json
+    python benchmarks/suite.py --filtro loading --rapido
+"""
+import argparse
+import contextlib
+import fnmatch
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pandapower as pp
+
+import funciones as f
+import modulo_pf
+
+# Perfiles de 24 horas de proyecto.py
+DEMANDA_KW = np.array([65, 65, 65, 74, 75, 80, 100, 148, 148, 148, 148, 148,
+                       133, 123, 123, 123, 123, 148, 148, 148, 246, 246, 148, 74], dtype=float)
+PV_PU = np.array([0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.05, 0.05, 0.2, 0.35, 0.6, 0.8,
+                  0.95, 1.0, 0.9, 0.4, 0.2, 0.1, 0.05, 0.0, 0.0, 0.0, 0.0, 0.0])
+EV_PU = np.array([0.6, 0.7, 0.8, 0.7, 0.6, 0.5, 0.5, 0.4, 0.1, 0.1, 0.1, 0.1,
+                  0.1, 0.2, 0.2, 0.2, 0.2, 0.6, 0.7, 1.0, 1.0, 0.9, 0.7, 0.7])
+COSTO = np.array([100] * 3 + [50] * 4 + [100] * 4 + [50] * 6 + [100] * 7, dtype=float)
+PARAMETROS_BESS = {"E_MAX": 900, "E_MIN": 0, "E_INI": 5, "P_MAX": 150, "ETA_C": 1.0, "ETA_D": 1.0, "C_DEG": 15}
+HC_PV_KW = 800
+
+HORAS = (24, 168, 8760)
+HOGARES = (1, 100, 1000)
+
+
+def perfil(base, n_horas, semilla=0, ruido=0.05):
+    """Repite un perfil de 24 h hasta n_horas con ruido multiplicativo (sin ruido para 24 h)."""
+    repetido = np.resize(np.asarray(base, dtype=float), n_horas)
+    if n_horas == len(base):
+        return repetido
+    rng = np.random.default_rng(semilla)
+    return repetido * (1 + ruido * rng.standard_normal(n_horas))
+
+
+def perfiles_hogares(n_hogares, n_horas=24, semilla=0):
+    """Demanda y PV por hogar (hogares x horas), escalados a un hogar típico."""
+    rng = np.random.default_rng(semilla)
+    escala = rng.uniform(0.5, 1.5, (n_hogares, 1))
+    demanda = escala * np.resize(DEMANDA_KW, n_horas)[None, :] / 30
+    pv = rng.uniform(0, 2, (n_hogares, 1)) * np.resize(PV_PU, n_horas)[None, :] * HC_PV_KW / 30
+    return demanda, pv
+
+
+def cache_frio():
+    """Vacía el cache de flujos de potencia para medir siempre en frío."""
+    modulo_pf.configurar_cache()
+
+
+def solver_pyomo():
+    """Primer solver LP disponible para Pyomo (None si Pyomo o los solvers no están instalados)."""
+    try:
+        import pyomo.environ as pyo
+    except ImportError:
+        return None
+    for nombre in ("glpk", "appsi_highs", "cbc"):
+        try:
+            if pyo.SolverFactory(nombre).available(exception_flag=False):
+                return nombre
+        except Exception:
+            continue
+    return None
+
+
+class Caso:
+    """Un benchmark: `preparar()` arma los datos (no se mide) y `ejecutar(datos)` se mide."""
+
+    def __init__(self, nombre, ejecutar, preparar=None, antes=cache_frio, pesado=False):
+        self.nombre = nombre
+        self.ejecutar = ejecutar
+        self.preparar = preparar if preparar is not None else (lambda: None)
+        self.antes = antes
+        self.pesado = pesado
+
+
+def _casos(carpeta):
+    casos = [
+        Caso("build_base_network", lambda _: modulo_pf.build_base_network(), antes=None),
+        Caso("ejecutar_pf", lambda _: modulo_pf.ejecutar_pf(246.0)),
+    ]
+
+    for n in HORAS:
+        datos = lambda n=n: perfil(DEMANDA_KW - PV_PU * HC_PV_KW, n)
+        # pandapower hora a hora solo hasta una semana; el año completo tarda minutos
+        if n <= 168:
+            casos.append(Caso(f"loading_por_hora/pandapower/{n}h", lambda p: f.loading_por_hora(p), datos))
+        casos.append(Caso(f"loading_por_hora/lote/{n}h", lambda p: f.loading_por_hora(p, backend="lote"), datos,
+                          pesado=n > 168))
+        casos.append(Caso(f"loading_por_hora/curva/{n}h", lambda p: f.loading_por_hora(p, backend="curva"), datos,
+                          pesado=n > 168))
+
+    for n in HORAS[:2]:
+        for kind, perfil_pu in (("pv", PV_PU), ("ev", EV_PU)):
+            datos = lambda n=n, perfil_pu=perfil_pu: (perfil(perfil_pu, n, semilla=1), perfil(DEMANDA_KW, n))
+            casos.append(Caso(f"hosting_capacity/{kind}/{n}h",
+                              lambda d, kind=kind: f.hosting_capacity(d[0], kind, step_kw=10, perfil_demanda_kw=d[1]), datos,
+                              pesado=n > 24))
+
+    for n in HORAS:
+        datos = lambda n=n: (perfil(COSTO, n, ruido=0), perfil(DEMANDA_KW, n), perfil(PV_PU * HC_PV_KW, n, semilla=1))
+        casos.append(Caso(
+            f"resolver_despacho_bess/highs/{n}h",
+            lambda d: f.resolver_despacho_bess(PARAMETROS_BESS, d[0], d[1], d[2], None, backend="highs"),
+            datos, antes=None, pesado=n > 168
+        ))
+
+    # Las rutas Pyomo se omiten (con aviso) si no hay solver: resolver_despacho_bess
+    # usa siempre GLPK, y DespachoBESS/barrido_bess el primer solver disponible.
+    solver = solver_pyomo()
+    from modulo_bess import DespachoBESS, barrido_bess, despacho_bess_hogares
+    if solver != "glpk":
+        print("Omitidos los casos resolver_despacho_bess/pyomo: GLPK no está instalado", file=sys.stderr)
+    if solver is None:
+        print("Omitidos los casos DespachoBESS y barrido_bess: no hay un solver LP para Pyomo", file=sys.stderr)
+    for n in HORAS:
+        datos = lambda n=n: (perfil(COSTO, n, ruido=0), perfil(DEMANDA_KW, n), perfil(PV_PU * HC_PV_KW, n, semilla=1))
+        if solver == "glpk":
+            casos.append(Caso(
+                f"resolver_despacho_bess/pyomo/{n}h",
+                lambda d: f.resolver_despacho_bess(PARAMETROS_BESS, d[0], d[1], d[2], None, backend="pyomo"),
+                datos, antes=None, pesado=n > 24
+            ))
+        if solver is not None:
+            casos.append(Caso(
+                f"DespachoBESS/{solver}/{n}h",
+                lambda d: DespachoBESS(PARAMETROS_BESS, d[0], d[1], d[2], solver=solver).resolver(),
+                datos, antes=None, pesado=n > 24
+            ))
+
+    # Barrido de 8 puntos (P_MAX x E_MAX) sobre un modelo ya construido: mide solo las re-soluciones
+    puntos = [{"P_MAX": p_max, "E_MAX": e_max} for p_max in (50, 100, 150, 200) for e_max in (450, 900)]
+    for n in HORAS[:2] if solver is not None else ():
+        datos = lambda n=n: DespachoBESS(PARAMETROS_BESS, perfil(COSTO, n, ruido=0), perfil(DEMANDA_KW, n),
+                                         perfil(PV_PU * HC_PV_KW, n, semilla=1), solver=solver)
+        casos.append(Caso(f"barrido_bess/{solver}/8puntos/{n}h", lambda d: barrido_bess(d, puntos), datos,
+                          antes=None, pesado=n > 24))
+
+    for n in HOGARES:
+        casos.append(Caso(
+            f"despacho_bess_hogares/{n}hogares",
+            lambda d: despacho_bess_hogares(PARAMETROS_BESS, COSTO, d[0], d[1]),
+            lambda n=n: perfiles_hogares(n), antes=None, pesado=n > 100
+        ))
+
+    def datos_grafico():
+        df, _, _, _ = f.loading_por_hora(DEMANDA_KW - PV_PU * HC_PV_KW, backend="lote")
+        return df
+    casos.append(Caso(
+        "graficar_carga_por_linea",
+        lambda df: f.graficar_carga_por_linea(df, os.path.join(carpeta, "lineas"), DEMANDA_KW,
+                                              DEMANDA_KW - PV_PU * HC_PV_KW, PV_PU * HC_PV_KW),
+        datos_grafico, antes=None
+    ))
+    casos.append(Caso(
+        "graficar_perfiles_horarios",
+        lambda _: f.graficar_perfiles_horarios(DEMANDA_KW, DEMANDA_KW - PV_PU * HC_PV_KW, PV_PU * HC_PV_KW,
+                                               None, np.zeros(24), COSTO, os.path.join(carpeta, "perfiles")),
+        antes=None
+    ))
+    return casos
+
+
+def medir(caso, repeticiones):
+    """Ejecuta un caso y retorna sus tiempos y memoria máxima."""
+    datos = caso.preparar()
+
+    # Ejecución de calentamiento: imports diferidos y objetos globales del proceso
+    # (FlujoLote, CurvaRespuesta) quedan fuera de la medición
+    if caso.antes is not None:
+        caso.antes()
+    caso.ejecutar(datos)
+
+    # Memoria en una ejecución aparte, porque tracemalloc hace más lento el código
+    if caso.antes is not None:
+        caso.antes()
+    tracemalloc.start()
+    caso.ejecutar(datos)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tiempos = []
+    for _ in range(repeticiones):
+        if caso.antes is not None:
+            caso.antes()
+        t0 = time.perf_counter()
+        caso.ejecutar(datos)
+        tiempos.append(time.perf_counter() - t0)
+    return {
+        "segundos_min": min(tiempos),
+        "segundos_mediana": statistics.median(tiempos),
+        "repeticiones": repeticiones,
+        "memoria_pico_mb": pico / 2**20,
+    }
+
+
+def comparar(actual, base, tolerancia_tiempo, tolerancia_memoria, minimo_s=0.005):
+    """
+    Retorna la lista de regresiones (caso, métrica, base, actual) respecto a la línea base.
+
+    Las diferencias de tiempo menores que `minimo_s` se ignoran, porque en los
+    casos de pocos milisegundos el ruido relativo supera cualquier tolerancia.
+    """
+    regresiones = []
+    for nombre, r in actual["casos"].items():
+        b = base["casos"].get(nombre)
+        if b is None:
+            continue
+        lento = r["segundos_min"] - b["segundos_min"]
+        if r["segundos_min"] > b["segundos_min"] * (1 + tolerancia_tiempo) and lento > minimo_s:
+            regresiones.append((nombre, "segundos_min", b["segundos_min"], r["segundos_min"]))
+        if r["memoria_pico_mb"] > b["memoria_pico_mb"] * (1 + tolerancia_memoria):
+            regresiones.append((nombre, "memoria_pico_mb", b["memoria_pico_mb"], r["memoria_pico_mb"]))
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de flujo de potencia, barridos y despacho")
+    parser.add_argument("--filtro", default="*", help="patrón (fnmatch) de los casos a ejecutar")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--rapido", action="store_true",
+                        help="omite los casos pesados (8760 h, 1000 hogares, HC de 168 h)")
+    parser.add_argument("--guardar", help="archivo JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="línea base JSON contra la que comparar")
+    parser.add_argument("--tolerancia-tiempo", type=float, default=0.20, help="aumento relativo permitido")
+    parser.add_argument("--tolerancia-memoria", type=float, default=0.20, help="aumento relativo permitido")
+    args = parser.parse_args()
+
+    patron = args.filtro if any(c in args.filtro for c in "*?[") else f"*{args.filtro}*"
+    resultados = {
+        "meta": {
+            "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandapower": pp.__version__,
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "casos": {},
+    }
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        for caso in _casos(carpeta):
+            if not fnmatch.fnmatch(caso.nombre, patron) or (args.rapido and caso.pesado):
+                continue
+            # Las funciones imprimen su avance; se descarta para no ensuciar la tabla
+            with contextlib.redirect_stdout(io.StringIO()):
+                r = medir(caso, args.repeticiones)
+            resultados["casos"][caso.nombre] = r
+            print(f"{caso.nombre:<42} {r['segundos_min']:>10.4f} s  {r['memoria_pico_mb']:>9.1f} MB", flush=True)
+
+    if args.guardar:
+        with open(args.guardar, "w") as archivo:
+            json.dump(resultados, archivo, indent=2)
+        print(f"Resultados guardados en '{args.guardar}'")
+
+    if args.comparar:
+        with open(args.comparar) as archivo:
+            base = json.load(archivo)
+        regresiones = comparar(resultados, base, args.tolerancia_tiempo, args.tolerancia_memoria)
+        if not regresiones:
+            print(f"Sin regresiones respecto a '{args.comparar}'")
+            return 0
+        print(f"Regresiones respecto a '{args.comparar}':")
+        for nombre, metrica, antes, ahora in regresiones:
+            print(f"  {nombre}: {metrica} {antes:.4g} -> {ahora:.4g} ({ahora / antes - 1:+.0%})")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
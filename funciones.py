@@ -1,46 +1,329 @@
-import matplotlib.pyplot as plt
-from modulo_pf import ejecutar_pf
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+import pandapower as pp
+from modulo_pf import PERFIL_DEMANDA_KW, obtener_sesion
+import modulo_traza as traza
 import numpy as np
 import pandas as pd
-import pyomo.environ as pyo
 
-def loading_por_hora(perfil_neto_kw: np.ndarray) -> tuple[pd.DataFrame, int, float, int]:
+# matplotlib, pyomo y los backends alternativos (modulo_nr, modulo_curva,
+# modulo_bess) se importan dentro de las funciones que los usan, para que un
+# análisis de solo carga de líneas no pague su tiempo de importación.
+
+class CargaPorHora:
+    """
+    Carga de líneas por hora respaldada por una matriz NumPy (horas x líneas).
+
+    Las etiquetas e índices de líneas se comparten con la sesión (se arman una
+    vez por topología) y el DataFrame líneas x horas que usaba antes
+    `loading_por_hora` solo se construye si se pide con `to_frame()`.
+    """
+
+    def __init__(self, cargas, line_index, etiquetas=None):
+        self.cargas = cargas
+        self.line_index = np.asarray(line_index)
+        self.etiquetas = etiquetas
+        self._frame = None
+
+    @property
+    def n_horas(self):
+        return self.cargas.shape[0]
+
+    @property
+    def n_lineas(self):
+        return self.cargas.shape[1]
+
+    def maximo(self):
+        """
+        Carga máxima de toda la matriz.
+
+        Returns:
+            hora_max (int), carga_max (float), linea_max (int): ante empates se
+            toma la primera hora y, dentro de ella, la primera línea.
+        """
+        hora, columna = np.unravel_index(np.argmax(self.cargas), self.cargas.shape)
+        return int(hora), float(self.cargas[hora, columna]), int(self.line_index[columna])
+
+    def max_por_hora(self):
+        """Carga máxima de cada hora (vector de largo n_horas)."""
+        return self.cargas.max(axis=1)
+
+    def max_por_linea(self):
+        """Carga máxima de cada línea (vector de largo n_lineas)."""
+        return self.cargas.max(axis=0)
+
+    def to_frame(self):
+        """DataFrame líneas x horas (columnas L0, L1, ...), creado la primera vez que se pide."""
+        if self._frame is None:
+            self._frame = pd.DataFrame(
+                self.cargas.T,
+                index=pd.Index(self.line_index, name="line_index"),
+                columns=[f"L{h}" for h in range(self.n_horas)]
+            )
+        return self._frame
+
+
+_pools = {}
+
+def _obtener_pool(workers: int) -> ProcessPoolExecutor:
+    """Retorna un pool de procesos reutilizable; cada worker mantiene su propia red."""
+    if workers not in _pools:
+        _pools[workers] = ProcessPoolExecutor(max_workers=workers, initializer=obtener_sesion)
+    return _pools[workers]
+
+
+@atexit.register
+def _cerrar_pools():
+    for pool in _pools.values():
+        pool.shutdown(cancel_futures=True)
+    _pools.clear()
+
+
+def _loading_bloque(bloque):
+    """
+    Ejecuta en un worker las horas de un bloque sobre su red persistente.
+
+    Returns:
+        Lista de tuplas (hora, loading, error). Si una hora falla, loading es None
+        y error describe la causa; el proceso principal reporta la hora.
+    """
+    sesion = obtener_sesion()
+    resultados = []
+    for hora, demanda in bloque:
+        try:
+            resultados.append((hora, sesion.loading(demanda), None))
+        except pp.LoadflowNotConverged:
+            resultados.append((hora, None, "flujo no convergió"))
+        except Exception as e:
+            resultados.append((hora, None, f"error inesperado en worker: {e}"))
+    return resultados
+
+
+def _loading_paralelo(perfil_neto_kw, workers, cargas):
+    """Reparte las horas entre los workers y llena la matriz horas x líneas en su lugar."""
+    horas = list(enumerate(perfil_neto_kw))
+    bloques = [horas[i::workers] for i in range(workers) if horas[i::workers]]
+    pool = _obtener_pool(workers)
+
+    for bloque in pool.map(_loading_bloque, bloques):
+        for hora, carga, error in bloque:
+            if error is not None:
+                raise ValueError(f"Error en hora {hora}: {error}")
+            cargas[hora] = carga
+
+
+def _loading_lote(perfil_neto_kw, dtype):
+    """Resuelve todas las horas juntas con el Newton-Raphson vectorizado."""
+    from modulo_nr import obtener_flujo_lote
+    flujo = obtener_flujo_lote()
+    cargas, convergido = flujo.loading(perfil_neto_kw)
+    if not convergido.all():
+        hora = int(np.flatnonzero(~convergido)[0])
+        raise ValueError(f"Error en hora {hora}: flujo no convergió")
+    return CargaPorHora(cargas.astype(dtype, copy=False), flujo.line_index, flujo.etiquetas)
+
+
+def _loading_curva(perfil_neto_kw, dtype, limite_pct=100, margen_pct=2.0):
+    """Interpola la curva de respuesta; las horas cerca del límite se verifican con AC."""
+    from modulo_curva import obtener_curva
+    curva = obtener_curva(perfil_neto_kw)
+    cargas, verificados = curva.loading(perfil_neto_kw, limite_pct=limite_pct, margen_pct=margen_pct)
+    if len(verificados):
+        print(f"Horas verificadas con flujo AC por estar cerca del límite: {verificados.tolist()}")
+    return CargaPorHora(cargas.astype(dtype, copy=False), curva.line_index, curva.etiquetas)
+
+
+@traza.medir()
+def loading_por_hora(
+    perfil_neto_kw: np.ndarray,
+    workers: int = None,
+    backend: str = "pandapower",
+    dtype=np.float64
+) -> tuple[CargaPorHora, int, float, int]:
     """
     Ejecuta el flujo de potencia por cada hora usando el perfil de demanda neta.
 
+    Args:
+        perfil_neto_kw: demanda neta por hora (kW por comunidad)
+        workers: número de procesos para repartir las horas. Si es None o 1,
+            las horas se ejecutan en secuencia en el proceso actual.
+        backend: "pandapower" (un `pp.runpp` por hora), "lote" (Newton-Raphson
+            vectorizado de modulo_nr, recomendado para series largas) o "curva"
+            (interpolación en la curva de respuesta de modulo_curva; las horas
+            a menos de 2% del 100% de carga se verifican con flujo AC).
+        dtype: tipo de la matriz de carga (np.float32 reduce a la mitad la memoria)
+
     Returns:
-        df_final (pd.DataFrame): Matriz de carga por línea y hora.
+        resultado (CargaPorHora): Matriz de carga por hora y línea; `resultado.to_frame()`
+            entrega el DataFrame líneas x horas.
         hora_max (int): Hora en que ocurre la mayor carga individual.
         carga_max (float): Valor máximo de carga (%).
         linea_max (int): Índice de la línea más exigida.
     """
     print("Iniciando análisis de carga por hora...")
 
-    resultados = []
+    if backend == "lote":
+        resultado = _loading_lote(perfil_neto_kw, dtype)
+    elif backend == "curva":
+        resultado = _loading_curva(perfil_neto_kw, dtype)
+    elif backend != "pandapower":
+        raise ValueError(f"backend debe ser 'pandapower', 'lote' o 'curva', no '{backend}'")
+    else:
+        # Se reutiliza la misma red en todas las horas (solo cambian las inyecciones)
+        sesion = obtener_sesion()
+        cargas = np.empty((len(perfil_neto_kw), len(sesion.etiquetas)), dtype=dtype)
+        if workers is not None and workers > 1:
+            _loading_paralelo(perfil_neto_kw, workers, cargas)
+        else:
+            for hora, demanda in enumerate(perfil_neto_kw):
+                try:
+                    with traza.etapa("hora", hora=hora):
+                        cargas[hora] = sesion.loading(demanda)
+                except pp.LoadflowNotConverged:
+                    raise ValueError(f"Error en hora {hora}: flujo no convergió") from None
+        resultado = CargaPorHora(cargas, sesion.net.line.index, sesion.etiquetas)
+
+    hora_max, carga_max, linea_max = resultado.maximo()
 
-    for hora, demanda in enumerate(perfil_neto_kw):
-        df_resultado = ejecutar_pf(demanda_neta_kw=demanda)
-        if df_resultado.empty:
-            raise ValueError(f"Error en hora {hora}: flujo no convergió")
-        resultados.append(df_resultado[["line_index", "loading_percent"]].set_index("line_index"))
+    print(f"Análisis de carga por hora completado.")
+    print(f"Máxima carga: {carga_max:.2f}% en la línea {linea_max}, hora {hora_max}")
 
-    df_final = pd.concat(resultados, axis=1)
-    df_final.columns = [f"L{h}" for h in range(24)]
+    return resultado, hora_max, carga_max, linea_max
 
-    # Buscar el valor máximo en todo el DataFrame
-    carga_max = df_final.max().max()
-    col_max = df_final.max().idxmax()   # Ej: "L20"
-    fila_max = df_final[col_max].idxmax()  # Índice de la línea (int)
 
-    hora_max = int(col_max.strip("L"))
-    linea_max = int(fila_max)
+def ejecutar_escenarios(escenarios: dict, workers: int = None) -> dict:
+    """
+    Ejecuta varios escenarios, opcionalmente repartidos en un pool de procesos.
 
-    print(f"Análisis de carga por hora completado.")
-    print(f"Máxima carga: {carga_max:.2f}% en la línea {linea_max}, hora {hora_max}")
+    Args:
+        escenarios: dict nombre -> función sin argumentos (definida a nivel de módulo)
+        workers: número de procesos. Si es None o 1, se ejecutan en secuencia.
+
+    Returns:
+        dict nombre -> valor retornado por cada escenario, en el orden de entrada.
+    """
+    if workers is None or workers <= 1:
+        return {nombre: funcion() for nombre, funcion in escenarios.items()}
+
+    futuros = {nombre: _obtener_pool(workers).submit(funcion) for nombre, funcion in escenarios.items()}
+    resultados = {}
+    for nombre, futuro in futuros.items():
+        try:
+            resultados[nombre] = futuro.result()
+        except Exception as e:
+            raise RuntimeError(f"Error en escenario '{nombre}': {e}") from e
+    return resultados
+
+
+def _primera_violacion(perfil_neto_kw, limit_pct, sesion, orden):
+    """
+    Evalúa las horas en el orden dado y se detiene en la primera que supera el límite.
+
+    Returns:
+        None si ninguna hora viola el límite, o una tupla (hora, linea, carga).
+        Si el flujo no converge, se considera violación con linea=None.
+    """
+    for hora in orden:
+        try:
+            with traza.etapa("hora", hora=int(hora)):
+                carga = sesion.loading(perfil_neto_kw[hora])
+        except pp.LoadflowNotConverged:
+            return int(hora), None, np.inf
+        linea = int(np.argmax(carga))
+        if carga[linea] > limit_pct:
+            return int(hora), int(sesion.net.line.index[linea]), float(carga[linea])
+    return None
+
+
+@traza.medir()
+def hosting_capacity(
+    perfil_pu: np.ndarray,
+    kind: str,
+    limit_pct: float = 100,
+    step_kw: float = 10,
+    perfil_demanda_kw: np.ndarray = None,
+    perfil_bess_kw: np.ndarray = None,
+    kw_max: float = 100000,
+    sesion=None
+) -> tuple[float, int, int]:
+    """
+    Busca la capacidad instalada máxima (HC) de PV o EV que respeta el límite de carga.
 
-    return df_final, hora_max, carga_max, linea_max
+    Primero acota la capacidad duplicando el número de pasos y luego biseca entre
+    la última capacidad factible y la primera infactible. Cada evaluación de 24 horas
+    se detiene en la primera hora que viola el límite.
 
+    Args:
+        perfil_pu: perfil horario en p.u. de la capacidad instalada
+        kind: "pv" (generación) o "ev" (demanda)
+        limit_pct: límite de carga de líneas (%)
+        step_kw: resolución de la búsqueda (kW)
+        perfil_demanda_kw: demanda base por hora (por defecto PERFIL_DEMANDA_KW de modulo_pf)
+        perfil_bess_kw: despacho BESS fijo por hora (puede ser None)
+        kw_max: capacidad máxima a explorar antes de abortar
+        sesion: SesionPF a usar (por defecto la sesión global del proceso)
 
+    Returns:
+        hc_kw (float): Capacidad máxima factible, múltiplo de step_kw.
+        hora_limite (int): Hora que viola el límite con hc_kw + step_kw.
+        linea_limite (int): Línea que viola el límite (None si el flujo no converge).
+    """
+    if kind not in ("pv", "ev"):
+        raise ValueError(f"kind debe ser 'pv' o 'ev', no '{kind}'")
+    signo = -1 if kind == "pv" else 1
+    perfil_pu = np.asarray(perfil_pu, dtype=float)
+    if perfil_demanda_kw is None:
+        perfil_demanda_kw = PERFIL_DEMANDA_KW
+    perfil_base_kw = np.asarray(perfil_demanda_kw, dtype=float)
+    if perfil_bess_kw is not None:
+        perfil_base_kw = perfil_base_kw + perfil_bess_kw
+
+    print(f"Iniciando búsqueda de hosting capacity {kind.upper()}...")
+    sesion = sesion if sesion is not None else obtener_sesion()
+    violaciones = {}
+
+    def es_factible(n_pasos):
+        hora_previa = violaciones[next(reversed(violaciones))][0] if violaciones else None
+        perfil_neto_kw = perfil_base_kw + signo * n_pasos * step_kw * perfil_pu
+        # Las horas con mayor |demanda neta| suelen ser las que limitan
+        orden = list(np.argsort(-np.abs(perfil_neto_kw), kind="stable"))
+        if hora_previa is not None:
+            # La hora que limitó en la evaluación anterior se revisa primero
+            orden.remove(hora_previa)
+            orden.insert(0, hora_previa)
+        with traza.etapa("evaluacion_hc", capacidad_kw=n_pasos * step_kw):
+            violacion = _primera_violacion(perfil_neto_kw, limit_pct, sesion, orden)
+        if violacion is not None:
+            violaciones[n_pasos] = violacion
+        return violacion is None
+
+    # Acotar: duplicar hasta encontrar una capacidad infactible
+    bajo, alto = 0, 1
+    if not es_factible(bajo):
+        hora, linea, _ = violaciones[bajo]
+        print(f"El límite se viola sin {kind.upper()} instalado (hora {hora}, línea {linea})")
+        return 0.0, hora, linea
+    while es_factible(alto):
+        bajo, alto = alto, 2 * alto
+        if alto * step_kw > kw_max:
+            raise ValueError(f"No se encontró límite de hosting capacity bajo {kw_max} kW")
+
+    # Bisectar entre la última factible y la primera infactible
+    while alto - bajo > 1:
+        medio = (bajo + alto) // 2
+        if es_factible(medio):
+            bajo = medio
+        else:
+            alto = medio
+
+    hc_kw = bajo * step_kw
+    hora_limite, linea_limite, carga = violaciones[alto]
+    print(f"Hosting capacity {kind.upper()}: {hc_kw} kW "
+          f"(con {alto * step_kw} kW se supera el límite en la línea {linea_limite}, hora {hora_limite})")
+    return hc_kw, hora_limite, linea_limite
+
+
+@traza.medir()
 def graficar_carga_por_linea(
     df_loading_por_hora,
     nombre_archivo=None,
@@ -50,66 +333,34 @@ def graficar_carga_por_linea(
     perfil_ev_kw=None,
     perfil_bess_kw=None
 ):
-    horas = range(24)
-
-    mostrar_superior = any(p is not None for p in [perfil_demanda_kw, perfil_neto_kw, perfil_pv_kw, perfil_ev_kw, perfil_bess_kw])
-
-    if mostrar_superior:
-        # Crear figura con 2 subplots: perfiles arriba, carga de líneas abajo
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10), sharex=True, gridspec_kw={'height_ratios': [1, 2]})
-
-        # ---------- Gráfico superior: Perfiles horarios ----------
-        if perfil_demanda_kw is not None:
-            ax1.plot(horas, perfil_demanda_kw, color='black', linestyle='-', linewidth=2, label="Dem. base", zorder=1)
-
-        if perfil_pv_kw is not None:
-            ax1.plot(horas, perfil_pv_kw, color='firebrick', linestyle='-', linewidth=1.8, label="Gen. PV", zorder=2)
-
-        if perfil_ev_kw is not None:
-            ax1.plot(horas, perfil_ev_kw, color='cornflowerblue', linestyle='-', linewidth=1.8, label="Dem. EV", zorder=2)
-
-        if perfil_bess_kw is not None:
-            ax1.plot(horas, perfil_bess_kw, color='forestgreen', linestyle='-', linewidth=1.8, label="BESS", zorder=2)
-
-        if perfil_neto_kw is not None:
-            ax1.plot(horas, perfil_neto_kw, color='darkviolet', linestyle='-', linewidth=2.0, label="Dem. neta", zorder=3)
-
-        ax1.set_ylabel("Potencia [kW]")
-        ax1.set_title("Perfiles horarios de comunidad")
-        ax1.grid(True, linestyle="--", alpha=0.5)
-        ax1.legend(bbox_to_anchor=(1, 1), loc='upper left')
-    else:
-        # Crear figura con un solo subplot
-        fig, ax2 = plt.subplots(1, 1, figsize=(12, 6))
-
-    # ---------- Gráfico inferior: Carga de líneas ----------
-    for line_idx, row in df_loading_por_hora.iterrows():
-        ax2.plot(horas, row.values, label=f"Línea {line_idx}")
-    
-    ax2.set_xlim(0, 23)
-    ax2.set_xticks(range(24))
-    ax2.set_ylim(0, 1.1 * df_loading_por_hora.values.max())
-    ax2.set_xlabel("Hora del día")
-    ax2.set_ylabel("Carga (%)")
-    ax2.set_title("Carga de líneas por hora")
-    ax2.grid(True, linestyle="--", alpha=0.5)
-    ax2.legend(bbox_to_anchor=(1, 1), loc='upper left')
-
-    plt.tight_layout()
-
-    if nombre_archivo is not None:
-        plt.savefig(f"{nombre_archivo}.png", dpi=150)
+    """
+    Grafica los perfiles horarios (si se entregan) y la carga de cada línea por hora.
 
-    plt.close()
+    El dibujo se hace con las plantillas de modulo_graficos (sin pyplot); para
+    muchas figuras conviene `modulo_graficos.graficar_lote`.
+    """
+    from modulo_graficos import dibujar
+    dibujar(
+        "carga_por_linea",
+        df_loading_por_hora=df_loading_por_hora,
+        nombre_archivo=nombre_archivo,
+        perfil_demanda_kw=perfil_demanda_kw,
+        perfil_neto_kw=perfil_neto_kw,
+        perfil_pv_kw=perfil_pv_kw,
+        perfil_ev_kw=perfil_ev_kw,
+        perfil_bess_kw=perfil_bess_kw
+    )
     return
 
 
+@traza.medir()
 def resolver_despacho_bess(
     parametros_bess: dict,
     perfil_costo: np.ndarray,
     perfil_demanda_kw: np.ndarray,
     perfil_pv_kw: np.ndarray = None,
-    perfil_ev_kw: np.ndarray = None
+    perfil_ev_kw: np.ndarray = None,
+    backend: str = "pyomo"
 ) -> pd.DataFrame:
     """
     Optimiza el despacho horario del BESS para un solo hogar usando perfiles horarios.
@@ -120,6 +371,10 @@ def resolver_despacho_bess(
         perfil_demanda_kw: demanda base por hora
         perfil_pv_kw: generación PV por hora (puede ser None)
         perfil_ev_kw: carga EV por hora (puede ser None)
+        backend: "pyomo" (modelo Pyomo resuelto con GLPK), "highs" (LP matricial
+            resuelto en el mismo proceso con HiGHS, ver modulo_bess) o "red" (LP
+            HiGHS con restricciones linealizadas de carga de líneas y verificación AC;
+            el límite se cumple solo con la batería, sin recortar PV)
 
     Returns:
         DataFrame con columnas: 'Periodo', 'e_final', 'p_c', 'p_d', 'g_buy', 'g_sell'
@@ -135,6 +390,20 @@ def resolver_despacho_bess(
         perfil_ev_kw = np.zeros_like(perfil_demanda_kw)
     D = perfil_demanda_kw + perfil_ev_kw
     S_PV = perfil_pv_kw
+
+    if backend == "highs":
+        from modulo_bess import despacho_bess_highs
+        df_resultados, p_bess_array = despacho_bess_highs(parametros_bess, perfil_costo, D, S_PV)
+        print("Optimización BESS completada.")
+        return df_resultados, p_bess_array
+    elif backend == "red":
+        from modulo_bess import despacho_bess_red
+        return despacho_bess_red(parametros_bess, perfil_costo, perfil_demanda_kw, perfil_pv_kw, perfil_ev_kw)
+    elif backend != "pyomo":
+        raise ValueError(f"backend debe ser 'pyomo', 'highs' o 'red', no '{backend}'")
+    import pyomo.environ as pyo
+    marca = traza.inicio()
+
     P_buy = {t: perfil_costo[t] for t in T}
     P_sell = {t: perfil_costo[t] for t in T} 
 
@@ -193,12 +462,16 @@ def resolver_despacho_bess(
         )
     model.obj = pyo.Objective(rule=obj_rule, sense=pyo.maximize)
 
+    traza.cerrar("pyomo_construccion", marca)
+
     # Resolver
     solver = pyo.SolverFactory("glpk")
-    solver.solve(model, tee=False)
+    with traza.etapa("pyomo_resolver"):
+        solver.solve(model, tee=False)
     print("Optimización BESS completada.")
 
     # Extraer resultados
+    marca = traza.inicio()
     rows = []
     for t in T:
         p_c = pyo.value(model.p_c[0, t])
@@ -217,10 +490,12 @@ def resolver_despacho_bess(
 
     df_resultados = pd.DataFrame(rows)
     p_bess_array = df_resultados["p_bess"].values
+    traza.cerrar("pyomo_resultados", marca)
 
     return df_resultados, p_bess_array
 
 
+@traza.medir()
 def graficar_perfiles_horarios(
     perfil_demanda_kw=None,
     perfil_neto_kw=None,
@@ -230,51 +505,20 @@ def graficar_perfiles_horarios(
     perfil_costo=None,
     nombre_archivo=None
 ):
-    horas = range(24)
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 9), sharex=True, gridspec_kw={'height_ratios': [1, 2]})
+    """
+    Grafica el despacho BESS con el costo horario y los perfiles de potencia de la comunidad.
 
-    # -------- Gráfico superior: BESS y costo horario --------
-    # Eje izquierdo: BESS
-    if perfil_bess_kw is not None:
-        ax1.plot(horas, perfil_bess_kw, color='forestgreen', linestyle='-', linewidth=2, label="BESS", zorder=2)
-    ax1.set_ylabel("BESS [kW]")
-    ax1.grid(True, linestyle="--", alpha=0.5)
-    ax1.set_title("Perfil de operación BESS y costo horario")
-
-    # Eje derecho: Costo horario
-    if perfil_costo is not None:
-        ax1b = ax1.twinx()
-        ax1b.plot(horas, perfil_costo, color='goldenrod', linestyle='--', linewidth=2, label="Costo", zorder=0)
-        ax1b.set_ylabel("Costo horario [$ / kWh]")
-        # Leyenda combinada sólo si hay ambas curvas
-        lines1, labels1 = ax1.get_legend_handles_labels()
-        lines2, labels2 = ax1b.get_legend_handles_labels()
-        ax1.legend(lines1 + lines2, labels1 + labels2, loc='lower right')
-    else:
-        ax1.legend(loc='upper left')
-
-    # -------- Gráfico inferior: Perfiles de potencia --------
-    if perfil_demanda_kw is not None:
-        ax2.plot(horas, perfil_demanda_kw, color='black', linestyle='-', linewidth=2, label="Dem. base", zorder=1)
-    if perfil_pv_kw is not None:
-        ax2.plot(horas, -1*perfil_pv_kw, color='firebrick', linestyle='-', linewidth=1.8, label="Gen. PV", zorder=2)
-    if perfil_ev_kw is not None:
-        ax2.plot(horas, perfil_ev_kw, color='cornflowerblue', linestyle='-', linewidth=1.8, label="Dem. EV", zorder=2)
-    if perfil_bess_kw is not None:
-        ax2.plot(horas, perfil_bess_kw, color='forestgreen', linestyle='-', linewidth=1.8, label="BESS", zorder=2)
-    if perfil_neto_kw is not None:
-        ax2.plot(horas, perfil_neto_kw, color='darkviolet', linestyle='-', linewidth=2, label="Dem. neta", zorder=3)
-
-    ax2.set_xlabel("Hora del día")
-    ax2.set_ylabel("Potencia [kW]")
-    ax2.set_xlim(0, 23)
-    ax2.set_xticks(range(24))
-    ax2.grid(True, linestyle="--", alpha=0.5)
-    ax2.legend(loc='lower right')
-    ax2.set_title("Perfiles horarios de potencia en comunidad")
-
-    plt.tight_layout()
-    if nombre_archivo is not None:
-        plt.savefig(f"{nombre_archivo}.png", dpi=150)
-    plt.close()
+    El dibujo se hace con las plantillas de modulo_graficos (sin pyplot).
+    """
+    from modulo_graficos import dibujar
+    dibujar(
+        "perfiles_horarios",
+        perfil_demanda_kw=perfil_demanda_kw,
+        perfil_neto_kw=perfil_neto_kw,
+        perfil_pv_kw=perfil_pv_kw,
+        perfil_ev_kw=perfil_ev_kw,
+        perfil_bess_kw=perfil_bess_kw,
+        perfil_costo=perfil_costo,
+        nombre_archivo=nombre_archivo
+    )
     return
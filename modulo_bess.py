@@ -0,0 +1,642 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.optimize import linprog
+from modulo_pf import ejecutar_pf, obtener_sesion
+import modulo_traza as traza
+
+# Orden de los bloques de variables en el vector x del LP (cada uno de largo T,
+# salvo la energía que tiene T + 1 valores)
+BLOQUES_LP = ["e", "p_c", "p_d", "g_buy", "g_sell", "p_solar"]
+
+def indices_lp(T):
+    """Retorna un dict bloque -> slice dentro del vector de variables."""
+    indices = {}
+    inicio = 0
+    for bloque in BLOQUES_LP:
+        largo = T + 1 if bloque == "e" else T
+        indices[bloque] = slice(inicio, inicio + largo)
+        inicio += largo
+    return indices
+
+
+def armar_lp_bess(parametros_bess, precio_compra, precio_venta, D, S_PV):
+    """
+    Arma en forma matricial el LP de despacho BESS de un hogar.
+
+    Es el mismo modelo de `funciones.resolver_despacho_bess`: balance de energía
+    de la batería, balance de potencia del hogar, límite de PV, SOC final mayor o
+    igual al inicial y máximo de ingresos por venta menos compras y degradación.
+    Se plantea como minimización (objetivo con signo invertido).
+
+    Returns:
+        c, A_eq, b_eq, bounds, indices: entradas para `scipy.optimize.linprog`.
+    """
+    parametros = {clave: np.array([valor]) for clave, valor in parametros_bess.items()}
+    return armar_lp_bess_lote(parametros, precio_compra, precio_venta, np.atleast_2d(D), np.atleast_2d(S_PV))
+
+
+def armar_lp_bess_lote(parametros, precio_compra, precio_venta, D, S_PV):
+    """
+    Arma el LP de N hogares independientes como un solo sistema disperso diagonal por bloques.
+
+    Args:
+        parametros: dict clave -> array de largo N con los parámetros de cada hogar
+        precio_compra, precio_venta: precios por hora (comunes a todos los hogares)
+        D, S_PV: matrices N x T de demanda total y PV disponible
+
+    Returns:
+        c, A_eq, b_eq, bounds, indices: entradas para `linprog`. `indices` da los
+        slices de cada bloque dentro de las variables de un hogar; el hogar h usa
+        el tramo [h * n, (h + 1) * n) con n = indices["p_solar"].stop.
+    """
+    N, T = D.shape
+    idx = indices_lp(T)
+    n = idx["p_solar"].stop
+    m = 2 * T + 1
+    t = np.arange(T)
+    e, p_c, p_d = idx["e"].start, idx["p_c"].start, idx["p_d"].start
+    g_buy, g_sell, p_solar = idx["g_buy"].start, idx["g_sell"].start, idx["p_solar"].start
+    unos = np.ones((N, T))
+
+    # Objetivo: min  P_buy*g_buy - P_sell*g_sell + c_deg*(p_c + p_d)
+    c = np.zeros((N, n))
+    c[:, idx["g_buy"]] = precio_compra
+    c[:, idx["g_sell"]] = -np.asarray(precio_venta, dtype=float)
+    c[:, idx["p_c"]] = parametros["C_DEG"][:, None]
+    c[:, idx["p_d"]] = parametros["C_DEG"][:, None]
+
+    # Filas 0..T-1: e[t+1] - e[t] - eta_c*p_c[t] + p_d[t]/eta_d = 0
+    # Filas T..2T-1: p_solar - p_c - g_sell + p_d + g_buy = D
+    # Fila 2T: e[0] = E_ini
+    filas = np.concatenate([t, t, t, t, T + t, T + t, T + t, T + t, T + t, [2 * T]])
+    columnas = np.concatenate([
+        e + t + 1, e + t, p_c + t, p_d + t,
+        p_solar + t, p_c + t, g_sell + t, p_d + t, g_buy + t, [e]
+    ])
+    valores = np.concatenate([
+        unos, -unos, -parametros["ETA_C"][:, None] * unos, unos / parametros["ETA_D"][:, None],
+        unos, -unos, -unos, unos, unos, np.ones((N, 1))
+    ], axis=1)
+    hogares = np.arange(N)[:, None]
+    A_eq = sp.csr_matrix(
+        (valores.ravel(), ((filas[None, :] + m * hogares).ravel(), (columnas[None, :] + n * hogares).ravel())),
+        shape=(N * m, N * n)
+    )
+    b_eq = np.concatenate([np.zeros((N, T)), D, parametros["E_INI"][:, None]], axis=1).ravel()
+
+    # Cotas: SOC, potencia de la batería, compras/ventas y PV disponible.
+    # La condición de SOC final e[T] >= E_ini se impone como cota inferior.
+    lb = np.zeros((N, n))
+    ub = np.full((N, n), np.inf)
+    lb[:, idx["e"]] = parametros["E_MIN"][:, None]
+    ub[:, idx["e"]] = parametros["E_MAX"][:, None]
+    lb[:, e + T] = np.maximum(parametros["E_MIN"], parametros["E_INI"])
+    ub[:, idx["p_c"]] = parametros["P_MAX"][:, None]
+    ub[:, idx["p_d"]] = parametros["P_MAX"][:, None]
+    ub[:, idx["p_solar"]] = S_PV
+    return c.ravel(), A_eq, b_eq, np.column_stack([lb.ravel(), ub.ravel()]), idx
+
+
+def tabla_despacho(x, idx):
+    """Arma el DataFrame de resultados con el mismo formato del modelo Pyomo."""
+    T = idx["p_c"].stop - idx["p_c"].start
+    p_c = x[idx["p_c"]]
+    p_d = x[idx["p_d"]]
+    return pd.DataFrame({
+        "Periodo": np.arange(T),
+        "e_final": x[idx["e"]][1:],
+        "p_c": p_c,
+        "p_d": p_d,
+        "g_buy": x[idx["g_buy"]],
+        "g_sell": x[idx["g_sell"]],
+        "p_solar": x[idx["p_solar"]],
+        "p_bess": p_c - p_d,
+    })
+
+
+def despacho_bess_highs(parametros_bess, perfil_costo, D, S_PV):
+    """
+    Resuelve el despacho BESS en el mismo proceso con HiGHS (`scipy.optimize.linprog`).
+
+    Args:
+        parametros_bess: dict con claves ["E_MAX", "E_MIN", "E_INI", "P_MAX", "ETA_C", "ETA_D", "C_DEG"]
+        perfil_costo: precio de compra/venta por hora
+        D: demanda total (base + EV) por hora
+        S_PV: generación PV disponible por hora
+
+    Returns:
+        df_resultados (pd.DataFrame): Despacho horario (mismas columnas que el modelo Pyomo).
+        p_bess_array (np.ndarray): Perfil neto del BESS (carga - descarga).
+    """
+    precio = np.asarray(perfil_costo, dtype=float)[:len(D)]
+    with traza.etapa("highs_construccion"):
+        c, A_eq, b_eq, bounds, idx = armar_lp_bess(parametros_bess, precio, precio, D, S_PV)
+    with traza.etapa("highs_resolver"):
+        res = linprog(c, A_eq=A_eq, b_eq=b_eq, bounds=bounds, method="highs")
+    if res.status != 0:
+        raise RuntimeError(f"El despacho BESS no encontró solución óptima: {res.message}")
+    df_resultados = tabla_despacho(res.x, idx)
+    return df_resultados, df_resultados["p_bess"].values
+
+
+CLAVES_BESS = ["E_MAX", "E_MIN", "E_INI", "P_MAX", "ETA_C", "ETA_D", "C_DEG"]
+
+def _parametros_por_hogar(parametros_bess, N):
+    """Normaliza los parámetros (dict de escalares/arrays o DataFrame con N filas) a arrays de largo N."""
+    parametros = {}
+    for clave in CLAVES_BESS:
+        valor = np.asarray(parametros_bess[clave], dtype=float)
+        parametros[clave] = np.broadcast_to(valor, (N,)).copy()
+    return parametros
+
+
+def _resolver_bloque_hogares(args):
+    """Resuelve un bloque de hogares como un solo LP diagonal por bloques."""
+    parametros, precio, D, S_PV = args
+    c, A_eq, b_eq, bounds, idx = armar_lp_bess_lote(parametros, precio, precio, D, S_PV)
+    res = linprog(c, A_eq=A_eq, b_eq=b_eq, bounds=bounds, method="highs")
+    if res.status != 0:
+        raise RuntimeError(f"El despacho BESS no encontró solución óptima: {res.message}")
+    x = res.x.reshape(D.shape[0], -1)
+    return {bloque: x[:, idx[bloque]] for bloque in BLOQUES_LP}
+
+
+def despacho_bess_hogares(
+    parametros_bess,
+    perfil_costo: np.ndarray,
+    perfil_demanda_kw: np.ndarray,
+    perfil_pv_kw: np.ndarray = None,
+    perfil_ev_kw: np.ndarray = None,
+    tamano_bloque: int = 500,
+    workers: int = None
+) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Optimiza el despacho BESS de N hogares, cada uno con su propia batería.
+
+    Los hogares son independientes, así que se agrupan en bloques de
+    `tamano_bloque` y cada bloque se resuelve como un LP disperso diagonal por
+    bloques con HiGHS. Los bloques se reparten en un pool de procesos si
+    workers > 1.
+
+    Args:
+        parametros_bess: dict con claves ["E_MAX", "E_MIN", "E_INI", "P_MAX", "ETA_C", "ETA_D", "C_DEG"],
+            cada una escalar (común) o array de largo N; también se acepta un DataFrame con N filas
+        perfil_costo: precio de compra/venta por hora (común a todos los hogares)
+        perfil_demanda_kw: matriz N x T de demanda base
+        perfil_pv_kw: matriz N x T de generación PV (puede ser None)
+        perfil_ev_kw: matriz N x T de carga EV (puede ser None)
+        tamano_bloque: hogares por LP
+        workers: número de procesos (None o 1 = secuencial)
+
+    Returns:
+        df_resultados (pd.DataFrame): Despacho por hogar y periodo (columna 'Hogar' más
+            las columnas de resolver_despacho_bess).
+        p_bess_comunidad (np.ndarray): Perfil BESS agregado de los N hogares, por hora.
+    """
+    D = np.atleast_2d(np.asarray(perfil_demanda_kw, dtype=float))
+    N, T = D.shape
+    if perfil_ev_kw is not None:
+        D = D + np.atleast_2d(perfil_ev_kw)
+    S_PV = np.zeros((N, T)) if perfil_pv_kw is None else np.broadcast_to(np.atleast_2d(perfil_pv_kw), (N, T))
+    parametros = _parametros_por_hogar(parametros_bess, N)
+    precio = np.asarray(perfil_costo, dtype=float)[:T]
+
+    print(f"Optimizando despacho BESS de {N} hogares...")
+    tareas = [
+        ({clave: valor[i:i + tamano_bloque] for clave, valor in parametros.items()},
+         precio, D[i:i + tamano_bloque], S_PV[i:i + tamano_bloque])
+        for i in range(0, N, tamano_bloque)
+    ]
+    if workers is not None and workers > 1 and len(tareas) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            bloques = list(pool.map(_resolver_bloque_hogares, tareas))
+    else:
+        bloques = [_resolver_bloque_hogares(tarea) for tarea in tareas]
+    x = {bloque: np.concatenate([b[bloque] for b in bloques]) for bloque in BLOQUES_LP}
+    print("Optimización BESS completada.")
+
+    p_bess = x["p_c"] - x["p_d"]
+    df_resultados = pd.DataFrame({
+        "Hogar": np.repeat(np.arange(N), T),
+        "Periodo": np.tile(np.arange(T), N),
+        "e_final": x["e"][:, 1:].ravel(),
+        "p_c": x["p_c"].ravel(),
+        "p_d": x["p_d"].ravel(),
+        "g_buy": x["g_buy"].ravel(),
+        "g_sell": x["g_sell"].ravel(),
+        "p_solar": x["p_solar"].ravel(),
+        "p_bess": p_bess.ravel(),
+    })
+    return df_resultados, p_bess.sum(axis=0)
+
+
+def sensibilidades_carga(x_ref_kw=500.0, limite_pct=100):
+    """
+    Sensibilidad lineal de la carga de cada línea a la demanda neta de la comunidad.
+
+    La carga de cada línea es aproximadamente una V en la demanda neta x (consumo
+    para x > 0, flujo inverso para x < 0). Para cada signo se traza la secante
+    desde x = 0 hasta el punto donde la línea más cargada llega a `limite_pct`,
+    estimado con una primera secante en ±x_ref_kw. Usa 5 flujos de `ejecutar_pf`.
+
+    Returns:
+        carga_0 (np.ndarray): Carga de cada línea con x = 0.
+        pendientes (dict): {+1: pendiente para consumo, -1: pendiente para flujo inverso}, en %/kW.
+    """
+    carga_0 = ejecutar_pf(0.0)["loading_percent"].to_numpy()
+    pendientes = {}
+    for signo in (1, -1):
+        x = signo * x_ref_kw
+        for _ in range(2):
+            pendiente = (ejecutar_pf(x)["loading_percent"].to_numpy() - carga_0) / x
+            # Punto donde la línea más sensible alcanzaría el límite
+            x = signo * float(np.min((limite_pct - carga_0) / np.abs(pendiente)))
+        pendientes[signo] = pendiente
+    return carga_0, pendientes
+
+
+def despacho_bess_red(
+    parametros_bess: dict,
+    perfil_costo: np.ndarray,
+    perfil_demanda_kw: np.ndarray,
+    perfil_pv_kw: np.ndarray = None,
+    perfil_ev_kw: np.ndarray = None,
+    limite_pct: float = 100,
+    max_iter: int = 3,
+    recorte_pv: bool = False,
+    costo_recorte: float = None
+) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Despacho BESS que respeta la carga de las líneas de la red.
+
+    Agrega al LP de despacho una restricción lineal de carga por línea, hora y
+    sentido de flujo sobre la demanda neta que ve la red (g_buy - g_sell), usando
+    las sensibilidades de `sensibilidades_carga`. Por defecto toda la PV disponible
+    se inyecta (p_solar = perfil_pv_kw): el límite se cumple solo cambiando el
+    despacho de la batería, y la demanda neta es la misma que arma quien usa el
+    resultado, demanda + EV - PV + p_bess. Con `recorte_pv=True` el LP puede
+    además recortar PV con un costo por kWh; el recorte queda en la columna
+    'recorte_pv' y la demanda neta real en 'demanda_neta', que es la que se debe
+    usar en vez de demanda + EV - PV + p_bess. Luego verifica la demanda neta con
+    flujos AC; si alguna hora supera el límite, reduce el límite efectivo en el
+    exceso observado y vuelve a resolver (hasta `max_iter` veces).
+
+    Args:
+        parametros_bess, perfil_costo, perfil_demanda_kw, perfil_pv_kw, perfil_ev_kw:
+            igual que en `funciones.resolver_despacho_bess`
+        limite_pct: límite de carga de las líneas (%)
+        max_iter: número máximo de ajustes después de la verificación AC
+        recorte_pv: permitir recortar PV cuando la batería sola no alcanza
+        costo_recorte: costo del recorte ($/kWh); por defecto 10 veces el precio máximo,
+            para que el LP recorte solo lo que la batería no puede absorber
+
+    Returns:
+        df_resultados (pd.DataFrame): Despacho horario; incluye 'recorte_pv', 'demanda_neta'
+            (demanda + EV - PV + recorte + p_bess) y 'carga_max' (verificada en AC sobre esa demanda neta).
+        p_bess_array (np.ndarray): Perfil neto del BESS (carga - descarga).
+    """
+    T = len(perfil_demanda_kw)
+    D = np.asarray(perfil_demanda_kw, dtype=float)
+    if perfil_ev_kw is not None:
+        D = D + perfil_ev_kw
+    S_PV = np.zeros(T) if perfil_pv_kw is None else np.asarray(perfil_pv_kw, dtype=float)
+    precio = np.asarray(perfil_costo, dtype=float)[:T]
+    c, A_eq, b_eq, bounds, idx = armar_lp_bess(parametros_bess, precio, precio, D, S_PV)
+    if recorte_pv:
+        # El recorte (S_PV - p_solar) se penaliza; la constante del objetivo no afecta al LP
+        if costo_recorte is None:
+            costo_recorte = 10 * max(float(np.max(precio)), 0.0) + parametros_bess["C_DEG"]
+        c[idx["p_solar"]] -= costo_recorte
+    else:
+        # Sin recorte de PV: si no, el LP cumple el límite recortando PV en vez de mover la batería
+        bounds[idx["p_solar"], 0] = S_PV
+
+    print("Calculando sensibilidades de carga de líneas...")
+    carga_0, pendientes = sensibilidades_carga(limite_pct=limite_pct)
+    n_lineas = len(carga_0)
+
+    # Filas (t, línea, sentido): carga_0 + pendiente * (g_buy[t] - g_sell[t]) <= límite
+    t, l = np.meshgrid(np.arange(T), np.arange(n_lineas), indexing="ij")
+    t, l = t.ravel(), l.ravel()
+    filas, columnas, valores = [], [], []
+    for k, signo in enumerate((1, -1)):
+        fila = k * T * n_lineas + np.arange(T * n_lineas)
+        coef = pendientes[signo][l]
+        filas += [fila, fila]
+        columnas += [idx["g_buy"].start + t, idx["g_sell"].start + t]
+        valores += [coef, -coef]
+    A_ub = sp.csr_matrix(
+        (np.concatenate(valores), (np.concatenate(filas), np.concatenate(columnas))),
+        shape=(2 * T * n_lineas, A_eq.shape[1])
+    )
+
+    sesion = obtener_sesion()
+    limite_efectivo = limite_pct
+    for iteracion in range(max_iter + 1):
+        b_ub = np.tile(limite_efectivo - carga_0[l], 2)
+        res = linprog(c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq, bounds=bounds, method="highs")
+        if res.status != 0:
+            motivo = "" if recorte_pv else (
+                " (la batería no alcanza a mantener las líneas bajo el límite sin recortar PV; ver recorte_pv=True)"
+            )
+            raise RuntimeError(f"El despacho BESS con restricciones de red no tiene solución{motivo}: {res.message}")
+        df_resultados = tabla_despacho(res.x, idx)
+
+        # Verificación AC de la demanda neta que ve la red: la que reconstruye quien usa
+        # p_bess, más el recorte de PV si lo hubo
+        recorte = S_PV - df_resultados["p_solar"].to_numpy()
+        demanda_neta = D - S_PV + recorte + df_resultados["p_bess"].to_numpy()
+        carga_max = np.array([sesion.loading(x).max() for x in demanda_neta])
+        exceso = carga_max.max() - limite_pct
+        print(f"Verificación AC (iteración {iteracion}): carga máxima {carga_max.max():.2f}%")
+        if exceso <= 1e-6:
+            break
+        limite_efectivo -= exceso
+    else:
+        print(f"Advertencia: el despacho supera el límite de carga en {exceso:.2f}% tras {max_iter} ajustes")
+
+    df_resultados["recorte_pv"] = recorte
+    df_resultados["demanda_neta"] = demanda_neta
+    df_resultados["carga_max"] = carga_max
+    print("Optimización BESS con restricciones de red completada.")
+    return df_resultados, df_resultados["p_bess"].values
+
+
+def valor_objetivo(df_resultados, parametros_bess, perfil_costo):
+    """Evalúa el objetivo del despacho (ventas - compras - degradación) a partir de la tabla."""
+    precio = np.asarray(perfil_costo, dtype=float)[:len(df_resultados)]
+    return float(np.sum(
+        precio * df_resultados["g_sell"] - precio * df_resultados["g_buy"]
+        - parametros_bess["C_DEG"] * (df_resultados["p_c"] + df_resultados["p_d"])
+    ))
+
+
+class DespachoBESS:
+    """
+    Modelo Pyomo de despacho BESS persistente para barridos de parámetros.
+
+    El modelo se construye una sola vez con parámetros mutables (demanda, PV,
+    precios y límites de la batería). Cada punto del barrido solo actualiza esos
+    datos y vuelve a resolver con un solver persistente (por defecto la interfaz
+    APPSI de HiGHS), que actualiza el modelo en forma incremental y parte desde
+    la base de la solución anterior.
+    """
+
+    @traza.medir("pyomo_construccion")
+    def __init__(
+        self,
+        parametros_bess: dict,
+        perfil_costo: np.ndarray,
+        perfil_demanda_kw: np.ndarray,
+        perfil_pv_kw: np.ndarray = None,
+        perfil_ev_kw: np.ndarray = None,
+        solver: str = "appsi_highs"
+    ):
+        import pyomo.environ as pyo
+        T = list(range(len(perfil_demanda_kw)))
+        m = pyo.ConcreteModel()
+        m.T = pyo.Set(initialize=T)
+        m.Te = pyo.RangeSet(0, len(T))
+        m.D = pyo.Param(m.T, initialize=0.0, mutable=True)
+        m.S_PV = pyo.Param(m.T, initialize=0.0, mutable=True)
+        m.P_buy = pyo.Param(m.T, initialize=0.0, mutable=True)
+        m.P_sell = pyo.Param(m.T, initialize=0.0, mutable=True)
+        for nombre in ["eta_c", "eta_d", "P_max", "E_max", "E_min", "E_ini", "E_fin", "c_deg"]:
+            m.add_component(nombre, pyo.Param(initialize=1.0, mutable=True))
+
+        # Los límites dependen de parámetros mutables, por eso van como restricciones
+        m.e = pyo.Var(m.Te)
+        m.p_c = pyo.Var(m.T, domain=pyo.NonNegativeReals)
+        m.p_d = pyo.Var(m.T, domain=pyo.NonNegativeReals)
+        m.g_buy = pyo.Var(m.T, domain=pyo.NonNegativeReals)
+        m.g_sell = pyo.Var(m.T, domain=pyo.NonNegativeReals)
+        m.p_solar = pyo.Var(m.T, domain=pyo.NonNegativeReals)
+
+        m.e_min = pyo.Constraint(m.Te, rule=lambda m, i: m.e[i] >= m.E_min)
+        m.e_max = pyo.Constraint(m.Te, rule=lambda m, i: m.e[i] <= m.E_max)
+        m.p_c_max = pyo.Constraint(m.T, rule=lambda m, t: m.p_c[t] <= m.P_max)
+        m.p_d_max = pyo.Constraint(m.T, rule=lambda m, t: m.p_d[t] <= m.P_max)
+        m.soc_init = pyo.Constraint(expr=m.e[0] == m.E_ini)
+        m.soc_balance = pyo.Constraint(
+            m.T, rule=lambda m, t: m.e[t + 1] == m.e[t] + m.eta_c * m.p_c[t] - m.p_d[t] / m.eta_d
+        )
+        m.solar_limit = pyo.Constraint(m.T, rule=lambda m, t: m.p_solar[t] <= m.S_PV[t])
+        m.balance = pyo.Constraint(
+            m.T, rule=lambda m, t: m.D[t] == (m.p_solar[t] - m.p_c[t] - m.g_sell[t]) + m.p_d[t] + m.g_buy[t]
+        )
+        m.soc_final = pyo.Constraint(expr=m.e[len(T)] >= m.E_fin)
+        m.obj = pyo.Objective(
+            expr=sum(m.P_sell[t] * m.g_sell[t] - m.P_buy[t] * m.g_buy[t] - m.c_deg * (m.p_c[t] + m.p_d[t]) for t in T),
+            sense=pyo.maximize
+        )
+
+        self.model = m
+        self.T = T
+        self.solver = pyo.SolverFactory(solver)
+        self.parametros_bess = {}
+        self.perfil_costo = None
+        self.actualizar(parametros_bess, perfil_costo, perfil_demanda_kw, perfil_pv_kw, perfil_ev_kw)
+
+    @traza.medir("pyomo_actualizar")
+    def actualizar(
+        self,
+        parametros_bess: dict = None,
+        perfil_costo: np.ndarray = None,
+        perfil_demanda_kw: np.ndarray = None,
+        perfil_pv_kw: np.ndarray = None,
+        perfil_ev_kw: np.ndarray = None
+    ):
+        """
+        Actualiza los datos del modelo; los argumentos en None no se modifican.
+
+        La energía final mínima es igual a E_INI, salvo que se entregue la clave
+        opcional "E_FIN" (p. ej. en el despacho de horizonte rodante).
+        `perfil_demanda_kw` y `perfil_ev_kw` se suman en la demanda D, por lo que al
+        cambiar cualquiera de ellos se debe entregar también el otro (None = cero).
+        """
+        m = self.model
+        if parametros_bess is not None:
+            self.parametros_bess.update(parametros_bess)
+            claves = {"ETA_C": m.eta_c, "ETA_D": m.eta_d, "P_MAX": m.P_max, "E_MAX": m.E_max,
+                      "E_MIN": m.E_min, "E_INI": m.E_ini, "C_DEG": m.c_deg}
+            for clave, valor in parametros_bess.items():
+                if clave in claves:
+                    claves[clave].set_value(valor)
+            if "E_FIN" in parametros_bess:
+                m.E_fin.set_value(parametros_bess["E_FIN"])
+            elif "E_INI" in parametros_bess and "E_FIN" not in self.parametros_bess:
+                m.E_fin.set_value(parametros_bess["E_INI"])
+        if perfil_costo is not None:
+            self.perfil_costo = np.asarray(perfil_costo, dtype=float)
+            for t in self.T:
+                m.P_buy[t] = self.perfil_costo[t]
+                m.P_sell[t] = self.perfil_costo[t]
+        if perfil_demanda_kw is not None or perfil_ev_kw is not None:
+            D = np.zeros(len(self.T))
+            for perfil in (perfil_demanda_kw, perfil_ev_kw):
+                if perfil is not None:
+                    D = D + perfil
+            for t in self.T:
+                m.D[t] = D[t]
+        if perfil_pv_kw is not None:
+            for t in self.T:
+                m.S_PV[t] = perfil_pv_kw[t]
+
+    def resolver(self):
+        """
+        Resuelve el modelo con los datos actuales.
+
+        Returns:
+            df_resultados (pd.DataFrame): Despacho horario (mismas columnas que resolver_despacho_bess).
+            p_bess_array (np.ndarray): Perfil neto del BESS (carga - descarga).
+        """
+        import pyomo.environ as pyo
+        with traza.etapa("pyomo_resolver"):
+            resultado = self.solver.solve(self.model)
+        condicion = resultado.solver.termination_condition
+        if condicion != pyo.TerminationCondition.optimal:
+            raise RuntimeError(f"El despacho BESS no encontró solución óptima: {condicion}")
+        m = self.model
+        p_c = np.array([pyo.value(m.p_c[t]) for t in self.T])
+        p_d = np.array([pyo.value(m.p_d[t]) for t in self.T])
+        df_resultados = pd.DataFrame({
+            "Periodo": self.T,
+            "e_final": [pyo.value(m.e[t + 1]) for t in self.T],
+            "p_c": p_c,
+            "p_d": p_d,
+            "g_buy": [pyo.value(m.g_buy[t]) for t in self.T],
+            "g_sell": [pyo.value(m.g_sell[t]) for t in self.T],
+            "p_solar": [pyo.value(m.p_solar[t]) for t in self.T],
+            "p_bess": p_c - p_d,
+        })
+        return df_resultados, df_resultados["p_bess"].values
+
+    def objetivo(self):
+        """Valor del objetivo en la última solución."""
+        return self.model.obj()
+
+
+def barrido_bess(despacho: DespachoBESS, puntos: list) -> pd.DataFrame:
+    """
+    Resuelve el despacho para una grilla de parámetros reutilizando el mismo modelo.
+
+    Args:
+        despacho: modelo persistente ya construido
+        puntos: lista de dicts; cada uno puede contener claves de parametros_bess
+            (E_MAX, P_MAX, C_DEG, ...) y/o "perfil_costo". Las claves que no se
+            entregan mantienen su valor del punto anterior.
+
+    Returns:
+        DataFrame ordenado (una fila por punto y periodo) con los parámetros del
+        punto, el despacho horario y el objetivo.
+    """
+    tablas = []
+    for i, punto in enumerate(puntos):
+        punto = dict(punto)
+        despacho.actualizar(parametros_bess=punto, perfil_costo=punto.pop("perfil_costo", None))
+        df, _ = despacho.resolver()
+        df.insert(0, "punto", i)
+        for j, (clave, valor) in enumerate(despacho.parametros_bess.items()):
+            df.insert(1 + j, clave, valor)
+        df["objetivo"] = despacho.objetivo()
+        tablas.append(df)
+    return pd.concat(tablas, ignore_index=True)
+
+
+def _ventana(perfil, inicio, largo):
+    """Extrae una ventana del perfil, repitiendo el último valor si se pasa del final."""
+    indices = np.minimum(np.arange(inicio, inicio + largo), len(perfil) - 1)
+    return np.asarray(perfil, dtype=float)[indices]
+
+
+def despacho_bess_rodante(
+    parametros_bess: dict,
+    perfil_costo: np.ndarray,
+    perfil_demanda_kw: np.ndarray,
+    perfil_pv_kw: np.ndarray = None,
+    perfil_ev_kw: np.ndarray = None,
+    ventana: int = 48,
+    paso: int = 24,
+    solver: str = "appsi_highs"
+):
+    """
+    Despacho BESS de horizonte rodante para perfiles largos (p. ej. un año).
+
+    Se optimiza una ventana de `ventana` horas, se fijan las primeras `paso` y el
+    SOC al final de ellas pasa a ser el E_INI de la ventana siguiente. Todas las
+    ventanas reutilizan un único modelo persistente (`DespachoBESS`): solo se
+    actualizan los datos, por lo que el tiempo crece linealmente con el horizonte
+    y la memoria queda acotada por la ventana. Al final del horizonte la ventana
+    se completa repitiendo el último valor de cada perfil.
+
+    Args:
+        parametros_bess, perfil_costo, perfil_demanda_kw, perfil_pv_kw, perfil_ev_kw:
+            igual que en `funciones.resolver_despacho_bess`, con perfiles de cualquier largo.
+            E_INI es el SOC inicial del horizonte y la energía final mínima de cada ventana.
+        ventana: horas optimizadas en cada ventana
+        paso: horas que se fijan en cada ventana (paso <= ventana)
+        solver: solver persistente de Pyomo
+
+    Yields:
+        Tupla (inicio, df_bloque, p_bess_bloque) con la hora inicial del bloque fijado,
+        su despacho (columna 'Periodo' en horas absolutas) y el perfil neto del BESS.
+    """
+    if not 0 < paso <= ventana:
+        raise ValueError("Se requiere 0 < paso <= ventana")
+    H = len(perfil_demanda_kw)
+    ceros = np.zeros(H)
+    pv = ceros if perfil_pv_kw is None else perfil_pv_kw
+    ev = ceros if perfil_ev_kw is None else perfil_ev_kw
+
+    despacho = None
+    e_ini = parametros_bess["E_INI"]
+    for inicio in range(0, H, paso):
+        datos = dict(
+            perfil_costo=_ventana(perfil_costo, inicio, ventana),
+            perfil_demanda_kw=_ventana(perfil_demanda_kw, inicio, ventana),
+            perfil_pv_kw=_ventana(pv, inicio, ventana),
+            perfil_ev_kw=_ventana(ev, inicio, ventana),
+        )
+        if despacho is None:
+            parametros = dict(parametros_bess, E_FIN=parametros_bess["E_INI"])
+            despacho = DespachoBESS(parametros, solver=solver, **datos)
+        else:
+            despacho.actualizar(parametros_bess={"E_INI": e_ini}, **datos)
+
+        df, _ = despacho.resolver()
+        n_fijas = min(paso, H - inicio)
+        df = df.iloc[:n_fijas].copy()
+        df["Periodo"] += inicio
+        e_ini = float(df["e_final"].iloc[-1])
+        yield inicio, df, df["p_bess"].values
+
+
+def perfil_neto_rodante(
+    parametros_bess: dict,
+    perfil_costo: np.ndarray,
+    perfil_demanda_kw: np.ndarray,
+    perfil_pv_kw: np.ndarray = None,
+    perfil_ev_kw: np.ndarray = None,
+    ventana: int = 48,
+    paso: int = 24
+):
+    """
+    Genera la demanda neta de la comunidad (demanda + EV - PV + BESS) bloque a bloque.
+
+    Pensado para conectarse directo con `modulo_series.procesar_serie`, de modo que
+    el despacho y el flujo de potencia de un año avanzan juntos sin guardar todo
+    el horizonte en memoria.
+    """
+    H = len(perfil_demanda_kw)
+    for inicio, _, p_bess in despacho_bess_rodante(
+        parametros_bess, perfil_costo, perfil_demanda_kw, perfil_pv_kw, perfil_ev_kw, ventana, paso
+    ):
+        fin = inicio + len(p_bess)
+        neto = np.asarray(perfil_demanda_kw[inicio:fin], dtype=float) + p_bess
+        if perfil_pv_kw is not None:
+            neto = neto - perfil_pv_kw[inicio:fin]
+        if perfil_ev_kw is not None:
+            neto = neto + perfil_ev_kw[inicio:fin]
+        yield neto
@@ -0,0 +1,248 @@
+import contextlib
+import io
+from concurrent.futures import ProcessPoolExecutor
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pandapower as pp
+import pandapower.topology as top
+from modulo_pf import COMMUNITY_BUSES, PERFIL_DEMANDA_KW, CachePF, SesionPF
+import modulo_traza as traza
+
+# Estudio N-1: una sola red plantilla con todas las líneas (incluidos los enlaces
+# normalmente abiertos) en la que cada contingencia solo cambia `in_service`.
+# Cada worker mantiene su propia plantilla, igual que la sesión global de modulo_pf.
+
+_sesion_n1 = None
+
+def obtener_sesion_contingencias():
+    """Retorna la red plantilla N-1 del proceso, creándola si no existe."""
+    global _sesion_n1
+    if _sesion_n1 is None:
+        _sesion_n1 = SesionPF(cache=CachePF(), conservar_enlaces=True)
+    return _sesion_n1
+
+
+def reconfigurar(sesion, linea_fuera):
+    """
+    Saca una línea de servicio y cierra enlaces hasta reponer el suministro.
+
+    Se cierra de a un enlace que una una barra energizada con una aislada, de modo
+    que la red sigue siendo radial.
+
+    Returns:
+        enlaces_cerrados (list): Enlaces cerrados, en orden.
+        sin_suministro (set): Barras que quedan aisladas aun con todos los enlaces posibles.
+    """
+    enlaces_cerrados = []
+    while True:
+        sesion.fijar_topologia([linea_fuera], enlaces_cerrados)
+        sin_suministro = top.unsupplied_buses(sesion.net)
+        candidato = None
+        for enlace in sesion.enlaces:
+            if enlace in enlaces_cerrados:
+                continue
+            desde, hacia = sesion.net.line.loc[enlace, ["from_bus", "to_bus"]]
+            if (desde in sin_suministro) != (hacia in sin_suministro):
+                candidato = enlace
+                break
+        if candidato is None:
+            return enlaces_cerrados, set(int(b) for b in sin_suministro)
+        enlaces_cerrados.append(candidato)
+
+
+def _comunidades_aguas_abajo(net):
+    """
+    Número de barras de COMMUNITY_BUSES aguas abajo de cada línea en servicio.
+
+    Returns:
+        pd.Series indexada por línea, o None si la red energizada no es radial.
+    """
+    grafo = top.create_nxgraph(net)
+    raiz = int(net.ext_grid.bus.iloc[0])
+    energizada = grafo.subgraph(nx.node_connected_component(grafo, raiz))
+    if energizada.number_of_edges() != energizada.number_of_nodes() - 1:
+        return None
+    arbol = nx.bfs_tree(energizada, raiz)
+    comunidades = set(COMMUNITY_BUSES)
+    conteo = {}
+    for idx, desde, hacia in net.line.loc[net.line.in_service, ["from_bus", "to_bus"]].itertuples():
+        if desde not in arbol:
+            continue
+        hijo = hacia if arbol.has_edge(desde, hacia) else desde
+        conteo[idx] = len(comunidades & (nx.descendants(arbol, hijo) | {hijo}))
+    return pd.Series(conteo, dtype=float)
+
+
+def estimar_carga_maxima(net, perfil_neto_kw):
+    """
+    Estimación lineal de la carga máxima (%) de cada línea en el perfil, sin flujo AC.
+
+    En una red radial sin cargas reactivas, la potencia por una línea es la suma de
+    las demandas netas aguas abajo; se ignoran pérdidas y caída de tensión (el
+    margen de `hosting_capacity_n1` las cubre).
+
+    Returns:
+        pd.Series con la carga estimada por línea, o None si la red no es radial.
+    """
+    aguas_abajo = _comunidades_aguas_abajo(net)
+    if aguas_abajo is None:
+        return None
+    lineas = net.line.loc[aguas_abajo.index]
+    vn_kv = net.bus.loc[lineas.from_bus, "vn_kv"].to_numpy()
+    capacidad_mva = np.sqrt(3) * vn_kv * lineas.max_i_ka.to_numpy() * lineas.parallel.to_numpy() * lineas.df.to_numpy()
+    potencia_max_mw = aguas_abajo.to_numpy() * np.max(np.abs(perfil_neto_kw)) / 1000
+    return pd.Series(100 * potencia_max_mw / capacidad_mva, index=aguas_abajo.index)
+
+
+def _evaluar_contingencia(args):
+    """
+    Evalúa en un worker una contingencia no filtrada.
+
+    Returns:
+        Tupla (linea_fuera, cargas 24 h a la capacidad de referencia, hc_kw).
+    """
+    linea_fuera, enlaces, perfil_pu, kind, perfil_base_kw, capacidad_ref_kw, limit_pct, step_kw = args
+    sesion = obtener_sesion_contingencias()
+    signo = -1 if kind == "pv" else 1
+    perfil_neto_kw = perfil_base_kw + signo * capacidad_ref_kw * perfil_pu
+
+    cargas = np.empty((len(perfil_neto_kw), len(sesion.net.line)))
+    # Sin pool la sesión es la del proceso principal: se devuelve a la red intacta al terminar
+    sesion.fijar_topologia([linea_fuera], enlaces)
+    try:
+        with traza.etapa("contingencia", linea_fuera=int(linea_fuera)):
+            for hora, demanda in enumerate(perfil_neto_kw):
+                try:
+                    cargas[hora] = sesion.loading(demanda)
+                except pp.LoadflowNotConverged:
+                    cargas[hora] = np.inf
+            from funciones import hosting_capacity
+            # El avance de la bisección de cada worker no se imprime
+            with contextlib.redirect_stdout(io.StringIO()):
+                hc_kw, _, _ = hosting_capacity(perfil_pu, kind, limit_pct, step_kw,
+                                               perfil_demanda_kw=perfil_base_kw, sesion=sesion)
+    finally:
+        sesion.fijar_topologia()
+    return linea_fuera, cargas, hc_kw
+
+
+@traza.medir()
+def hosting_capacity_n1(
+    perfil_pu: np.ndarray,
+    kind: str,
+    limit_pct: float = 100,
+    step_kw: float = 10,
+    perfil_demanda_kw: np.ndarray = None,
+    perfil_bess_kw: np.ndarray = None,
+    margen_filtro: float = 0.1,
+    workers: int = None
+) -> tuple[float, pd.DataFrame]:
+    """
+    Hosting capacity bajo contingencias N-1 de líneas.
+
+    Se calcula primero la HC con la red intacta (capacidad de referencia). Luego,
+    por cada línea que sale de servicio, se cierran los enlaces que reponen el
+    suministro y se estima linealmente la carga de cada línea. Las contingencias se
+    evalúan con flujo AC (24 horas y su propia búsqueda de HC) de a tandas de
+    `workers`, de la más a la menos severa según la estimación; tras cada tanda,
+    las pendientes cuya carga estimada a la menor HC encontrada queda bajo
+    `limit_pct * (1 - margen_filtro)` no pueden limitar y se filtran sin flujos AC.
+
+    Args:
+        perfil_pu: perfil horario en p.u. de la capacidad instalada
+        kind: "pv" (generación) o "ev" (demanda)
+        limit_pct: límite de carga de líneas (%)
+        step_kw: resolución de la búsqueda (kW)
+        perfil_demanda_kw: demanda base por hora (por defecto PERFIL_DEMANDA_KW de modulo_pf)
+        perfil_bess_kw: despacho BESS fijo por hora (puede ser None)
+        margen_filtro: holgura relativa exigida a la estimación lineal (pérdidas y caída de tensión)
+        workers: número de procesos (None o 1 = secuencial)
+
+    Returns:
+        hc_n1_kw (float): Capacidad que respeta el límite con la red intacta y en toda contingencia N-1.
+        df_contingencias (pd.DataFrame): Una fila por línea fuera de servicio, con los
+            enlaces cerrados, la carga estimada y la carga AC máxima (hora y línea) a la
+            capacidad de referencia, y su HC. En las filtradas no hay carga AC y hc_kw es
+            una cota inferior (la capacidad a la que se filtraron).
+    """
+    if kind not in ("pv", "ev"):
+        raise ValueError(f"kind debe ser 'pv' o 'ev', no '{kind}'")
+    from funciones import hosting_capacity
+    signo = -1 if kind == "pv" else 1
+    perfil_pu = np.asarray(perfil_pu, dtype=float)
+    if perfil_demanda_kw is None:
+        perfil_demanda_kw = PERFIL_DEMANDA_KW
+    perfil_base_kw = np.asarray(perfil_demanda_kw, dtype=float)
+    if perfil_bess_kw is not None:
+        perfil_base_kw = perfil_base_kw + perfil_bess_kw
+
+    def potencia_max_kw(capacidad_kw):
+        return np.max(np.abs(perfil_base_kw + signo * capacidad_kw * perfil_pu))
+
+    sesion = obtener_sesion_contingencias()
+    sesion.fijar_topologia()
+    hc_ref_kw, _, _ = hosting_capacity(perfil_pu, kind, limit_pct, step_kw,
+                                       perfil_demanda_kw=perfil_base_kw, sesion=sesion)
+
+    print(f"Iniciando análisis N-1 {kind.upper()} (capacidad de referencia {hc_ref_kw} kW)...")
+    filas, carga_por_kw = {}, {}
+    lineas = [l for l in sesion.net.line.index if l not in sesion.enlaces]
+    with traza.etapa("reconfigurar_contingencias"):
+        for linea in lineas:
+            enlaces, sin_suministro = reconfigurar(sesion, linea)
+            # La estimación es lineal en la potencia: se guarda la carga por kW de demanda neta
+            estimada = estimar_carga_maxima(sesion.net, [1.0])
+            carga_por_kw[linea] = estimada.max() if estimada is not None else np.inf
+            filas[linea] = {
+                "enlaces_cerrados": enlaces,
+                "barras_sin_suministro": len(sin_suministro),
+                "carga_estimada": carga_por_kw[linea] * potencia_max_kw(hc_ref_kw),
+                "filtrada": False,
+                "carga_max": np.nan,
+                "hora_max": None,
+                "linea_max": None,
+                "hc_kw": np.nan,
+            }
+    sesion.fijar_topologia()
+
+    pendientes = sorted(lineas, key=lambda l: -carga_por_kw[l])
+    hc_n1_kw = hc_ref_kw
+    tanda = workers if workers is not None and workers > 1 else 1
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=obtener_sesion_contingencias) if tanda > 1 else None
+    try:
+        while pendientes:
+            # Filtrar las que no pueden bajar la HC por debajo de la menor encontrada
+            umbral_kw = potencia_max_kw(hc_n1_kw)
+            for linea in [l for l in pendientes if carga_por_kw[l] * umbral_kw <= limit_pct * (1 - margen_filtro)]:
+                filas[linea].update(filtrada=True, hc_kw=hc_n1_kw)
+                pendientes.remove(linea)
+
+            tareas = [
+                (linea, filas[linea]["enlaces_cerrados"], perfil_pu, kind, perfil_base_kw, hc_ref_kw, limit_pct, step_kw)
+                for linea in pendientes[:tanda]
+            ]
+            pendientes = pendientes[tanda:]
+            resultados = pool.map(_evaluar_contingencia, tareas) if pool is not None \
+                else map(_evaluar_contingencia, tareas)
+            for linea, cargas, hc_kw in resultados:
+                hora, idx = np.unravel_index(np.argmax(cargas), cargas.shape)
+                filas[linea].update(carga_max=float(cargas[hora, idx]), hora_max=int(hora),
+                                    linea_max=int(sesion.net.line.index[idx]), hc_kw=hc_kw)
+                hc_n1_kw = min(hc_n1_kw, hc_kw)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    df_contingencias = pd.DataFrame.from_dict(filas, orient="index")
+    df_contingencias.index.name = "linea_fuera"
+    df_contingencias[["hora_max", "linea_max"]] = df_contingencias[["hora_max", "linea_max"]].astype("Int64")
+    n_filtradas = int(df_contingencias["filtrada"].sum())
+    print(f"{n_filtradas} de {len(lineas)} contingencias filtradas sin flujo AC.")
+    if hc_n1_kw < hc_ref_kw:
+        limitante = df_contingencias.loc[~df_contingencias["filtrada"], "hc_kw"].idxmin()
+        print(f"Hosting capacity N-1 {kind.upper()}: {hc_n1_kw} kW "
+              f"(red intacta {hc_ref_kw} kW; contingencia más restrictiva: línea {limitante} fuera)")
+    else:
+        print(f"Hosting capacity N-1 {kind.upper()}: {hc_n1_kw} kW (ninguna contingencia limita)")
+    return float(hc_n1_kw), df_contingencias
@@ -0,0 +1,87 @@
+import numpy as np
+from modulo_pf import obtener_sesion
+from modulo_nr import obtener_flujo_lote
+
+class CurvaRespuesta:
+    """
+    Curva de respuesta demanda neta -> carga de cada línea.
+
+    Como todas las barras de COMMUNITY_BUSES reciben la misma demanda neta, la
+    carga de cada línea depende de una sola variable. La curva se muestrea una vez
+    con flujos AC (Newton-Raphson en lote) sobre una grilla de demandas, negativas
+    para flujo inverso y positivas para consumo, y luego cada consulta se responde
+    por interpolación lineal vectorizada.
+    """
+
+    def __init__(self, demanda_min_kw=-2000.0, demanda_max_kw=1000.0, paso_kw=5.0, flujo=None):
+        flujo = flujo if flujo is not None else obtener_flujo_lote()
+        n = int(np.ceil((demanda_max_kw - demanda_min_kw) / paso_kw)) + 1
+        self.grilla = demanda_min_kw + paso_kw * np.arange(n)
+        self.paso_kw = paso_kw
+        cargas, convergido = flujo.loading(self.grilla)
+        if not convergido.all():
+            demanda = self.grilla[np.flatnonzero(~convergido)[0]]
+            raise ValueError(f"El flujo no convergió al muestrear la curva en {demanda} kW")
+        self.tabla = cargas  # grilla x líneas
+        self.line_index = flujo.line_index
+        self.etiquetas = flujo.etiquetas
+
+    def cubre(self, perfil_neto_kw):
+        """Indica si todas las demandas del perfil están dentro de la grilla."""
+        perfil_neto_kw = np.asarray(perfil_neto_kw, dtype=float)
+        return perfil_neto_kw.min() >= self.grilla[0] and perfil_neto_kw.max() <= self.grilla[-1]
+
+    def interpolar(self, perfil_neto_kw):
+        """Retorna la matriz K x líneas interpolada para el perfil."""
+        perfil_neto_kw = np.asarray(perfil_neto_kw, dtype=float)
+        if not self.cubre(perfil_neto_kw):
+            raise ValueError(
+                f"Perfil fuera de la grilla [{self.grilla[0]}, {self.grilla[-1]}] kW de la curva de respuesta"
+            )
+        posicion = (perfil_neto_kw - self.grilla[0]) / self.paso_kw
+        i = np.minimum(posicion.astype(np.int64), len(self.grilla) - 2)
+        w = (posicion - i)[:, None]
+        return self.tabla[i] * (1 - w) + self.tabla[i + 1] * w
+
+    def loading(self, perfil_neto_kw, limite_pct=None, margen_pct=2.0, sesion=None):
+        """
+        Calcula la carga por interpolación, con verificación AC opcional.
+
+        Args:
+            perfil_neto_kw: demanda neta por instante (kW por comunidad)
+            limite_pct: si se entrega, los instantes cuya carga máxima interpolada
+                queda a menos de `margen_pct` del límite se recalculan con pandapower.
+            margen_pct: ancho de la banda de verificación (%)
+            sesion: SesionPF para la verificación (por defecto la sesión global)
+
+        Returns:
+            cargas (np.ndarray): Matriz K x líneas.
+            verificados (np.ndarray): Índices de los instantes recalculados con AC.
+        """
+        cargas = self.interpolar(perfil_neto_kw)
+        if limite_pct is None:
+            return cargas, np.array([], dtype=np.int64)
+
+        verificados = np.flatnonzero(np.abs(cargas.max(axis=1) - limite_pct) <= margen_pct)
+        if len(verificados):
+            sesion = sesion if sesion is not None else obtener_sesion()
+            for k in verificados:
+                cargas[k] = sesion.loading(perfil_neto_kw[k])
+        return cargas, verificados
+
+
+_curva_global = None
+
+def obtener_curva(perfil_neto_kw=None):
+    """
+    Retorna la curva de respuesta del proceso, ampliando la grilla si el perfil no cabe.
+    """
+    global _curva_global
+    if _curva_global is None or (perfil_neto_kw is not None and not _curva_global.cubre(perfil_neto_kw)):
+        demanda_min_kw, demanda_max_kw = -2000.0, 1000.0
+        if perfil_neto_kw is not None:
+            # Se amplía con holgura para no volver a muestrear en consultas similares
+            demanda_min_kw = min(demanda_min_kw, 1.5 * float(np.min(perfil_neto_kw)))
+            demanda_max_kw = max(demanda_max_kw, 1.5 * float(np.max(perfil_neto_kw)))
+        _curva_global = CurvaRespuesta(demanda_min_kw, demanda_max_kw)
+    return _curva_global
@@ -0,0 +1,339 @@
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from modulo_pipeline import huella
+
+# Dibujo de figuras sin interfaz gráfica y en lote. Las figuras se arman con
+# matplotlib.figure.Figure y el canvas Agg, sin pasar por pyplot, así que no
+# dependen del backend configurado ni de su estado global. Cada proceso guarda
+# una plantilla por tipo de figura (ejes, leyendas, artistas) y entre figuras
+# solo cambia los datos de los artistas. La huella de los datos queda como texto
+# en el PNG, y una figura cuyo archivo ya tiene la misma huella no se redibuja.
+
+# Subir al cambiar el estilo de las figuras, para que no se omitan por huella
+VERSION = 1
+DPI = 150
+_CLAVE_PNG = "Huella"
+_plantillas = {}
+
+_PERFILES = [
+    # (argumento, etiqueta, color, grosor, zorder)
+    ("perfil_demanda_kw", "Dem. base", "black", 2.0, 1),
+    ("perfil_pv_kw", "Gen. PV", "firebrick", 1.8, 2),
+    ("perfil_ev_kw", "Dem. EV", "cornflowerblue", 1.8, 2),
+    ("perfil_bess_kw", "BESS", "forestgreen", 1.8, 2),
+    ("perfil_neto_kw", "Dem. neta", "darkviolet", 2.0, 3),
+]
+
+
+def _figura(figsize, **kwargs):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.subplots(**kwargs)
+
+
+def _fijar_datos(linea, valores):
+    """Actualiza una curva horaria; con valores None la oculta."""
+    linea.set_visible(valores is not None)
+    if valores is None:
+        linea.set_data([], [])
+    else:
+        linea.set_data(np.arange(len(valores)), valores)
+
+
+class _PlantillaCargaLineas:
+    """Figura de `graficar_carga_por_linea` con los artistas listos para cambiar datos."""
+
+    def __init__(self, line_index, mostrar_superior):
+        from matplotlib.collections import LineCollection
+        from matplotlib.lines import Line2D
+        import matplotlib as mpl
+
+        self.ajustada = False
+        if mostrar_superior:
+            self.fig, (self.ax1, self.ax2) = _figura(
+                (12, 10), nrows=2, ncols=1, sharex=True, gridspec_kw={'height_ratios': [1, 2]}
+            )
+            self.perfiles = {}
+            for argumento, etiqueta, color, grosor, zorder in _PERFILES:
+                self.perfiles[argumento], = self.ax1.plot(
+                    [], [], color=color, linestyle='-', linewidth=grosor, label=etiqueta, zorder=zorder
+                )
+            self.ax1.set_ylabel("Potencia [kW]")
+            self.ax1.set_title("Perfiles horarios de comunidad")
+            self.ax1.grid(True, linestyle="--", alpha=0.5)
+            self.visibles = None
+        else:
+            self.fig, self.ax2 = _figura((12, 6), nrows=1, ncols=1)
+            self.ax1 = None
+
+        # Todas las líneas en un solo artista, con los colores del ciclo por defecto
+        colores = mpl.rcParams["axes.prop_cycle"].by_key()["color"]
+        self.colores = [colores[i % len(colores)] for i in range(len(line_index))]
+        self.lineas = LineCollection([], colors=self.colores, linewidths=mpl.rcParams["lines.linewidth"])
+        self.ax2.add_collection(self.lineas)
+        proxies = [Line2D([], [], color=c) for c in self.colores]
+        self.ax2.legend(proxies, [f"Línea {i}" for i in line_index], bbox_to_anchor=(1, 1), loc='upper left')
+        self.ax2.set_xlim(0, 23)
+        self.ax2.set_xticks(range(24))
+        self.ax2.set_xlabel("Hora del día")
+        self.ax2.set_ylabel("Carga (%)")
+        self.ax2.set_title("Carga de líneas por hora")
+        self.ax2.grid(True, linestyle="--", alpha=0.5)
+
+    def actualizar(self, cargas, perfiles):
+        """cargas: matriz líneas x horas; perfiles: dict argumento -> array o None."""
+        horas = np.arange(cargas.shape[1])
+        self.lineas.set_segments(np.stack([np.broadcast_to(horas, cargas.shape), cargas], axis=-1))
+        self.ax2.set_ylim(0, 1.1 * cargas.max())
+
+        if self.ax1 is not None:
+            visibles = tuple(perfiles.get(a) is not None for a, *_ in _PERFILES)
+            for argumento, *_ in _PERFILES:
+                _fijar_datos(self.perfiles[argumento], perfiles.get(argumento))
+            if visibles != self.visibles:
+                # La leyenda solo se rehace si cambia el conjunto de perfiles
+                activos = [self.perfiles[a] for (a, *_), v in zip(_PERFILES, visibles) if v]
+                self.ax1.legend(activos, [l.get_label() for l in activos], bbox_to_anchor=(1, 1), loc='upper left')
+                self.visibles = visibles
+            self.ax1.relim(visible_only=True)
+            self.ax1.autoscale_view(scalex=False)
+
+        if not self.ajustada:
+            # El ajuste de márgenes es caro: se calcula con la primera figura de la plantilla
+            self.fig.tight_layout()
+            self.ajustada = True
+
+
+class _PlantillaPerfiles:
+    """Figura de `graficar_perfiles_horarios` con los artistas listos para cambiar datos."""
+
+    def __init__(self, con_costo):
+        self.ajustada = False
+        self.fig, (self.ax1, self.ax2) = _figura(
+            (12, 9), nrows=2, ncols=1, sharex=True, gridspec_kw={'height_ratios': [1, 2]}
+        )
+        # Superior: BESS y costo horario
+        self.bess_sup, = self.ax1.plot([], [], color='forestgreen', linestyle='-', linewidth=2, label="BESS",
+                                       zorder=2)
+        self.ax1.set_ylabel("BESS [kW]")
+        self.ax1.grid(True, linestyle="--", alpha=0.5)
+        self.ax1.set_title("Perfil de operación BESS y costo horario")
+        self.costo = None
+        if con_costo:
+            self.ax1b = self.ax1.twinx()
+            self.costo, = self.ax1b.plot([], [], color='goldenrod', linestyle='--', linewidth=2, label="Costo",
+                                         zorder=0)
+            self.ax1b.set_ylabel("Costo horario [$ / kWh]")
+
+        # Inferior: perfiles de potencia (PV con signo negativo)
+        self.perfiles = {}
+        for argumento, etiqueta, color, grosor, zorder in _PERFILES:
+            self.perfiles[argumento], = self.ax2.plot(
+                [], [], color=color, linestyle='-', linewidth=grosor, label=etiqueta, zorder=zorder
+            )
+        self.ax2.set_xlabel("Hora del día")
+        self.ax2.set_ylabel("Potencia [kW]")
+        self.ax2.set_xlim(0, 23)
+        self.ax2.set_xticks(range(24))
+        self.ax2.grid(True, linestyle="--", alpha=0.5)
+        self.ax2.set_title("Perfiles horarios de potencia en comunidad")
+        self.visibles = None
+
+    def actualizar(self, perfiles, perfil_costo):
+        bess = perfiles.get("perfil_bess_kw")
+        visibles = tuple(perfiles.get(a) is not None for a, *_ in _PERFILES)
+        _fijar_datos(self.bess_sup, bess)
+        if self.costo is not None:
+            _fijar_datos(self.costo, perfil_costo)
+            self.ax1b.relim()
+            self.ax1b.autoscale_view(scalex=False)
+        for argumento, *_ in _PERFILES:
+            valores = perfiles.get(argumento)
+            if valores is not None and argumento == "perfil_pv_kw":
+                valores = -1 * valores
+            _fijar_datos(self.perfiles[argumento], valores)
+        for ax in (self.ax1, self.ax2):
+            ax.relim(visible_only=True)
+            ax.autoscale_view(scalex=False)
+
+        if visibles != self.visibles:
+            if self.costo is not None:
+                sup = [self.bess_sup] if bess is not None else []
+                self.ax1.legend(sup + [self.costo], [l.get_label() for l in sup + [self.costo]], loc='lower right')
+            else:
+                self.ax1.legend([self.bess_sup] if bess is not None else [],
+                                ["BESS"] if bess is not None else [], loc='upper left')
+            activos = [self.perfiles[a] for (a, *_), v in zip(_PERFILES, visibles) if v]
+            self.ax2.legend(activos, [l.get_label() for l in activos], loc='lower right')
+            self.visibles = visibles
+
+        if not self.ajustada:
+            self.fig.tight_layout()
+            self.ajustada = True
+
+
+def _normalizar(tipo, datos):
+    """Convierte los datos de una figura a arrays (y CargaPorHora/DataFrame a matriz líneas x horas)."""
+    datos = dict(datos)
+    if tipo == "carga_por_linea":
+        carga = datos.pop("df_loading_por_hora")
+        if isinstance(carga, pd.DataFrame):
+            datos["cargas"], datos["line_index"] = carga.to_numpy(dtype=float), list(carga.index)
+        else:
+            datos["cargas"], datos["line_index"] = np.asarray(carga.cargas, dtype=float).T, list(carga.line_index)
+    elif tipo != "perfiles_horarios":
+        raise ValueError(f"tipo de figura debe ser 'carga_por_linea' o 'perfiles_horarios', no '{tipo}'")
+    # Los perfiles omitidos y los entregados como None tienen la misma huella
+    for argumento, *_ in _PERFILES:
+        datos.setdefault(argumento, None)
+    if tipo == "perfiles_horarios":
+        datos.setdefault("perfil_costo", None)
+    for clave, valor in datos.items():
+        if clave.startswith("perfil_") and valor is not None:
+            datos[clave] = np.asarray(valor, dtype=float)
+    return datos
+
+
+def huella_figura(tipo, datos):
+    """Huella de los datos de una figura (sin el nombre de archivo)."""
+    sin_archivo = {k: v for k, v in datos.items() if k != "nombre_archivo"}
+    return huella([VERSION, DPI, tipo, sin_archivo]).hexdigest()[:32]
+
+
+def huella_png(ruta):
+    """Huella guardada en un PNG de este módulo, leyendo solo los bloques previos a la imagen (o None)."""
+    try:
+        with open(ruta, "rb") as archivo:
+            if archivo.read(8) != b"\x89PNG\r\n\x1a\n":
+                return None
+            while True:
+                cabecera = archivo.read(8)
+                if len(cabecera) < 8:
+                    return None
+                largo, bloque = struct.unpack(">I4s", cabecera)
+                if bloque in (b"IDAT", b"IEND"):
+                    return None
+                contenido = archivo.read(largo)
+                archivo.seek(4, os.SEEK_CUR)  # CRC
+                if bloque == b"tEXt":
+                    clave, _, valor = contenido.partition(b"\x00")
+                    if clave.decode("latin-1") == _CLAVE_PNG:
+                        return valor.decode("latin-1")
+    except FileNotFoundError:
+        return None
+
+
+def _dibujar(tipo, datos, huella_datos=None):
+    """Dibuja una figura con la plantilla del proceso y la guarda como PNG."""
+    if tipo == "carga_por_linea":
+        cargas, line_index = datos["cargas"], datos["line_index"]
+        perfiles = {a: datos.get(a) for a, *_ in _PERFILES}
+        mostrar_superior = any(v is not None for v in perfiles.values())
+        clave = (tipo, tuple(line_index), mostrar_superior)
+        if clave not in _plantillas:
+            _plantillas[clave] = _PlantillaCargaLineas(line_index, mostrar_superior)
+        plantilla = _plantillas[clave]
+        plantilla.actualizar(cargas, perfiles)
+    else:
+        perfiles = {a: datos.get(a) for a, *_ in _PERFILES}
+        costo = datos.get("perfil_costo")
+        clave = (tipo, costo is not None)
+        if clave not in _plantillas:
+            _plantillas[clave] = _PlantillaPerfiles(costo is not None)
+        plantilla = _plantillas[clave]
+        plantilla.actualizar(perfiles, costo)
+
+    nombre_archivo = datos.get("nombre_archivo")
+    if nombre_archivo is None:
+        return None
+    ruta = f"{nombre_archivo}.png"
+    metadata = {_CLAVE_PNG: huella_datos} if huella_datos is not None else None
+    plantilla.fig.savefig(ruta, dpi=DPI, metadata=metadata)
+    return ruta
+
+
+def dibujar(tipo, omitir_sin_cambios=False, **datos):
+    """
+    Dibuja una figura ("carga_por_linea" o "perfiles_horarios") en este proceso.
+
+    Args:
+        tipo: tipo de figura
+        omitir_sin_cambios: no redibujar si el PNG ya tiene la huella de estos datos
+        **datos: argumentos de `funciones.graficar_carga_por_linea` o
+            `funciones.graficar_perfiles_horarios`, incluido nombre_archivo
+
+    Returns:
+        True si se dibujó, False si se omitió por no tener cambios.
+    """
+    datos = _normalizar(tipo, datos)
+    h = huella_figura(tipo, datos)
+    if omitir_sin_cambios and datos.get("nombre_archivo") is not None \
+            and huella_png(f"{datos['nombre_archivo']}.png") == h:
+        return False
+    _dibujar(tipo, datos, h)
+    return True
+
+
+def _dibujar_bloque(bloque):
+    filas = []
+    for tipo, datos, h in bloque:
+        t0 = time.perf_counter()
+        _dibujar(tipo, datos, h)
+        filas.append(time.perf_counter() - t0)
+    return filas
+
+
+def graficar_lote(figuras, workers=None, omitir_sin_cambios=True) -> pd.DataFrame:
+    """
+    Dibuja muchas figuras, opcionalmente repartidas en un pool de procesos.
+
+    Las figuras cuyo PNG ya tiene la huella de sus datos se omiten sin abrir
+    matplotlib. Las demás se reparten en bloques contiguos, para que cada worker
+    reutilice sus plantillas entre figuras del mismo tipo.
+
+    Args:
+        figuras: lista de tuplas (tipo, dict de datos) con nombre_archivo en los datos
+        workers: número de procesos (None o 1 = en este proceso)
+        omitir_sin_cambios: omitir figuras cuya huella no cambió
+
+    Returns:
+        DataFrame con una fila por figura: archivo, tipo, estado ("dibujada" u
+        "omitida") y segundos de dibujo.
+    """
+    filas, pendientes = [], []
+    for tipo, datos in figuras:
+        datos = _normalizar(tipo, datos)
+        if datos.get("nombre_archivo") is None:
+            raise ValueError("Cada figura del lote necesita nombre_archivo")
+        h = huella_figura(tipo, datos)
+        ruta = f"{datos['nombre_archivo']}.png"
+        omitida = omitir_sin_cambios and huella_png(ruta) == h
+        filas.append({"archivo": ruta, "tipo": tipo, "estado": "omitida" if omitida else "dibujada",
+                      "segundos": 0.0})
+        if not omitida:
+            pendientes.append((len(filas) - 1, (tipo, datos, h)))
+
+    n_bloques = max(min(workers, len(pendientes)), 1) if workers is not None and workers > 1 else 1
+    # Bloques contiguos ordenados por tipo: cada proceso arma pocas plantillas
+    pendientes.sort(key=lambda p: p[1][0])
+    bloques = [b for b in np.array_split(np.arange(len(pendientes)), n_bloques) if len(b)]
+    tareas = [[pendientes[i][1] for i in b] for b in bloques]
+    if n_bloques > 1:
+        with ProcessPoolExecutor(max_workers=n_bloques) as pool:
+            tiempos = list(pool.map(_dibujar_bloque, tareas))
+    else:
+        tiempos = [_dibujar_bloque(t) for t in tareas]
+    for b, segundos in zip(bloques, tiempos):
+        for i, s in zip(b, segundos):
+            filas[pendientes[i][0]]["segundos"] = s
+
+    df = pd.DataFrame(filas)
+    print(f"Figuras: {int((df['estado'] == 'dibujada').sum())} dibujadas, "
+          f"{int((df['estado'] == 'omitida').sum())} sin cambios.")
+    return df
@@ -0,0 +1,192 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from modulo_pf import COMMUNITY_BUSES, PERFIL_DEMANDA_KW
+from modulo_nr import obtener_flujo_lote
+
+def muestrear_escenarios(rng, n_muestras, perfil_pu, p_adopcion=0.6, sigma_perfil=0.1):
+    """
+    Sortea ubicación, tamaño relativo y perfil de los DER de cada muestra.
+
+    Args:
+        rng: np.random.Generator
+        n_muestras: número de muestras
+        perfil_pu: perfil horario de referencia en p.u.
+        p_adopcion: probabilidad de que cada barra de COMMUNITY_BUSES tenga DER
+        sigma_perfil: desviación relativa del ruido multiplicativo sobre el perfil
+
+    Returns:
+        participacion (np.ndarray): Fracción de la capacidad total en cada barra (muestras x comunidades).
+        perfiles (np.ndarray): Perfiles en p.u. perturbados (muestras x horas).
+    """
+    n_com = len(COMMUNITY_BUSES)
+    con_der = rng.random((n_muestras, n_com)) < p_adopcion
+    # Al menos una barra con DER por muestra
+    sin_der = ~con_der.any(axis=1)
+    con_der[sin_der, rng.integers(0, n_com, sin_der.sum())] = True
+
+    pesos = rng.dirichlet(np.ones(n_com), n_muestras) * con_der
+    participacion = pesos / pesos.sum(axis=1, keepdims=True)
+
+    perfil_pu = np.asarray(perfil_pu, dtype=float)
+    ruido = 1 + sigma_perfil * rng.standard_normal((n_muestras, len(perfil_pu)))
+    perfiles = np.clip(perfil_pu[None, :] * ruido, 0, None)
+    return participacion, perfiles
+
+
+def _hc_lote(participacion, perfiles, signo, perfil_demanda_kw, limit_pct, step_kw, kw_max):
+    """
+    Biseca en paralelo (vectorizado) la capacidad de todas las muestras de un lote.
+
+    La capacidad se expresa como kW medios por comunidad: con participación uniforme
+    coincide con `funciones.hosting_capacity`.
+    """
+    flujo = obtener_flujo_lote()
+    n_muestras, n_horas = perfiles.shape
+    n_com = participacion.shape[1]
+    demanda_base = np.asarray(perfil_demanda_kw, dtype=float)
+
+    def factible(capacidad_kw, muestras):
+        # Demanda neta por muestra, hora y barra: (muestras*horas) x comunidades
+        inyeccion = (capacidad_kw[:, None, None] * n_com * participacion[muestras, None, :]
+                     * perfiles[muestras, :, None])
+        demanda = demanda_base[None, :, None] + signo * inyeccion
+        cargas, convergido = flujo.loading(None, Sbus=flujo.sbus_nodal(demanda.reshape(-1, n_com)))
+        cargas = np.where(convergido[:, None], cargas, np.inf).reshape(len(muestras), n_horas, -1)
+        return cargas.max(axis=(1, 2)) <= limit_pct
+
+    bajo = np.zeros(n_muestras)
+    alto = np.full(n_muestras, float(kw_max))
+    censurada = factible(alto, np.arange(n_muestras))
+    bajo[censurada] = alto[censurada]
+    activas = np.flatnonzero(alto - bajo > step_kw)
+    while len(activas):
+        # Punto medio en múltiplos de step_kw, estrictamente entre bajo y alto
+        medio = np.floor((bajo[activas] + alto[activas]) / 2 / step_kw) * step_kw
+        medio = np.maximum(medio, bajo[activas] + step_kw)
+        ok = factible(medio, activas)
+        bajo[activas[ok]] = medio[ok]
+        alto[activas[~ok]] = medio[~ok]
+        activas = np.flatnonzero(alto - bajo > step_kw)
+    return bajo, censurada
+
+
+def _evaluar_lote(args):
+    semilla, n_muestras, perfil_pu, signo, perfil_demanda_kw, p_adopcion, sigma_perfil, limit_pct, step_kw, kw_max = args
+    rng = np.random.default_rng(semilla)
+    participacion, perfiles = muestrear_escenarios(rng, n_muestras, perfil_pu, p_adopcion, sigma_perfil)
+    hc_kw, censurada = _hc_lote(participacion, perfiles, signo, perfil_demanda_kw, limit_pct, step_kw, kw_max)
+    return pd.DataFrame({
+        "hc_kw": hc_kw,
+        "censurada": censurada,
+        "n_barras_der": (participacion > 0).sum(axis=1),
+        "participacion_max": participacion.max(axis=1),
+    })
+
+
+def _intervalo_percentil(valores_ordenados, q, z=1.96):
+    """Intervalo de confianza del percentil q por estadísticos de orden (aprox. binomial)."""
+    n = len(valores_ordenados)
+    centro = n * q
+    desvio = z * np.sqrt(n * q * (1 - q))
+    i_bajo = int(np.clip(np.floor(centro - desvio), 0, n - 1))
+    i_alto = int(np.clip(np.ceil(centro + desvio), 0, n - 1))
+    return valores_ordenados[i_bajo], valores_ordenados[i_alto]
+
+
+def hosting_capacity_montecarlo(
+    perfil_pu: np.ndarray,
+    kind: str,
+    n_max: int = 5000,
+    tamano_lote: int = 250,
+    percentiles: tuple = (5, 50, 95),
+    tolerancia_kw: float = 20,
+    p_adopcion: float = 0.6,
+    sigma_perfil: float = 0.1,
+    limit_pct: float = 100,
+    step_kw: float = 10,
+    perfil_demanda_kw: np.ndarray = None,
+    kw_max: float = 5000,
+    semilla: int = 0,
+    workers: int = None
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Hosting capacity estocástico con ubicación y tamaño heterogéneo de los DER.
+
+    Cada muestra sortea qué barras de COMMUNITY_BUSES tienen PV/EV, cómo se reparte
+    la capacidad entre ellas y una perturbación del perfil horario, y se busca por
+    bisección vectorizada la capacidad máxima que respeta el límite de carga. Las
+    muestras se evalúan por lotes (en paralelo si workers > 1) hasta que el
+    intervalo de confianza de todos los percentiles es menor que `tolerancia_kw`
+    o se alcanzan `n_max` muestras. Los resultados dependen solo de `semilla`,
+    no del número de workers.
+
+    Args:
+        perfil_pu: perfil horario de referencia en p.u.
+        kind: "pv" (generación) o "ev" (demanda)
+        n_max: número máximo de muestras
+        tamano_lote: muestras por lote
+        percentiles: percentiles a reportar (%)
+        tolerancia_kw: semi-ancho máximo del intervalo de confianza para detenerse
+        p_adopcion: probabilidad de que una barra tenga DER
+        sigma_perfil: desviación relativa del ruido sobre el perfil
+        limit_pct: límite de carga de líneas (%)
+        step_kw: resolución de la bisección (kW)
+        perfil_demanda_kw: demanda base por hora, igual en cada comunidad (por defecto PERFIL_DEMANDA_KW)
+        kw_max: capacidad máxima explorada (las muestras factibles ahí quedan censuradas)
+        semilla: semilla del generador aleatorio
+        workers: número de procesos (None o 1 = secuencial)
+
+    Returns:
+        df_resumen (pd.DataFrame): Percentiles de HC (kW medios por comunidad) con su intervalo de confianza.
+        df_muestras (pd.DataFrame): Resultado de cada muestra.
+    """
+    if kind not in ("pv", "ev"):
+        raise ValueError(f"kind debe ser 'pv' o 'ev', no '{kind}'")
+    signo = -1 if kind == "pv" else 1
+    if perfil_demanda_kw is None:
+        perfil_demanda_kw = PERFIL_DEMANDA_KW
+    n_lotes = int(np.ceil(n_max / tamano_lote))
+    semillas = np.random.SeedSequence(semilla).spawn(n_lotes)
+    tareas = [
+        (semillas[i], min(tamano_lote, n_max - i * tamano_lote), perfil_pu, signo, perfil_demanda_kw,
+         p_adopcion, sigma_perfil, limit_pct, step_kw, kw_max)
+        for i in range(n_lotes)
+    ]
+
+    print(f"Iniciando Monte Carlo de hosting capacity {kind.upper()}...")
+    pool = ProcessPoolExecutor(max_workers=workers) if workers is not None and workers > 1 else None
+    lotes = []
+    try:
+        paso = workers if pool is not None else 1
+        for inicio in range(0, n_lotes, paso):
+            grupo = tareas[inicio:inicio + paso]
+            lotes.extend(pool.map(_evaluar_lote, grupo) if pool is not None else map(_evaluar_lote, grupo))
+
+            # Regla de detención, revisada lote a lote para no depender de workers
+            detener = False
+            for n_usados in range(inicio + 1, len(lotes) + 1):
+                hc = np.sort(pd.concat(lotes[:n_usados])["hc_kw"].to_numpy())
+                anchos = [np.diff(_intervalo_percentil(hc, p / 100))[0] / 2 for p in percentiles]
+                if max(anchos) <= tolerancia_kw:
+                    lotes = lotes[:n_usados]
+                    detener = True
+                    break
+            if detener:
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    df_muestras = pd.concat(lotes, ignore_index=True)
+    hc = np.sort(df_muestras["hc_kw"].to_numpy())
+    filas = []
+    for p in percentiles:
+        ic_bajo, ic_alto = _intervalo_percentil(hc, p / 100)
+        filas.append({"percentil": p, "hc_kw": np.percentile(hc, p), "ic_bajo_kw": ic_bajo, "ic_alto_kw": ic_alto})
+    df_resumen = pd.DataFrame(filas).set_index("percentil")
+
+    print(f"Monte Carlo completado con {len(df_muestras)} muestras "
+          f"({df_muestras['censurada'].sum()} censuradas en {kw_max} kW).")
+    print(df_resumen.round(1).to_string())
+    return df_resumen, df_muestras
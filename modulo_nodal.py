@@ -0,0 +1,214 @@
+import numpy as np
+import pandas as pd
+from scipy.linalg import lu_factor, lu_solve
+from modulo_pf import COMMUNITY_BUSES, PERFIL_DEMANDA_KW
+from modulo_nr import obtener_flujo_lote
+import modulo_traza as traza
+
+def _inyeccion_kw(flujo):
+    """Inyección compleja en p.u. por kW de demanda en una barra (igual en todas)."""
+    barra = flujo.sesion.net._pd2ppc_lookups["bus"][COMMUNITY_BUSES[0]]
+    return flujo.dS_kw[barra]
+
+
+def _sensibilidades(flujo, barras_ppc):
+    """
+    Variación compleja de la corriente de cada línea por kW de demanda en cada barra.
+
+    El Jacobiano se factoriza una sola vez en el punto base del solver en lote y se
+    resuelve con todas las barras como columnas del lado derecho.
+
+    Returns:
+        Tupla (desde, hasta) de matrices líneas x barras, en % de carga por kW.
+    """
+    J = flujo.jacobiano(flujo.V0[None])[0]
+    factorizacion = lu_factor(J)
+    pq = flujo.pq
+    n_pq = len(pq)
+
+    # Una columna por barra: inyección de -1 kW (1 kW de demanda), solo potencia activa
+    dS = np.zeros((len(flujo.V0), len(barras_ppc)), dtype=complex)
+    dS[barras_ppc, np.arange(len(barras_ppc))] = _inyeccion_kw(flujo)
+    dx = lu_solve(factorizacion, np.concatenate([dS[pq].real, dS[pq].imag]))
+
+    dV = np.zeros_like(dS)
+    V0 = flujo.V0[pq, None]
+    dV[pq] = V0 * (1j * dx[:n_pq] + dx[n_pq:] / np.abs(V0))
+    desde = (flujo.Yf[flujo.ramas_linea] @ dV) * flujo.escala_desde[:, None]
+    hasta = (flujo.Yt[flujo.ramas_linea] @ dV) * flujo.escala_hasta[:, None]
+    return desde, hasta
+
+
+def _estimar_hc(I0, dI, perfil_pu, signo, limit_pct, kw_max):
+    """
+    Capacidad por barra a la que alguna línea llega al límite según el modelo lineal.
+
+    La corriente (compleja) se extrapola como I0 + signo * C * p_h * dI y se resuelve
+    |I| = límite en forma cerrada, de modo que también se capturan flujos que se invierten.
+
+    Args:
+        I0: corrientes base por hora y línea (horas x líneas, en % de carga)
+        dI: sensibilidad por línea y barra (líneas x barras)
+
+    Returns:
+        Array con la capacidad estimada por barra (kw_max si ninguna línea limita).
+    """
+    a = signo * dI[None, :, :]                       # horas x líneas x barras
+    b = I0[:, :, None]
+    A = np.abs(a) ** 2
+    B = np.real(np.conj(b) * a)
+    C = np.abs(b) ** 2 - limit_pct ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        u = np.where(A > 0, (-B + np.sqrt(np.maximum(B ** 2 - A * C, 0))) / A, np.inf)
+        u = np.where(C >= 0, 0.0, u)                 # la hora ya viola el límite sin DER
+        capacidad = u / perfil_pu[:, None, None]
+    capacidad[perfil_pu <= 0] = np.inf
+    return np.minimum(capacidad.min(axis=(0, 1)), kw_max)
+
+
+@traza.medir()
+def hosting_capacity_nodal(
+    perfil_pu: np.ndarray,
+    kind: str,
+    limit_pct: float = 100,
+    step_kw: float = 10,
+    perfil_demanda_kw: np.ndarray = None,
+    barras=None,
+    perfil_bess_kw: np.ndarray = None,
+    kw_max: float = 10000
+) -> pd.DataFrame:
+    """
+    Mapa nodal de hosting capacity: PV o EV instalado en una sola barra a la vez.
+
+    Cada comunidad mantiene su demanda base y la capacidad se agrega solo en la barra
+    estudiada. Con un único Jacobiano factorizado en el punto base se calcula la
+    sensibilidad de la corriente de cada línea a la inyección en cada barra, y con
+    ella un estimado de la capacidad límite. Luego se refina con flujos AC en lote
+    (todas las barras y horas juntas) solo alrededor del estimado: se busca a pasos
+    crecientes desde el estimado hasta encerrar el límite y se biseca.
+
+    Args:
+        perfil_pu: perfil horario en p.u. de la capacidad instalada
+        kind: "pv" (generación) o "ev" (demanda)
+        limit_pct: límite de carga de líneas (%)
+        step_kw: resolución de la búsqueda (kW)
+        perfil_demanda_kw: demanda base por hora de cada comunidad (por defecto PERFIL_DEMANDA_KW)
+        barras: barras a estudiar (por defecto todas las de media tensión)
+        perfil_bess_kw: despacho BESS fijo por hora en cada comunidad (puede ser None)
+        kw_max: capacidad máxima explorada (las barras factibles ahí quedan censuradas)
+
+    Returns:
+        df_nodal (pd.DataFrame): Una fila por barra con la capacidad estimada por
+            sensibilidades, la capacidad final, si quedó censurada, la hora y línea
+            que limitan y el número de evaluaciones AC de 24 horas usadas.
+    """
+    if kind not in ("pv", "ev"):
+        raise ValueError(f"kind debe ser 'pv' o 'ev', no '{kind}'")
+    signo = -1 if kind == "pv" else 1
+    perfil_pu = np.asarray(perfil_pu, dtype=float)
+    if perfil_demanda_kw is None:
+        perfil_demanda_kw = PERFIL_DEMANDA_KW
+    perfil_base_kw = np.asarray(perfil_demanda_kw, dtype=float)
+    if perfil_bess_kw is not None:
+        perfil_base_kw = perfil_base_kw + perfil_bess_kw
+
+    flujo = obtener_flujo_lote()
+    net = flujo.sesion.net
+    if barras is None:
+        ext = set(net.ext_grid.bus)
+        barras = [b for b in net.bus.index if b not in ext and net.bus.vn_kv[b] < net.bus.vn_kv.max()]
+    barras = list(barras)
+    barras_ppc = net._pd2ppc_lookups["bus"][barras]
+    n_barras, n_horas = len(barras), len(perfil_pu)
+
+    print(f"Iniciando mapa nodal de hosting capacity {kind.upper()} en {n_barras} barras...")
+    with traza.etapa("sensibilidades"):
+        dI_desde, dI_hasta = _sensibilidades(flujo, barras_ppc)
+        V_base, _ = flujo.resolver(perfil_base_kw)
+        I0_desde = (V_base @ flujo.Yf[flujo.ramas_linea].T) * flujo.escala_desde
+        I0_hasta = (V_base @ flujo.Yt[flujo.ramas_linea].T) * flujo.escala_hasta
+        estimado = np.minimum(_estimar_hc(I0_desde, dI_desde, perfil_pu, signo, limit_pct, kw_max),
+                              _estimar_hc(I0_hasta, dI_hasta, perfil_pu, signo, limit_pct, kw_max))
+
+    S_base = flujo.sbus(perfil_base_kw)
+    dS_kw = _inyeccion_kw(flujo)
+    evaluaciones = np.zeros(n_barras, dtype=int)
+    hora_limite = np.full(n_barras, -1)
+    linea_limite = np.full(n_barras, -1)
+
+    def factible(capacidad_kw, activas):
+        """
+        Una evaluación AC en lote de 24 horas para cada barra activa.
+
+        Returns:
+            factible (np.ndarray): Máscara por barra activa.
+            carga_max (np.ndarray): Carga máxima AC (%) por barra activa (inf si no converge).
+            pendiente (np.ndarray): Variación de esa carga por kW instalado, según las
+                sensibilidades evaluadas en la corriente AC de la línea y hora que la fija.
+        """
+        Sbus = np.repeat(S_base[None], len(activas), axis=0)           # barras x horas x nodos
+        Sbus[np.arange(len(activas)), :, barras_ppc[activas]] += (
+            signo * capacidad_kw[:, None] * perfil_pu[None, :] * dS_kw
+        )
+        V, convergido = flujo.resolver(None, Sbus=Sbus.reshape(-1, Sbus.shape[2]))
+        I_desde = (V @ flujo.Yf[flujo.ramas_linea].T) * flujo.escala_desde
+        I_hasta = (V @ flujo.Yt[flujo.ramas_linea].T) * flujo.escala_hasta
+        lado_desde = (np.abs(I_desde) >= np.abs(I_hasta)).reshape(len(activas), n_horas, -1)
+        I = np.where(lado_desde, I_desde.reshape(lado_desde.shape), I_hasta.reshape(lado_desde.shape))
+        cargas = np.where(convergido.reshape(len(activas), n_horas)[:, :, None], np.abs(I), np.inf)
+        evaluaciones[activas] += 1
+
+        peor = cargas.reshape(len(activas), -1).argmax(axis=1)
+        hora, linea = np.unravel_index(peor, cargas.shape[1:])
+        i = np.arange(len(activas))
+        carga_max = cargas[i, hora, linea]
+        ok = carga_max <= limit_pct
+        hora_limite[activas[~ok]] = hora[~ok]
+        linea_limite[activas[~ok]] = flujo.line_index[linea[~ok]]
+
+        sensibilidad = np.where(lado_desde[i, hora, linea], dI_desde[linea, activas], dI_hasta[linea, activas])
+        I_peor = I[i, hora, linea]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pendiente = signo * perfil_pu[hora] * np.real(np.conj(I_peor) * sensibilidad) / np.abs(I_peor)
+        return ok, carga_max, pendiente
+
+    with traza.etapa("refinar_ac"):
+        capacidad = np.clip(np.floor(estimado / step_kw) * step_kw, 0, kw_max)
+        ok, carga, pendiente = factible(capacidad, np.arange(n_barras))
+        bajo = np.where(ok, capacidad, -step_kw)   # -step_kw: aún no hay capacidad factible conocida
+        alto = np.where(ok, np.inf, capacidad)
+
+        # Newton con la pendiente del Jacobiano ya factorizado, siempre dentro del intervalo
+        # (bajo, alto); si la pendiente no sirve se duplica o biseca
+        activas = np.flatnonzero((alto - bajo > step_kw) & (bajo < kw_max) & (alto > 0))
+        while len(activas):
+            c, b, a = capacidad[activas], bajo[activas], alto[activas]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                objetivo = c + (limit_pct - carga[activas]) / pendiente[activas]
+            respaldo = np.where(np.isinf(a), 2 * np.maximum(b, 0) + step_kw,
+                                np.where(b < 0, a / 2, (a + b) / 2))
+            objetivo = np.where(np.isfinite(objetivo) & (pendiente[activas] > 0), objetivo, respaldo)
+            prueba = np.floor(objetivo / step_kw) * step_kw
+            prueba = np.clip(prueba, np.maximum(b + step_kw, 0), np.minimum(a - step_kw, kw_max))
+
+            ok, carga[activas], pendiente[activas] = factible(prueba, activas)
+            capacidad[activas] = prueba
+            bajo[activas[ok]] = prueba[ok]
+            alto[activas[~ok]] = prueba[~ok]
+            activas = np.flatnonzero((alto - bajo > step_kw) & (bajo < kw_max) & (alto > 0))
+
+    censurada = np.isinf(alto)
+    df_nodal = pd.DataFrame({
+        "hc_estimada_kw": estimado,
+        "hc_kw": np.maximum(bajo, 0.0),
+        "censurada": censurada,
+        "hora_limite": pd.array(np.where(censurada, -1, hora_limite), dtype="Int64"),
+        "linea_limite": pd.array(np.where(censurada, -1, linea_limite), dtype="Int64"),
+        "evaluaciones_ac": evaluaciones,
+    }, index=pd.Index(barras, name="barra"))
+    df_nodal.loc[censurada, ["hora_limite", "linea_limite"]] = pd.NA
+
+    print(f"Mapa nodal {kind.upper()} completado con {evaluaciones.sum()} evaluaciones AC de "
+          f"{n_horas} horas ({evaluaciones.max()} por barra como máximo, "
+          f"{censurada.sum()} barras censuradas en {kw_max} kW).")
+    return df_nodal
@@ -0,0 +1,171 @@
+import numpy as np
+from pandapower.pypower.idx_brch import F_BUS, T_BUS
+from pandapower.pypower.idx_bus import BASE_KV
+from modulo_pf import SesionPF, COMMUNITY_BUSES
+import modulo_traza as traza
+
+class FlujoLote:
+    """
+    Newton-Raphson vectorizado para resolver muchos flujos de potencia a la vez.
+
+    Todas las horas comparten la topología de la red CIGRE; solo cambia la demanda
+    neta escalar en COMMUNITY_BUSES. La matriz de admitancia y la inyección por kW
+    se extraen una vez desde pandapower, y luego K instantes se resuelven juntos
+    con vectores de voltaje y Jacobianos apilados en NumPy. Los instantes que ya
+    convergieron se excluyen de las iteraciones siguientes.
+    """
+
+    def __init__(self, sesion=None, tolerancia_mva=1e-8, max_iter=10):
+        sesion = sesion if sesion is not None else SesionPF()
+        net = sesion.ejecutar(0.0)
+        ppci = net._ppc["internal"]
+        if ppci["branch"].shape[0] != net._ppc["branch"].shape[0] or len(ppci["pv"]) > 0:
+            raise ValueError("FlujoLote solo soporta redes sin ramas fuera de servicio ni barras PV")
+
+        self.Ybus = ppci["Ybus"].toarray()
+        self.Yf = ppci["Yf"].toarray()
+        self.Yt = ppci["Yt"].toarray()
+        self.pq = ppci["pq"]
+        self.V0 = ppci["V"].copy()
+        self.S0 = ppci["Sbus"].copy()
+        self.tolerancia = tolerancia_mva / ppci["baseMVA"]
+        self.max_iter = max_iter
+
+        # Inyección en p.u. por cada kW de demanda neta (cargas de potencia constante)
+        sesion.ejecutar(1000.0)
+        self.dS_kw = (net._ppc["internal"]["Sbus"] - self.S0) / 1000.0
+        # Columnas de inyección por kW en cada barra de COMMUNITY_BUSES (barras x comunidades)
+        barras_ppc = net._pd2ppc_lookups["bus"][COMMUNITY_BUSES]
+        self.E_kw = np.zeros((len(self.S0), len(COMMUNITY_BUSES)), dtype=complex)
+        self.E_kw[barras_ppc, np.arange(len(COMMUNITY_BUSES))] = self.dS_kw[barras_ppc]
+
+        # Conversión de corriente en p.u. a porcentaje de carga de cada línea
+        f, t = net._pd2ppc_lookups["branch"]["line"]
+        self.ramas_linea = np.arange(f, t)
+        desde = ppci["branch"][f:t, F_BUS].real.astype(np.int64)
+        hasta = ppci["branch"][f:t, T_BUS].real.astype(np.int64)
+        i_max_ka = (net.line["max_i_ka"] * net.line["df"] * net.line["parallel"]).to_numpy()
+        base_ka = ppci["baseMVA"] / np.sqrt(3)
+        self.escala_desde = base_ka / ppci["bus"][desde, BASE_KV].real / i_max_ka * 100
+        self.escala_hasta = base_ka / ppci["bus"][hasta, BASE_KV].real / i_max_ka * 100
+        self.line_index = net.line.index
+        self.etiquetas = sesion.etiquetas
+        self.sesion = sesion
+
+        # Verificación contra pandapower en el punto base
+        sesion.ejecutar(0.0)
+        cargas, _ = self.loading(np.array([0.0]))
+        if not np.allclose(cargas[0], net.res_line["loading_percent"].to_numpy(), atol=1e-6):
+            raise RuntimeError("FlujoLote no reproduce el loading_percent de pandapower")
+
+    def sbus(self, perfil_neto_kw):
+        """Inyecciones K x barras para una demanda neta igual en todas las comunidades."""
+        perfil_neto_kw = np.asarray(perfil_neto_kw, dtype=float)
+        return self.S0[None, :] + perfil_neto_kw[:, None] * self.dS_kw[None, :]
+
+    def sbus_nodal(self, demanda_kw):
+        """Inyecciones K x barras para una matriz K x comunidades de demanda neta por barra."""
+        demanda_kw = np.asarray(demanda_kw, dtype=float)
+        return self.S0[None, :] + demanda_kw @ self.E_kw.T
+
+    def jacobiano(self, V, Ibus=None):
+        """
+        Jacobianos apilados (K x 2n_pq x 2n_pq) de la inyección respecto a ángulo y magnitud.
+
+        Args:
+            V: voltajes complejos (K x barras)
+            Ibus: corrientes inyectadas `V @ Ybus.T` (se calculan si no se entregan)
+        """
+        if Ibus is None:
+            Ibus = V @ self.Ybus.T
+        pq = pvpq = self.pq  # sin barras PV
+        diag = np.arange(len(self.V0))
+        Vnorm = V / np.abs(V)
+        dS_dVm = V[:, :, None] * np.conj(self.Ybus[None] * Vnorm[:, None, :])
+        dS_dVm[:, diag, diag] += np.conj(Ibus) * Vnorm
+        dS_dVa = -1j * V[:, :, None] * np.conj(self.Ybus[None] * V[:, None, :])
+        dS_dVa[:, diag, diag] += 1j * V * np.conj(Ibus)
+
+        return np.block([
+            [dS_dVa[:, pvpq][:, :, pvpq].real, dS_dVm[:, pvpq][:, :, pq].real],
+            [dS_dVa[:, pq][:, :, pvpq].imag, dS_dVm[:, pq][:, :, pq].imag],
+        ])
+
+    def resolver(self, perfil_neto_kw, Sbus=None):
+        """
+        Resuelve todos los instantes del perfil con Newton-Raphson en lote.
+
+        Args:
+            perfil_neto_kw: demanda neta por instante, igual en todas las comunidades
+            Sbus: inyecciones K x barras ya armadas (reemplaza a perfil_neto_kw)
+
+        Returns:
+            V (np.ndarray): Voltajes complejos (K x barras).
+            convergido (np.ndarray): Máscara booleana por instante.
+        """
+        if Sbus is None:
+            Sbus = self.sbus(perfil_neto_kw)
+        K = len(Sbus)
+        marca = traza.inicio()
+        V = np.tile(self.V0, (K, 1))
+        convergido = np.zeros(K, dtype=bool)
+        iteraciones = np.full(K, self.max_iter)
+
+        pq, pvpq = self.pq, self.pq  # sin barras PV
+        n_pq = len(pq)
+        activos = np.arange(K)
+        for iteracion in range(self.max_iter + 1):
+            Va = V[activos]
+            Ibus = Va @ self.Ybus.T
+            mis = Va * np.conj(Ibus) - Sbus[activos]
+            F = np.concatenate([mis[:, pvpq].real, mis[:, pq].imag], axis=1)
+            listo = np.abs(F).max(axis=1) < self.tolerancia
+            convergido[activos[listo]] = True
+            iteraciones[activos[listo]] = iteracion
+            activos, Va, Ibus, F = activos[~listo], Va[~listo], Ibus[~listo], F[~listo]
+            if len(activos) == 0 or iteracion == self.max_iter:
+                break
+
+            J = self.jacobiano(Va, Ibus)
+            dx = -np.linalg.solve(J, F[:, :, None])[:, :, 0]
+
+            ang = np.angle(Va)
+            mag = np.abs(Va)
+            ang[:, pvpq] += dx[:, :len(pvpq)]
+            mag[:, pq] += dx[:, len(pvpq):len(pvpq) + n_pq]
+            V[activos] = mag * np.exp(1j * ang)
+
+        if marca is not None:
+            traza.cerrar("nr_lote", marca, instantes=K, iteraciones_max=int(iteraciones.max(initial=0)))
+            for k in range(K):
+                traza.registrar_flujo("lote", iteraciones[k], convergido[k], instante=k)
+        return V, convergido
+
+    def loading(self, perfil_neto_kw, Sbus=None):
+        """
+        Calcula el `loading_percent` de cada línea para todos los instantes del perfil.
+
+        Args:
+            perfil_neto_kw: demanda neta por instante, igual en todas las comunidades
+            Sbus: inyecciones K x barras ya armadas (ver `sbus_nodal`)
+
+        Returns:
+            cargas (np.ndarray): Matriz K x líneas (NaN en instantes sin convergencia).
+            convergido (np.ndarray): Máscara booleana por instante.
+        """
+        V, convergido = self.resolver(perfil_neto_kw, Sbus=Sbus)
+        i_desde = np.abs(V @ self.Yf[self.ramas_linea].T) * self.escala_desde
+        i_hasta = np.abs(V @ self.Yt[self.ramas_linea].T) * self.escala_hasta
+        cargas = np.maximum(i_desde, i_hasta)
+        cargas[~convergido] = np.nan
+        return cargas, convergido
+
+
+_flujo_global = None
+
+def obtener_flujo_lote():
+    """Retorna el solver en lote del proceso, creándolo si no existe."""
+    global _flujo_global
+    if _flujo_global is None:
+        _flujo_global = FlujoLote()
+    return _flujo_global
@@ -1,17 +1,36 @@
+import hashlib
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 import pandapower as pp
 import pandapower.networks as pn
-from pandapower.plotting.plotly import simple_plotly, pf_res_plotly
+import modulo_traza as traza
 
 # Parámetros fijos de la red
 COMMUNITY_BUSES = [4, 5, 6, 9, 10, 11, 8, 7, 14, 13]
+# Demanda base por hora de cada comunidad (la de proyecto.py), usada por defecto en las búsquedas de HC
+PERFIL_DEMANDA_KW = np.array([65, 65, 65, 74, 75, 80, 100, 148, 148, 148, 148, 148,
+                              133, 123, 123, 123, 123, 148, 148, 148, 246, 246, 148, 74], dtype=float)
 
-def build_base_network():
-    """Crea la red CIGRE MV base, limpia de cargas y switches."""
+@traza.medir()
+def build_base_network(conservar_enlaces=False):
+    """
+    Crea la red CIGRE MV base, limpia de cargas y switches.
+
+    Con `conservar_enlaces=True` las líneas con switch (enlaces entre
+    alimentadores) no se eliminan sino que quedan fuera de servicio, para poder
+    cerrarlas en estudios de contingencias cambiando solo `in_service`.
+    """
     net = pn.create_cigre_network_mv(with_der=False)
     if not net.switch.empty:
         sw_line_indices = net.switch[net.switch.et == 'l'].element.unique()
-        net.line.drop(sw_line_indices, inplace=True, errors='ignore')
+        if conservar_enlaces:
+            net.line.loc[sw_line_indices, "in_service"] = False
+        else:
+            net.line.drop(sw_line_indices, inplace=True, errors='ignore')
         net.switch.drop(net.switch.index, inplace=True)
     if not net.load.empty:
         net.load.drop(net.load.index, inplace=True)
@@ -25,48 +44,260 @@ def create_line_label(net, line_idx):
     to_bus_id = net.line.at[line_idx, "to_bus"]
     return f"Line {line_idx} (Bus {from_bus_id} -> Bus {to_bus_id})"
 
-def ejecutar_pf(demanda_neta_kw, nombre_archivo_salida=None):
+def etiquetas_lineas(net):
+    """Etiquetas de `create_line_label` para todas las líneas, en una sola pasada."""
+    return [
+        f"Line {i} (Bus {desde} -> Bus {hasta})"
+        for i, desde, hasta in zip(net.line.index, net.line["from_bus"], net.line["to_bus"])
+    ]
+
+def huella_red(net, opciones_pf=None):
+    """Hash de la topología, parámetros eléctricos y opciones del solver."""
+    h = hashlib.sha256()
+    for tabla in ["bus", "line", "trafo", "ext_grid", "load", "sgen"]:
+        df = net[tabla].drop(columns=["p_mw", "in_service"] if tabla in ("load", "sgen") else [])
+        h.update(tabla.encode())
+        h.update(pd.util.hash_pandas_object(df.astype(str), index=True).values.tobytes())
+    h.update(json.dumps(opciones_pf or {}, sort_keys=True, default=str).encode())
+    return h.hexdigest()[:16]
+
+
+class CachePF:
+    """
+    Cache de resultados de flujo de potencia por demanda neta.
+
+    La clave es (huella de la red y opciones, demanda neta redondeada). En memoria
+    se guardan hasta `max_entradas` resultados con desalojo LRU; opcionalmente se
+    agrega un nivel persistente en SQLite para que ejecuciones futuras partan con
+    el cache caliente.
+    """
+
+    def __init__(self, max_entradas=4096, ruta_disco=None, decimales=6):
+        self.max_entradas = max_entradas
+        self.ruta_disco = ruta_disco
+        self.decimales = decimales
+        self._memoria = OrderedDict()
+        self._conexion = None
+        self._pid = None
+        self.aciertos_memoria = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+
+    def _db(self):
+        # Cada proceso (p. ej. workers de un pool) abre su propia conexión
+        if self.ruta_disco is None:
+            return None
+        if self._conexion is None or self._pid != os.getpid():
+            carpeta = os.path.dirname(self.ruta_disco)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+            self._conexion = sqlite3.connect(self.ruta_disco, timeout=30)
+            self._conexion.execute(
+                "CREATE TABLE IF NOT EXISTS pf (huella TEXT, demanda REAL, loading BLOB, "
+                "PRIMARY KEY (huella, demanda))"
+            )
+            self._pid = os.getpid()
+        return self._conexion
+
+    def clave(self, huella, demanda_neta_kw):
+        return huella, round(float(demanda_neta_kw), self.decimales)
+
+    def obtener(self, clave):
+        """Retorna el array de carga guardado para la clave, o None si no existe."""
+        if clave in self._memoria:
+            self._memoria.move_to_end(clave)
+            self.aciertos_memoria += 1
+            return self._memoria[clave].copy()
+        db = self._db()
+        if db is not None:
+            fila = db.execute("SELECT loading FROM pf WHERE huella = ? AND demanda = ?", clave).fetchone()
+            if fila is not None:
+                self.aciertos_disco += 1
+                valor = np.frombuffer(fila[0], dtype=np.float64)
+                self._guardar_memoria(clave, valor)
+                return valor.copy()
+        self.fallos += 1
+        return None
+
+    def guardar(self, clave, loading):
+        valor = np.asarray(loading, dtype=np.float64).copy()
+        self._guardar_memoria(clave, valor)
+        db = self._db()
+        if db is not None:
+            with db:
+                db.execute("INSERT OR REPLACE INTO pf VALUES (?, ?, ?)", (*clave, valor.tobytes()))
+
+    def _guardar_memoria(self, clave, valor):
+        self._memoria[clave] = valor
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_entradas:
+            self._memoria.popitem(last=False)
+
+    def estadisticas(self):
+        """Contadores de aciertos y fallos del cache."""
+        consultas = self.aciertos_memoria + self.aciertos_disco + self.fallos
+        return {
+            "aciertos_memoria": self.aciertos_memoria,
+            "aciertos_disco": self.aciertos_disco,
+            "fallos": self.fallos,
+            "tasa_aciertos": (consultas - self.fallos) / consultas if consultas else 0.0,
+            "entradas_memoria": len(self._memoria),
+        }
+
+
+class SesionPF:
+    """
+    Red CIGRE MV persistente para ejecutar muchos flujos de potencia.
+
+    La red base se construye una sola vez y se crea una carga y un generador
+    (sgen) por cada barra de COMMUNITY_BUSES. En cada flujo solo se actualizan
+    `p_mw` y `in_service` de esos elementos, en vez de reconstruir la red.
+    Si se entrega un CachePF, `loading` reutiliza resultados ya calculados.
+    """
+
+    def __init__(self, cache=None, opciones_pf=None, conservar_enlaces=False):
+        self.net = build_base_network(conservar_enlaces)
+        # Líneas de enlace (solo existen con conservar_enlaces=True), normalmente abiertas
+        self.enlaces = self.net.line.index[~self.net.line["in_service"]].tolist()
+        with traza.etapa("crear_elementos"):
+            self.idx_load = [pp.create_load(self.net, bus=bus_id, p_mw=0.0, q_mvar=0) for bus_id in COMMUNITY_BUSES]
+            self.idx_sgen = [pp.create_sgen(self.net, bus=bus_id, p_mw=0.0, q_mvar=0, in_service=False)
+                             for bus_id in COMMUNITY_BUSES]
+        self.cache = cache
+        self.opciones_pf = opciones_pf or {}
+        # La topología de líneas no cambia: las etiquetas se arman una vez
+        self.etiquetas = etiquetas_lineas(self.net)
+        self.huella = huella_red(self.net, self.opciones_pf)
+
+    def fijar_topologia(self, lineas_fuera=(), enlaces_cerrados=()):
+        """
+        Saca de servicio las líneas dadas y cierra los enlaces dados (el resto vuelve al estado base).
+
+        La huella se recalcula, así que el cache no mezcla resultados de topologías distintas.
+        """
+        en_servicio = ~self.net.line.index.isin(self.enlaces)
+        en_servicio[self.net.line.index.isin(list(lineas_fuera))] = False
+        en_servicio[self.net.line.index.isin(list(enlaces_cerrados))] = True
+        self.net.line["in_service"] = en_servicio
+        self.huella = huella_red(self.net, self.opciones_pf)
+
+    def fijar_demanda(self, demanda_neta_kw):
+        """Actualiza cargas o generadores con la demanda neta (kW) por comunidad."""
+        demanda_neta_mw = demanda_neta_kw / 1000
+        consumo = demanda_neta_mw >= 0
+        self.net.load.loc[self.idx_load, "p_mw"] = demanda_neta_mw if consumo else 0.0
+        self.net.load.loc[self.idx_load, "in_service"] = consumo
+        self.net.sgen.loc[self.idx_sgen, "p_mw"] = 0.0 if consumo else -demanda_neta_mw
+        self.net.sgen.loc[self.idx_sgen, "in_service"] = not consumo
+
+    def ejecutar(self, demanda_neta_kw):
+        """Fija la demanda neta y corre `pp.runpp` sobre la red persistente."""
+        self.fijar_demanda(demanda_neta_kw)
+        if not traza.activo():
+            pp.runpp(self.net, **self.opciones_pf)
+            return self.net
+
+        with traza.etapa("runpp", demanda_kw=float(demanda_neta_kw)) as args:
+            try:
+                pp.runpp(self.net, **self.opciones_pf)
+            finally:
+                # Si no converge, pandapower igual deja las iteraciones en _ppc
+                args["iteraciones"] = int(self.net._ppc.get("iterations", 0) or 0)
+                args["convergido"] = bool(self.net.converged)
+                traza.registrar_flujo("runpp", args["iteraciones"], args["convergido"])
+        return self.net
+
+    def loading(self, demanda_neta_kw):
+        """Retorna un array con el `loading_percent` de cada línea para la demanda dada."""
+        if self.cache is None:
+            net = self.ejecutar(demanda_neta_kw)
+            return net.res_line["loading_percent"].to_numpy(copy=True)
+
+        clave = self.cache.clave(self.huella, demanda_neta_kw)
+        loading = self.cache.obtener(clave)
+        if loading is None:
+            net = self.ejecutar(demanda_neta_kw)
+            loading = net.res_line["loading_percent"].to_numpy(copy=True)
+            self.cache.guardar(clave, loading)
+        else:
+            traza.registrar_flujo("cache", 0, True, demanda_kw=float(demanda_neta_kw))
+        return loading
+
+
+_sesion_global = None
+_cache_global = CachePF()
+
+def configurar_cache(max_entradas=4096, ruta_disco=None, decimales=6):
+    """
+    Reemplaza el cache de la sesión global, p. ej. para agregar el nivel en disco.
+
+    Returns:
+        CachePF: El nuevo cache.
+    """
+    global _cache_global
+    _cache_global = CachePF(max_entradas=max_entradas, ruta_disco=ruta_disco, decimales=decimales)
+    if _sesion_global is not None:
+        _sesion_global.cache = _cache_global
+    return _cache_global
+
+def obtener_sesion():
+    """Retorna la sesión de flujo de potencia del proceso, creándola si no existe."""
+    global _sesion_global
+    if _sesion_global is None:
+        _sesion_global = SesionPF(cache=_cache_global)
+    return _sesion_global
+
+def ejecutar_pf(demanda_neta_kw, nombre_archivo_salida=None, sesion=None, formatos=("html", "xlsx")):
     """
     Ejecuta un caso de flujo de potencia con una demanda neta específica.
     
     Args:
         demanda_neta_kw (float): Valor de la demanda neta en kW por comunidad.
         nombre_archivo_salida (str, optional): Nombre base para archivos de salida.
+        sesion (SesionPF, optional): Red persistente a reutilizar. Si no se
+            entrega, se usa la sesión global del proceso.
+        formatos (tuple, optional): Archivos a exportar cuando hay nombre de
+            salida: "html" (gráfico plotly) y/o "xlsx" (tabla de carga).
         
     Returns:
         DataFrame: Un DataFrame con los resultados de carga de las líneas.
                    Retorna un DataFrame vacío si el flujo no converge.
     """
     # print(f"--- Ejecutando PF: Demanda Neta={demanda_neta_kw} kW por comunidad ---")
-    demanda_neta_mw = demanda_neta_kw / 1000
-    net = build_base_network()
-
-    if demanda_neta_mw >= 0:
-        for bus_id in COMMUNITY_BUSES:
-            pp.create_load(net, bus=bus_id, p_mw=demanda_neta_mw, q_mvar=0)
-    else:
-        p_sgen_mw = -demanda_neta_mw
-        for bus_id in COMMUNITY_BUSES:
-            pp.create_sgen(net, bus=bus_id, p_mw=p_sgen_mw, q_mvar=0)
+    if sesion is None:
+        sesion = obtener_sesion()
 
     try:
-        pp.runpp(net)
+        if nombre_archivo_salida is None:
+            formatos = ()
+        if "html" not in formatos:
+            # Sin gráfico basta con la carga de líneas (puede venir del cache)
+            net = sesion.net
+            loading = pd.Series(sesion.loading(demanda_neta_kw), index=net.line.index)
+        else:
+            net = sesion.ejecutar(demanda_neta_kw)
+            loading = net.res_line["loading_percent"]
         # print("Flujo de potencia completado.")
     
         
         # dataframe de lineas
-        df_line = pd.DataFrame({
-            "line_index": net.res_line.index,
-            "line_label": [create_line_label(net, i) for i in net.res_line.index],
-            "loading_percent": net.res_line["loading_percent"]
-        })
+        with traza.etapa("etiquetas_lineas"):
+            df_line = pd.DataFrame({
+                "line_index": net.line.index,
+                "line_label": sesion.etiquetas,
+                "loading_percent": loading
+            })
 
         # Guardar archivos (gráfico y Excel) solo si se proporciona un nombre
-        if nombre_archivo_salida is not None:
+        if "html" in formatos:
+            # plotly solo se importa cuando se pide el gráfico
+            from pandapower.plotting.plotly import pf_res_plotly
             print(f"Guardando gráfico en '{nombre_archivo_salida}_lineas.html'...")
-            pf_res_plotly(net, filename=f"{nombre_archivo_salida}_lineas.html", auto_open=False)
+            with traza.etapa("exportar_html"):
+                pf_res_plotly(net, filename=f"{nombre_archivo_salida}_lineas.html", auto_open=False)
+        if "xlsx" in formatos:
             print(f"Guardando resultados en '{nombre_archivo_salida}_resultados.xlsx'...")
-            with pd.ExcelWriter(f"{nombre_archivo_salida}.xlsx") as writer:
+            with traza.etapa("exportar_xlsx"), pd.ExcelWriter(f"{nombre_archivo_salida}.xlsx") as writer:
                 # La línea para guardar voltajes comentada
                 # df_bus.to_excel(writer, sheet_name="Resultados_Voltaje", index=False)
                 df_line.to_excel(writer, sheet_name="Resultados_Carga_Lineas", index=False)
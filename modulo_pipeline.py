@@ -0,0 +1,181 @@
+import hashlib
+import inspect
+import os
+import pickle
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import modulo_traza as traza
+
+# Ejecución incremental de escenarios. Cada escenario es una lista de etapas
+# (perfiles, despacho BESS, carga por hora, flujo de la hora crítica, exportación)
+# y el resultado de cada etapa se guarda bajo un hash de su función, sus
+# parámetros y las claves de sus entradas. Como la clave no depende del nombre
+# de la etapa ni del escenario, dos escenarios que repiten un mismo cálculo
+# (p. ej. la HC inicial de "pv" y de "pv + bess") lo comparten. La clave incluye
+# además una huella del código de la librería (funciones.py y modulo_*.py), que
+# las etapas llaman pero no contienen: al editarla se invalida todo el cache.
+
+# Subir al cambiar algo que la huella del código no ve (librerías instaladas,
+# datos externos) y que deba invalidar los resultados guardados
+VERSION_CODIGO = 1
+_huella_codigo = None
+
+def huella(valor, h=None):
+    """
+    Hash estable de parámetros: escalares, textos, listas, dicts, arrays y DataFrames.
+
+    Returns:
+        El objeto hashlib actualizado (se crea uno nuevo si h es None).
+    """
+    h = h if h is not None else hashlib.sha256()
+    if isinstance(valor, np.ndarray):
+        h.update(f"nd:{valor.dtype.str}:{valor.shape}".encode())
+        h.update(np.ascontiguousarray(valor).tobytes())
+    elif isinstance(valor, (pd.DataFrame, pd.Series)):
+        h.update(f"pd:{type(valor).__name__}:{list(getattr(valor, 'columns', [valor.name]))}".encode())
+        h.update(pd.util.hash_pandas_object(valor, index=True).values.tobytes())
+    elif isinstance(valor, dict):
+        h.update(b"dict")
+        for clave in sorted(valor, key=str):
+            huella(str(clave), h)
+            huella(valor[clave], h)
+    elif isinstance(valor, (list, tuple)):
+        h.update(f"seq:{len(valor)}".encode())
+        for v in valor:
+            huella(v, h)
+    elif valor is None or isinstance(valor, (bool, int, float, str, np.generic)):
+        h.update(f"{type(valor).__name__}:{valor!r}".encode())
+    else:
+        raise ValueError(f"No se puede calcular la huella de un parámetro de tipo {type(valor).__name__}")
+    return h
+
+
+def huella_codigo():
+    """Hash de VERSION_CODIGO y del código de funciones.py y modulo_*.py (una vez por proceso)."""
+    global _huella_codigo
+    if _huella_codigo is None:
+        raiz = os.path.dirname(os.path.abspath(__file__))
+        h = hashlib.sha256(f"version:{VERSION_CODIGO}".encode())
+        for nombre in sorted(os.listdir(raiz)):
+            if nombre == "funciones.py" or (nombre.startswith("modulo_") and nombre.endswith(".py")):
+                h.update(nombre.encode())
+                with open(os.path.join(raiz, nombre), "rb") as archivo:
+                    h.update(archivo.read())
+        _huella_codigo = h.hexdigest()
+    return _huella_codigo
+
+
+def _huella_funcion(funcion):
+    # El código fuente entra en la clave: editar la función invalida sus resultados.
+    # El módulo no, porque proyecto.py es "__main__" al ejecutarlo y "proyecto" al importarlo
+    try:
+        fuente = inspect.getsource(funcion)
+    except (OSError, TypeError):
+        fuente = ""
+    return f"{funcion.__qualname__}\n{fuente}"
+
+
+class Etapa:
+    """
+    Una etapa de un escenario.
+
+    Args:
+        nombre: nombre de la etapa dentro del escenario
+        funcion: se llama como `funcion(*valores_de_entradas, **parametros)`
+        entradas: nombres de etapas anteriores del mismo escenario
+        parametros: argumentos con nombre (entran en la clave del cache)
+        cachear: False para etapas que deben correr siempre (p. ej. escribir el almacén)
+        archivos: función valor -> rutas que la etapa genera, o True si el valor ya es
+            la lista de rutas; si falta alguna, se recalcula
+    """
+
+    def __init__(self, nombre, funcion, entradas=(), parametros=None, cachear=True, archivos=None):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.entradas = tuple(entradas)
+        self.parametros = parametros or {}
+        self.cachear = cachear
+        self.archivos = archivos
+
+
+class CacheEtapas:
+    """Resultados de etapas en disco, un pickle por clave (direccionado por contenido)."""
+
+    def __init__(self, ruta="cache/etapas"):
+        self.ruta = str(ruta)
+
+    def _archivo(self, clave):
+        return os.path.join(self.ruta, clave[:2], f"{clave}.pkl")
+
+    def clave(self, etapa, claves_entradas):
+        """Hash del código de la librería, la función, los parámetros y las claves de las entradas."""
+        h = hashlib.sha256(huella_codigo().encode())
+        h.update(_huella_funcion(etapa.funcion).encode())
+        huella(etapa.parametros, h)
+        huella(list(claves_entradas), h)
+        return h.hexdigest()[:32]
+
+    def contiene(self, clave):
+        return os.path.exists(self._archivo(clave))
+
+    def obtener(self, clave):
+        with open(self._archivo(clave), "rb") as archivo:
+            return pickle.load(archivo)
+
+    def guardar(self, clave, valor):
+        ruta = self._archivo(clave)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Escritura atómica: escenarios concurrentes pueden calcular la misma etapa
+        temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+        with open(temporal, "wb") as archivo:
+            pickle.dump(valor, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta)
+
+
+def ejecutar_etapas(etapas, cache=None, forzar=False, escenario=""):
+    """
+    Ejecuta las etapas de un escenario en orden, reutilizando las que no cambiaron.
+
+    Las claves dependen solo de los parámetros y de las claves de las entradas, así
+    que se calculan todas antes de ejecutar nada. Una etapa se recalcula si su clave
+    no está en el cache, si `forzar` es True o si falta alguno de los archivos que
+    declara; las demás solo se leen del cache.
+
+    Args:
+        etapas: lista de Etapa, con cada entrada antes de quien la usa
+        cache: CacheEtapas (None = sin cache, se calcula todo)
+        forzar: recalcular todas las etapas (los resultados nuevos se guardan igual)
+        escenario: nombre para la instrumentación
+
+    Returns:
+        valores (dict): Nombre de etapa -> valor.
+        estados (pd.DataFrame): Por etapa, si se reutilizó o calculó, su clave y el tiempo.
+    """
+    claves = {}
+    for etapa in etapas:
+        faltantes = [n for n in etapa.entradas if n not in claves]
+        if faltantes:
+            raise ValueError(f"La etapa '{etapa.nombre}' usa entradas no definidas antes: {faltantes}")
+        claves[etapa.nombre] = cache.clave(etapa, [claves[n] for n in etapa.entradas]) if cache is not None else None
+
+    valores, filas = {}, []
+    for etapa in etapas:
+        clave = claves[etapa.nombre]
+        t0 = time.perf_counter()
+        reutilizada = cache is not None and etapa.cachear and not forzar and cache.contiene(clave)
+        if reutilizada:
+            resultado = cache.obtener(clave)
+            if etapa.archivos is not None:
+                rutas = resultado if etapa.archivos is True else etapa.archivos(resultado)
+                reutilizada = all(os.path.exists(r) for r in rutas)
+        if not reutilizada:
+            with traza.etapa(f"etapa_{etapa.nombre}", escenario=escenario):
+                resultado = etapa.funcion(*[valores[n] for n in etapa.entradas], **etapa.parametros)
+            if cache is not None and etapa.cachear:
+                cache.guardar(clave, resultado)
+        valores[etapa.nombre] = resultado
+        filas.append({"etapa": etapa.nombre, "estado": "reutilizada" if reutilizada else "calculada",
+                      "clave": clave, "segundos": time.perf_counter() - t0})
+    return valores, pd.DataFrame(filas).set_index("etapa")
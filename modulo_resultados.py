@@ -0,0 +1,158 @@
+import os
+import time
+import uuid
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+
+def _importar_arrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.fs as pafs
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("El almacén de resultados requiere el paquete 'pyarrow'") from e
+    return pa, ds, pafs, pq
+
+
+class AlmacenResultados:
+    """
+    Almacén columnar de resultados en Parquet, particionado por escenario y corrida.
+
+    Cada tabla (p. ej. "cargas", "despacho_bess", "critico") es una carpeta con
+    particiones estilo Hive `escenario=<nombre>/run=<id>/`, y cada llamada a
+    `guardar` agrega un archivo nuevo a la partición, de modo que varios procesos
+    pueden escribir a la vez sin coordinarse. Las lecturas usan `pyarrow.dataset`
+    con archivos mapeados en memoria y filtros sobre las particiones, así que se
+    pueden analizar miles de corridas leyendo solo las columnas y filas necesarias.
+    """
+
+    def __init__(self, raiz="Resultados/almacen", run_id=None, compresion="zstd"):
+        self.raiz = str(raiz)
+        self.run_id = run_id if run_id is not None else time.strftime("%Y%m%d-%H%M%S")
+        self.compresion = compresion
+
+    def _ruta_particion(self, tabla, escenario, run_id):
+        # Los nombres de escenario ("pv + bess") se codifican como en las rutas URI
+        return os.path.join(
+            self.raiz, tabla, f"escenario={quote(str(escenario), safe='')}", f"run={quote(str(run_id), safe='')}"
+        )
+
+    def guardar(self, tabla, escenario, df, run_id=None):
+        """
+        Agrega un DataFrame a la partición (escenario, corrida) de una tabla.
+
+        Args:
+            tabla: nombre de la tabla
+            escenario: nombre del escenario
+            df: datos a guardar (el índice no se guarda)
+            run_id: corrida (por defecto la del almacén)
+
+        Returns:
+            Ruta del archivo escrito.
+        """
+        pa, _, _, pq = _importar_arrow()
+        carpeta = self._ruta_particion(tabla, escenario, run_id if run_id is not None else self.run_id)
+        os.makedirs(carpeta, exist_ok=True)
+        ruta = os.path.join(carpeta, f"parte-{uuid.uuid4().hex}.parquet")
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), ruta, compression=self.compresion)
+        return ruta
+
+    def guardar_cargas(self, escenario, resultado, run_id=None):
+        """
+        Guarda la carga de `funciones.loading_por_hora` en formato largo.
+
+        Args:
+            resultado: `CargaPorHora` o DataFrame líneas x instantes
+
+        Columnas: instante, line_index, loading_percent.
+        """
+        if isinstance(resultado, pd.DataFrame):
+            cargas, line_index = resultado.to_numpy().T, resultado.index.to_numpy()
+        else:
+            cargas, line_index = resultado.cargas, resultado.line_index
+        n_instantes, n_lineas = cargas.shape  # instantes x líneas
+        df = pd.DataFrame({
+            "instante": np.repeat(np.arange(n_instantes, dtype=np.int32), n_lineas),
+            "line_index": np.tile(np.asarray(line_index, dtype=np.int32), n_instantes),
+            "loading_percent": np.asarray(cargas, dtype=float).ravel(),
+        })
+        return self.guardar("cargas", escenario, df, run_id)
+
+    def guardar_despacho(self, escenario, df_bess, run_id=None):
+        """Guarda la tabla horaria del despacho BESS (`resolver_despacho_bess`)."""
+        df = df_bess.reset_index(drop=True)
+        df.insert(0, "instante", np.arange(len(df), dtype=np.int32))
+        return self.guardar("despacho_bess", escenario, df, run_id)
+
+    def guardar_critico(self, escenario, hora, demanda_neta_kw, df_line, run_id=None):
+        """Guarda la foto de la hora crítica (DataFrame de `ejecutar_pf`) y su demanda neta."""
+        df = df_line.reset_index(drop=True)
+        df.insert(0, "hora", np.int32(hora))
+        df.insert(1, "demanda_neta_kw", float(demanda_neta_kw))
+        return self.guardar("critico", escenario, df, run_id)
+
+    def dataset(self, tabla):
+        """Retorna la tabla como `pyarrow.dataset.Dataset` con lectura mapeada en memoria."""
+        pa, ds, pafs, _ = _importar_arrow()
+        ruta = os.path.join(self.raiz, tabla)
+        if not os.path.isdir(ruta):
+            raise ValueError(f"La tabla '{tabla}' no existe en '{self.raiz}'")
+        # Esquema explícito para que corridas como "1" no se interpreten como enteros
+        particion = ds.partitioning(pa.schema([("escenario", pa.string()), ("run", pa.string())]), flavor="hive")
+        return ds.dataset(
+            ruta, format="parquet", partitioning=particion, filesystem=pafs.LocalFileSystem(use_mmap=True)
+        )
+
+    def leer(self, tabla, escenario=None, run_id=None, columnas=None, filtro=None) -> pd.DataFrame:
+        """
+        Lee una tabla filtrando por partición antes de cargar datos.
+
+        Args:
+            tabla: nombre de la tabla
+            escenario: nombre o lista de escenarios (None = todos)
+            run_id: corrida o lista de corridas (None = todas)
+            columnas: columnas a leer (None = todas, incluidas escenario y run)
+            filtro: expresión adicional de `pyarrow.dataset`, p. ej. `ds.field("loading_percent") > 100`
+
+        Returns:
+            DataFrame con las filas seleccionadas.
+        """
+        _, ds, _, _ = _importar_arrow()
+        expresion = filtro
+        for campo, valor in (("escenario", escenario), ("run", run_id)):
+            if valor is None:
+                continue
+            valores = [str(v) for v in valor] if isinstance(valor, (list, tuple)) else [str(valor)]
+            condicion = ds.field(campo).isin(valores)
+            expresion = condicion if expresion is None else expresion & condicion
+        return self.dataset(tabla).to_table(columns=columnas, filter=expresion).to_pandas()
+
+    def corridas(self, tabla="cargas") -> pd.DataFrame:
+        """Lista los pares (escenario, run) presentes en una tabla."""
+        _, ds, _, _ = _importar_arrow()
+        # Solo se leen las claves de partición, no los datos
+        claves = {
+            (c["escenario"], c["run"])
+            for c in (ds.get_partition_keys(f.partition_expression) for f in self.dataset(tabla).get_fragments())
+        }
+        return pd.DataFrame(sorted(claves), columns=["escenario", "run"])
+
+    def exportar_excel(self, tabla, ruta, escenario=None, run_id=None):
+        """Post-proceso: escribe una tabla (filtrada) a Excel, una hoja por escenario y corrida."""
+        df = self.leer(tabla, escenario=escenario, run_id=run_id)
+        with pd.ExcelWriter(ruta) as writer:
+            for (esc, run), grupo in df.groupby(["escenario", "run"], observed=True):
+                # Excel limita los nombres de hoja a 31 caracteres
+                grupo.drop(columns=["escenario", "run"]).to_excel(writer, sheet_name=f"{esc} {run}"[:31], index=False)
+        return ruta
+
+    def exportar_html(self, escenario, nombre_archivo_salida, run_id=None):
+        """Post-proceso: regenera el gráfico plotly de la hora crítica guardada."""
+        from modulo_pf import ejecutar_pf
+        df = self.leer("critico", escenario=escenario, run_id=run_id if run_id is not None else self.run_id,
+                       columnas=["demanda_neta_kw"])
+        if df.empty:
+            raise ValueError(f"No hay hora crítica guardada para el escenario '{escenario}'")
+        return ejecutar_pf(df["demanda_neta_kw"].iloc[0], nombre_archivo_salida, formatos=("html",))
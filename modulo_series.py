@@ -0,0 +1,180 @@
+import numpy as np
+import pandapower as pp
+import pandas as pd
+from modulo_pf import obtener_sesion
+from modulo_nr import obtener_flujo_lote
+from modulo_curva import obtener_curva
+
+def _importar_parquet():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Leer o escribir archivos Parquet requiere el paquete 'pyarrow'") from e
+    return pa, pq
+
+
+def leer_perfil(ruta, columna="demanda_neta_kw", tamano_bloque=8760):
+    """
+    Lee un perfil de demanda neta desde CSV o Parquet, por bloques.
+
+    Args:
+        ruta: archivo .csv o .parquet
+        columna: columna con la demanda neta (kW por comunidad)
+        tamano_bloque: número de instantes por bloque
+
+    Yields:
+        np.ndarray con la demanda neta de cada bloque.
+    """
+    if str(ruta).endswith(".parquet"):
+        _, pq = _importar_parquet()
+        archivo = pq.ParquetFile(ruta)
+        for lote in archivo.iter_batches(batch_size=tamano_bloque, columns=[columna]):
+            yield lote.column(0).to_numpy(zero_copy_only=False).astype(float)
+    else:
+        for df in pd.read_csv(ruta, usecols=[columna], chunksize=tamano_bloque):
+            yield df[columna].to_numpy(dtype=float)
+
+
+def bloques_de_array(perfil_neto_kw, tamano_bloque=8760):
+    """Divide un perfil en memoria en bloques (vistas, sin copiar)."""
+    perfil_neto_kw = np.asarray(perfil_neto_kw, dtype=float)
+    for inicio in range(0, len(perfil_neto_kw), tamano_bloque):
+        yield perfil_neto_kw[inicio:inicio + tamano_bloque]
+
+
+def evaluar_bloques(bloques, backend="lote"):
+    """
+    Evalúa el flujo de potencia bloque a bloque.
+
+    Args:
+        bloques: iterable de arrays con la demanda neta
+        backend: "lote", "curva" (con verificación AC cerca del 100%) o "pandapower"
+
+    Yields:
+        Tupla (inicio, cargas) con el índice del primer instante del bloque y la
+        matriz de carga instantes x líneas.
+    """
+    inicio = 0
+    for bloque in bloques:
+        if backend == "lote":
+            cargas, convergido = obtener_flujo_lote().loading(bloque)
+        elif backend == "curva":
+            cargas, _ = obtener_curva(bloque).loading(bloque, limite_pct=100)
+            convergido = np.ones(len(bloque), dtype=bool)
+        elif backend == "pandapower":
+            sesion = obtener_sesion()
+            cargas = np.empty((len(bloque), len(sesion.net.line)))
+            convergido = np.ones(len(bloque), dtype=bool)
+            for k, demanda in enumerate(bloque):
+                try:
+                    cargas[k] = sesion.loading(demanda)
+                except pp.LoadflowNotConverged:
+                    convergido[k] = False
+        else:
+            raise ValueError(f"backend debe ser 'lote', 'curva' o 'pandapower', no '{backend}'")
+
+        if not convergido.all():
+            instante = inicio + int(np.flatnonzero(~convergido)[0])
+            raise ValueError(f"Error en instante {instante}: flujo no convergió")
+        yield inicio, cargas
+        inicio += len(bloque)
+
+
+class _EscritorColumnar:
+    """Escribe la carga por línea en Parquet (si hay pyarrow) o CSV, agregando bloques."""
+
+    def __init__(self, ruta):
+        self.ruta = str(ruta)
+        self._escritor = None
+        self._primero = True
+
+    def escribir(self, df):
+        if self.ruta.endswith(".parquet"):
+            pa, pq = _importar_parquet()
+            tabla = pa.Table.from_pandas(df, preserve_index=False)
+            if self._escritor is None:
+                self._escritor = pq.ParquetWriter(self.ruta, tabla.schema, compression="zstd")
+            self._escritor.write_table(tabla)
+        else:
+            df.to_csv(self.ruta, mode="w" if self._primero else "a", header=self._primero, index=False)
+        self._primero = False
+
+    def cerrar(self):
+        if self._escritor is not None:
+            self._escritor.close()
+
+
+def procesar_serie(
+    perfil,
+    ruta_salida=None,
+    columna="demanda_neta_kw",
+    tamano_bloque=8760,
+    backend="lote",
+    limite_pct=100,
+    paso_h=1.0
+) -> pd.DataFrame:
+    """
+    Evalúa un perfil de cualquier largo en streaming, con memoria acotada por el bloque.
+
+    Args:
+        perfil: ruta a un archivo CSV/Parquet, array en memoria con la demanda neta
+            o iterable que entrega bloques de demanda neta
+        ruta_salida: archivo .parquet o .csv donde guardar la carga por línea e
+            instante (None para no guardar)
+        columna: columna de demanda neta en el archivo de entrada
+        tamano_bloque: instantes por bloque
+        backend: ver `evaluar_bloques`
+        limite_pct: límite de carga para contar las horas de excedencia
+        paso_h: duración de cada instante en horas (0.25 para perfiles de 15 minutos)
+
+    Returns:
+        DataFrame por línea con la carga máxima, el instante en que ocurre y las
+        horas sobre el límite.
+    """
+    if isinstance(perfil, (str, bytes)) or hasattr(perfil, "__fspath__"):
+        bloques = leer_perfil(perfil, columna=columna, tamano_bloque=tamano_bloque)
+    elif isinstance(perfil, (np.ndarray, list, tuple, pd.Series)):
+        bloques = bloques_de_array(perfil, tamano_bloque=tamano_bloque)
+    else:
+        # Generador de bloques, p. ej. modulo_bess.perfil_neto_rodante
+        bloques = perfil
+
+    print("Iniciando análisis de serie de tiempo por bloques...")
+    escritor = _EscritorColumnar(ruta_salida) if ruta_salida is not None else None
+    carga_max = instante_max = excedencias = line_index = None
+    n_instantes = 0
+    try:
+        for inicio, cargas in evaluar_bloques(bloques, backend=backend):
+            if carga_max is None:
+                line_index = obtener_sesion().net.line.index
+                carga_max = np.full(cargas.shape[1], -np.inf)
+                instante_max = np.zeros(cargas.shape[1], dtype=np.int64)
+                excedencias = np.zeros(cargas.shape[1], dtype=np.int64)
+
+            # Máximos acumulados y conteo de excedencias
+            k_max = cargas.argmax(axis=0)
+            bloque_max = cargas[k_max, np.arange(cargas.shape[1])]
+            mejora = bloque_max > carga_max
+            carga_max[mejora] = bloque_max[mejora]
+            instante_max[mejora] = inicio + k_max[mejora]
+            excedencias += (cargas > limite_pct).sum(axis=0)
+            n_instantes += len(cargas)
+
+            if escritor is not None:
+                df = pd.DataFrame(cargas, columns=[f"linea_{i}" for i in line_index])
+                df.insert(0, "instante", np.arange(inicio, inicio + len(cargas)))
+                escritor.escribir(df)
+    finally:
+        if escritor is not None:
+            escritor.cerrar()
+
+    if carga_max is None:
+        raise ValueError("El perfil no tiene instantes")
+    print(f"Análisis de {n_instantes} instantes completado.")
+
+    return pd.DataFrame({
+        "carga_max": carga_max,
+        "instante_max": instante_max,
+        "horas_sobre_limite": excedencias * paso_h,
+    }, index=pd.Index(line_index, name="line_index"))
@@ -0,0 +1,315 @@
+import argparse
+import asyncio
+import collections
+import contextlib
+import http.client
+import io
+import json
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+
+# Servicio local de hosting capacity que mantiene la red caliente entre consultas.
+# Un front end asyncio recibe consultas HTTP con cuerpo JSON (por TCP o por un
+# socket Unix) y las reparte a un pool de workers, cada uno con su red CIGRE
+# limpia, su solver y su cache de flujos ya cargados. Rutas:
+#
+#   POST /loading  {"perfil_neto_kw": [...], "backend": "pandapower", "incluir_cargas": false}
+#   POST /hc       {"perfil_pu": [...], "kind": "pv", "perfil_demanda_kw": [...], "step_kw": 10, ...}
+#   POST /bess     {"parametros_bess": {...}, "perfil_costo": [...], "perfil_demanda_kw": [...], ...}
+#   GET  /metricas latencias por ruta (las desconocidas agrupadas en "otras"), cola y respuestas por estado
+#   GET  /salud
+#
+# Uso:
+#   python modulo_servicio.py --puerto 8765 --workers 2
+#   python modulo_servicio.py --socket /tmp/hc.sock
+#   curl -s localhost:8765/hc -d '{"perfil_pu": [...], "kind": "pv", "perfil_demanda_kw": [...]}'
+
+_RAZONES = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+            500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+# -------------------- Lado worker --------------------
+def _iniciar_worker(ruta_cache=None):
+    """Construye la red y el cache del worker antes de la primera consulta."""
+    from modulo_pf import configurar_cache, obtener_sesion
+    configurar_cache(ruta_disco=ruta_cache)
+    obtener_sesion()
+
+
+def _arreglo(payload, clave, requerido=True):
+    if payload.get(clave) is None:
+        if requerido:
+            raise ValueError(f"Falta el campo '{clave}'")
+        return None
+    return np.asarray(payload[clave], dtype=float)
+
+
+def _loading(payload):
+    import funciones as f
+    resultado, hora_max, carga_max, linea_max = f.loading_por_hora(
+        _arreglo(payload, "perfil_neto_kw"), backend=payload.get("backend", "pandapower")
+    )
+    respuesta = {
+        "hora_max": hora_max, "carga_max": carga_max, "linea_max": linea_max,
+        "line_index": resultado.line_index.tolist(),
+        "max_por_linea": resultado.max_por_linea().tolist(),
+        "max_por_hora": resultado.max_por_hora().tolist(),
+    }
+    if payload.get("incluir_cargas", False):
+        respuesta["cargas"] = resultado.cargas.tolist()
+    return respuesta
+
+
+def _hc(payload):
+    import funciones as f
+    hc_kw, hora_limite, linea_limite = f.hosting_capacity(
+        _arreglo(payload, "perfil_pu"),
+        payload.get("kind", "pv"),
+        limit_pct=payload.get("limit_pct", 100),
+        step_kw=payload.get("step_kw", 10),
+        perfil_demanda_kw=_arreglo(payload, "perfil_demanda_kw", requerido=False),
+        perfil_bess_kw=_arreglo(payload, "perfil_bess_kw", requerido=False),
+        kw_max=payload.get("kw_max", 100000),
+    )
+    return {"hc_kw": hc_kw, "hora_limite": hora_limite, "linea_limite": linea_limite}
+
+
+def _bess(payload):
+    import funciones as f
+    if "parametros_bess" not in payload:
+        raise ValueError("Falta el campo 'parametros_bess'")
+    df, p_bess = f.resolver_despacho_bess(
+        payload["parametros_bess"],
+        _arreglo(payload, "perfil_costo"),
+        _arreglo(payload, "perfil_demanda_kw"),
+        perfil_pv_kw=_arreglo(payload, "perfil_pv_kw", requerido=False),
+        perfil_ev_kw=_arreglo(payload, "perfil_ev_kw", requerido=False),
+        backend=payload.get("backend", "highs"),
+    )
+    return {"despacho": df.to_dict(orient="list"), "p_bess": np.asarray(p_bess).tolist()}
+
+
+_RUTAS_WORKER = {"/loading": _loading, "/hc": _hc, "/bess": _bess}
+# Rutas que responde el front end sin pasar por los workers
+_RUTAS_FRONT = ("/salud", "/metricas")
+_OTRAS_RUTAS = "otras"
+
+
+def atender(ruta, payload):
+    """
+    Resuelve una consulta en el worker.
+
+    Returns:
+        Tupla (estado HTTP, dict de respuesta).
+    """
+    try:
+        return 200, _RUTAS_WORKER[ruta](payload)
+    except (ValueError, KeyError, TypeError) as e:
+        return 400, {"error": str(e)}
+    except Exception as e:
+        return 500, {"error": f"{type(e).__name__}: {e}"}
+
+
+def _atender_silencioso(ruta, payload):
+    """
+    `atender` para el pool de procesos, sin el avance que imprimen las funciones de cálculo.
+
+    Cambiar sys.stdout afecta a todo el proceso, por eso solo se hace en los
+    workers (un hilo cada uno) y nunca en el proceso del front end.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return atender(ruta, payload)
+
+
+# -------------------- Front end asyncio --------------------
+class ServicioHC:
+    """
+    Servidor HTTP asyncio con límite de cola y métricas de latencia.
+
+    Con workers None o 0 las consultas se resuelven en un hilo del mismo proceso
+    (una red) y el avance de los cálculos se ve en la consola del servidor; con
+    workers >= 1 en un pool de procesos, cada uno con su red y sin imprimir.
+    """
+
+    def __init__(self, workers=None, max_en_cola=64, ruta_cache=None, max_cuerpo_mb=64, ventana_metricas=1000):
+        self.workers = workers
+        self.max_en_cola = max_en_cola
+        self.ruta_cache = ruta_cache
+        self.max_cuerpo = int(max_cuerpo_mb * 2**20)
+        self.en_curso = 0
+        self.rechazadas = 0
+        self.contadores = collections.Counter()
+        self.latencias = collections.defaultdict(lambda: collections.deque(maxlen=ventana_metricas))
+        self.inicio = time.time()
+        self.pool = None
+
+    def _crear_pool(self):
+        if self.workers:
+            return ProcessPoolExecutor(max_workers=self.workers, initializer=_iniciar_worker,
+                                       initargs=(self.ruta_cache,))
+        # Un solo hilo: pandapower no es seguro para usar la misma red desde varios hilos
+        return ThreadPoolExecutor(max_workers=1, initializer=_iniciar_worker, initargs=(self.ruta_cache,))
+
+    def metricas(self):
+        """Solicitudes, cola y percentiles de latencia (ms) por ruta."""
+        por_ruta = {}
+        for ruta, valores in self.latencias.items():
+            ms = np.array(valores) * 1000
+            por_ruta[ruta] = {
+                "n": len(ms),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max()),
+            }
+        return {
+            "activo_s": time.time() - self.inicio,
+            "en_curso": self.en_curso,
+            "max_en_cola": self.max_en_cola,
+            "rechazadas": self.rechazadas,
+            "respuestas": {str(k): v for k, v in sorted(self.contadores.items())},
+            "latencia": por_ruta,
+        }
+
+    async def _procesar(self, metodo, ruta, cuerpo):
+        if metodo == "GET" and ruta == "/salud":
+            return 200, {"estado": "ok"}
+        if metodo == "GET" and ruta == "/metricas":
+            # Se responde desde el front end, sin esperar a los workers ocupados
+            return 200, self.metricas()
+        if metodo != "POST" or ruta not in _RUTAS_WORKER:
+            return 404, {"error": f"Ruta no encontrada: {metodo} {ruta}"}
+
+        if self.en_curso >= self.max_en_cola:
+            self.rechazadas += 1
+            return 503, {"error": f"Cola llena ({self.max_en_cola} consultas en curso)"}
+        try:
+            payload = json.loads(cuerpo or b"{}")
+        except json.JSONDecodeError as e:
+            return 400, {"error": f"JSON inválido: {e}"}
+        if not isinstance(payload, dict):
+            return 400, {"error": "El cuerpo debe ser un objeto JSON"}
+
+        self.en_curso += 1
+        try:
+            funcion = _atender_silencioso if self.workers else atender
+            return await asyncio.get_running_loop().run_in_executor(self.pool, funcion, ruta, payload)
+        finally:
+            self.en_curso -= 1
+
+    async def _conexion(self, lector, escritor):
+        t0 = time.perf_counter()
+        ruta = None
+        try:
+            linea = await lector.readline()
+            if not linea:
+                return
+            metodo, ruta, _ = linea.decode("latin-1").split(" ", 2)
+            ruta = ruta.split("?", 1)[0]
+            largo = 0
+            while True:
+                encabezado = await lector.readline()
+                if encabezado in (b"\r\n", b"\n", b""):
+                    break
+                nombre, _, valor = encabezado.decode("latin-1").partition(":")
+                if nombre.strip().lower() == "content-length":
+                    largo = int(valor.strip())
+            if largo > self.max_cuerpo:
+                estado, respuesta = 413, {"error": f"Cuerpo mayor a {self.max_cuerpo} bytes"}
+            else:
+                cuerpo = await lector.readexactly(largo) if largo else b""
+                estado, respuesta = await self._procesar(metodo, ruta, cuerpo)
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            estado, respuesta = 400, {"error": f"Solicitud HTTP inválida: {e}"}
+
+        datos = json.dumps(respuesta, default=float).encode()
+        escritor.write(
+            f"HTTP/1.1 {estado} {_RAZONES.get(estado, '')}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(datos)}\r\nConnection: close\r\n\r\n".encode() + datos
+        )
+        try:
+            await escritor.drain()
+        finally:
+            escritor.close()
+        self.contadores[estado] += 1
+        if ruta is not None:
+            # Rutas desconocidas en un solo grupo, para que un barrido de URLs no cree una ventana por ruta
+            grupo = ruta if ruta in _RUTAS_WORKER or ruta in _RUTAS_FRONT else _OTRAS_RUTAS
+            self.latencias[grupo].append(time.perf_counter() - t0)
+
+    async def servir(self, host="127.0.0.1", puerto=8765, ruta_socket=None):
+        """Atiende consultas hasta que se cancele la tarea."""
+        from modulo_pf import obtener_sesion
+        self.pool = self._crear_pool()
+        # Calentar al menos un worker antes de aceptar consultas
+        await asyncio.get_running_loop().run_in_executor(self.pool, obtener_sesion)
+        if ruta_socket is not None:
+            servidor = await asyncio.start_unix_server(self._conexion, path=ruta_socket)
+            print(f"Servicio HC escuchando en el socket '{ruta_socket}'")
+        else:
+            servidor = await asyncio.start_server(self._conexion, host, puerto)
+            print(f"Servicio HC escuchando en http://{host}:{puerto}")
+        try:
+            async with servidor:
+                await servidor.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+
+
+# -------------------- Cliente --------------------
+class _ConexionUnix(http.client.HTTPConnection):
+    def __init__(self, ruta_socket, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.ruta_socket = ruta_socket
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.ruta_socket)
+
+
+def consultar(ruta, payload=None, host="127.0.0.1", puerto=8765, ruta_socket=None, timeout=600):
+    """
+    Envía una consulta al servicio y retorna la respuesta JSON.
+
+    Raises:
+        RuntimeError: si el servicio responde con un estado distinto de 200.
+    """
+    conexion = (_ConexionUnix(ruta_socket, timeout=timeout) if ruta_socket is not None
+                else http.client.HTTPConnection(host, puerto, timeout=timeout))
+    try:
+        if payload is None:
+            conexion.request("GET", ruta)
+        else:
+            conexion.request("POST", ruta, body=json.dumps(payload, default=float),
+                             headers={"Content-Type": "application/json"})
+        respuesta = conexion.getresponse()
+        datos = json.loads(respuesta.read())
+    finally:
+        conexion.close()
+    if respuesta.status != 200:
+        raise RuntimeError(f"El servicio respondió {respuesta.status}: {datos.get('error')}")
+    return datos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio local de hosting capacity")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--socket", dest="ruta_socket", help="socket Unix en vez de TCP")
+    parser.add_argument("--workers", type=int, default=0, help="procesos (0 = un hilo en este proceso)")
+    parser.add_argument("--max-en-cola", type=int, default=64, help="consultas simultáneas antes de responder 503")
+    parser.add_argument("--cache", dest="ruta_cache", default=None, help="archivo SQLite del cache de flujos")
+    args = parser.parse_args()
+
+    servicio = ServicioHC(workers=args.workers, max_en_cola=args.max_en_cola, ruta_cache=args.ruta_cache)
+    try:
+        asyncio.run(servicio.servir(args.host, args.puerto, args.ruta_socket))
+    except KeyboardInterrupt:
+        print("Servicio HC detenido.")
+
+
+if __name__ == "__main__":
+    main()
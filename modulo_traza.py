@@ -0,0 +1,170 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+# Instrumentación opcional por etapas. Mientras está desactivada, `etapa` retorna
+# un contexto vacío y `medir` llama directo a la función, así que el costo es
+# una comparación por llamada. Cada proceso registra sus propios eventos: para
+# perfilar conviene usar workers=1.
+
+_activo = False
+_eventos = []     # eventos Chrome trace ("X") ya cerrados
+_flujos = []      # un registro por flujo de potencia resuelto
+_pila = threading.local()
+_t0_ns = time.perf_counter_ns()
+_NULO = contextlib.nullcontext({})
+
+
+def activo():
+    """Indica si la instrumentación está encendida."""
+    return _activo
+
+
+def activar(reiniciar_registros=True):
+    """Enciende la instrumentación (por defecto descartando lo registrado antes)."""
+    global _activo
+    if reiniciar_registros:
+        reiniciar()
+    _activo = True
+
+
+def desactivar():
+    """Apaga la instrumentación; lo ya registrado se conserva."""
+    global _activo
+    _activo = False
+
+
+def reiniciar():
+    """Descarta todos los eventos y flujos registrados."""
+    global _t0_ns
+    _eventos.clear()
+    _flujos.clear()
+    _t0_ns = time.perf_counter_ns()
+
+
+def _contexto():
+    if not hasattr(_pila, "args"):
+        _pila.args = []
+    return _pila.args
+
+
+@contextlib.contextmanager
+def _etapa_activa(nombre, args):
+    pila = _contexto()
+    pila.append(args)
+    marca = time.perf_counter_ns()
+    try:
+        yield args
+    finally:
+        pila.pop()
+        cerrar(nombre, marca, **args)
+
+
+def etapa(nombre, **args):
+    """
+    Contexto que mide una etapa con nombre.
+
+    Los argumentos quedan en el evento de la traza y se heredan en los flujos
+    registrados dentro de la etapa (p. ej. `etapa("hora", hora=5)`). El contexto
+    entrega el dict de argumentos para agregar datos conocidos al final; si la
+    instrumentación está apagada es un dict compartido que no se registra.
+    """
+    if not _activo:
+        return _NULO
+    return _etapa_activa(nombre, args)
+
+
+def inicio():
+    """Marca el comienzo de una etapa que no cabe en un `with`; se cierra con `cerrar`."""
+    return time.perf_counter_ns() if _activo else None
+
+
+def cerrar(nombre, marca, **args):
+    """Registra la etapa iniciada con `inicio` (no hace nada si la marca es None)."""
+    if marca is None:
+        return
+    fin = time.perf_counter_ns()
+    _eventos.append({
+        "name": nombre, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+        "ts": (marca - _t0_ns) / 1000, "dur": (fin - marca) / 1000, "args": args,
+    })
+
+
+def medir(nombre=None):
+    """Decorador que mide cada llamada a la función como una etapa."""
+    def decorador(funcion):
+        etiqueta = nombre or funcion.__name__
+
+        @functools.wraps(funcion)
+        def envoltura(*a, **kw):
+            if not _activo:
+                return funcion(*a, **kw)
+            with _etapa_activa(etiqueta, {}):
+                return funcion(*a, **kw)
+        return envoltura
+    return decorador
+
+
+def registrar_flujo(origen, iteraciones, convergido, **args):
+    """Registra un flujo de potencia resuelto, con el contexto de las etapas abiertas (hora, etc.)."""
+    if not _activo:
+        return
+    registro = {}
+    for contexto in _contexto():
+        registro.update(contexto)
+    registro.update(args, origen=origen, iteraciones=int(iteraciones), convergido=bool(convergido))
+    _flujos.append(registro)
+
+
+def resumen():
+    """
+    Resume lo registrado.
+
+    Returns:
+        dict con "etapas" (llamadas, tiempo total, medio y máximo de cada etapa,
+        tiempos inclusivos) y "flujos" (totales, iteraciones Newton-Raphson y el
+        detalle por flujo, con la hora cuando se conoce).
+    """
+    etapas = {}
+    for e in _eventos:
+        s = etapas.setdefault(e["name"], {"llamadas": 0, "total_s": 0.0, "max_s": 0.0})
+        s["llamadas"] += 1
+        s["total_s"] += e["dur"] / 1e6
+        s["max_s"] = max(s["max_s"], e["dur"] / 1e6)
+    for s in etapas.values():
+        s["media_s"] = s["total_s"] / s["llamadas"]
+
+    iteraciones = [f["iteraciones"] for f in _flujos]
+    return {
+        "etapas": dict(sorted(etapas.items(), key=lambda kv: -kv[1]["total_s"])),
+        "flujos": {
+            "total": len(_flujos),
+            "no_convergidos": sum(not f["convergido"] for f in _flujos),
+            "iteraciones_media": sum(iteraciones) / len(iteraciones) if iteraciones else 0.0,
+            "iteraciones_max": max(iteraciones, default=0),
+            "detalle": list(_flujos),
+        },
+    }
+
+
+def guardar(ruta_base):
+    """
+    Escribe `<ruta_base>_resumen.json` y `<ruta_base>_traza.json`.
+
+    La traza usa el formato Chrome trace (abrir en chrome://tracing, Perfetto o speedscope).
+
+    Returns:
+        Tupla con las rutas del resumen y de la traza.
+    """
+    carpeta = os.path.dirname(ruta_base)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    ruta_resumen, ruta_traza = f"{ruta_base}_resumen.json", f"{ruta_base}_traza.json"
+    with open(ruta_resumen, "w") as archivo:
+        json.dump(resumen(), archivo, indent=2, default=float)
+    with open(ruta_traza, "w") as archivo:
+        json.dump({"traceEvents": _eventos, "displayTimeUnit": "ms"}, archivo, default=float)
+    return ruta_resumen, ruta_traza
@@ -1,18 +1,41 @@
 # %% -------------------- Parámetros del proyecto ---------------------
 # Seleccionar caso de estudio:
 case = "all"  # "base", "pv", "pv + bess", "ev", "ev + bess", "all"
+# Número de procesos para ejecutar los escenarios en paralelo (1 = secuencial)
+workers = 1
+# Archivo del cache persistente de flujos de potencia (None = solo en memoria)
+ruta_cache_pf = "cache/pf.sqlite"
+# Almacén columnar de resultados (Parquet particionado por escenario y corrida)
+ruta_almacen = "Resultados/almacen"
+# Archivos por caso crítico además del almacén: "html" (plotly) y/o "xlsx".
+# Por defecto no se generan (antes sí): usar ("html", "xlsx") o --formatos html xlsx
+formatos_exportacion = ()
+# Instrumentación por etapas: guarda Resultados/perfil_resumen.json y una traza
+# Chrome/speedscope (usar con workers = 1, cada proceso registra lo suyo)
+perfilar = False
+# Cache de etapas de los escenarios (HC, despacho BESS, carga por hora, ...)
+ruta_cache_etapas = "cache/etapas"
+# Recalcular todas las etapas aunque estén en el cache
+forzar = False
+# Todos los parámetros anteriores se pueden cambiar por línea de comandos:
+#   python proyecto.py pv "pv + bess" --workers 2 --formatos html
 
 # Librerías necesarias
-from modulo_pf import ejecutar_pf
-import matplotlib.pyplot as plt
+from modulo_pf import ejecutar_pf, configurar_cache
+from modulo_resultados import AlmacenResultados
+from modulo_pipeline import CacheEtapas, Etapa, ejecutar_etapas
+import modulo_traza as traza
 import numpy as np
 import pandas as pd
 import funciones as f
+import argparse
+import functools
 import os
+import time
 
-# Crear carpeta de resultados si no existe
-if not os.path.exists("Resultados"):
-    os.makedirs("Resultados")
+# Cache de flujos de potencia del proceso; se configura al ejecutar el primer
+# escenario (no al importar), también en cada worker del pool
+cache_pf = None
 
 # Datos de entrada
 perfil_demanda_kw = [
@@ -50,168 +73,245 @@ perfil_demanda_kw = np.array(perfil_demanda_kw)
 perfil_pv_pu = np.array(perfil_pv_pu)
 perfil_ev_pu = np.array(perfil_ev_pu)
 perfil_costo = np.array(perfil_costo)
+perfiles_pu = {"pv": perfil_pv_pu, "ev": perfil_ev_pu}
 
 
-# %% -------------------- Caso base ---------------------
-if case in ["base", "all"]:
-    print("\n---------- Analizando caso base ----------")
+# %% -------------------- Etapas de los escenarios ---------------------
+# Cada función es una etapa: recibe primero los valores de sus entradas y luego
+# los parámetros con nombre. Su resultado se guarda en el cache de etapas.
 
-    # No se considera EV, PV ni BESS en el caso base
-    perfil_neto_kw = perfil_demanda_kw
-
-    # Ejecutar flujo de potencia para cada hora y graficar
-    df, hora_max, carga_max, linea_max = f.loading_por_hora(perfil_neto_kw)
-    f.graficar_carga_por_linea(df, "Resultados/base_perfil_lineas", perfil_demanda_kw)
-
-    # Corremos el flujo para el caso máximo y generamos la figura de lineas
-    df_resultado_critico = ejecutar_pf(perfil_neto_kw[hora_max], f"Resultados/base_hora{hora_max}")
-
-    print("---------- Caso base finalizado ----------")
-
-
-# %% -------------------- Hosting capacity: PV ---------------------
-if case in ["pv", "all"]:
-    print("\n---------- Analizando: Hosting Capacity PV ----------")
-
-    # En este caso hay que considerar una cierta capacidad instalada de PV, steps de 10kW                       
-    perfil_pv_kw = perfil_pv_pu * 800 
-    perfil_neto_kw = perfil_demanda_kw - perfil_pv_kw
-
-    # Ejecutar flujo de potencia para cada hora y graficar
-    df, hora_max, carga_max, linea_max = f.loading_por_hora(perfil_neto_kw)
-    f.graficar_carga_por_linea(
-        df_loading_por_hora=df,
-        nombre_archivo="Resultados/pv_perfil_lineas",
-        perfil_demanda_kw=perfil_demanda_kw,
-        perfil_neto_kw=perfil_neto_kw,
-        perfil_pv_kw=perfil_pv_kw
-    )
-
-    # Corremos el flujo para el caso máximo y generamos la figura de lineas
-    print(f"Hosting Capacity PV: {perfil_pv_kw.max()} kW")
-    df_resultado_critico = ejecutar_pf(perfil_neto_kw[hora_max], f"Resultados/pv_hora{hora_max}")
+def buscar_hc(perfil_pu, kind, perfil_demanda_kw):
+    # Capacidad instalada de PV/EV que respeta el límite de carga, steps de 10kW
+    hc_kw, _, _ = f.hosting_capacity(perfil_pu, kind, step_kw=10, perfil_demanda_kw=perfil_demanda_kw)
+    return hc_kw
 
-    print("---------- Finalizado: Hosting Capacity PV ----------")
 
+def buscar_hc_bess(despacho, perfil_pu, kind, perfil_demanda_kw):
+    # Nueva capacidad con el despacho BESS fijo, en steps de 10kW
+    _, perfil_bess_kw = despacho
+    hc_kw, _, _ = f.hosting_capacity(perfil_pu, kind, step_kw=10, perfil_demanda_kw=perfil_demanda_kw,
+                                     perfil_bess_kw=perfil_bess_kw)
+    return hc_kw
 
-# %% -------------------- Hosting capacity: PV + BESS ---------------------
-if case in ["pv + bess", "all"]:
-    print("\n---------- Analizando: Hosting Capacity PV + BESS ----------")
 
-    # Capacidad de PV encontrada en etapa de HC (revisar si está correcto)
-    perfil_pv_kw = perfil_pv_pu * 800 
-
-    # Resolver optimización del despacho BESS
-    df_bess, perfil_bess_kw = f.resolver_despacho_bess(
+def despachar_bess(hc_kw, perfil_pu, kind, perfil_demanda_kw, perfil_costo, parametros_bess):
+    # Optimización del despacho BESS con la capacidad de la etapa de HC
+    perfil_der_kw = perfil_pu * hc_kw
+    return f.resolver_despacho_bess(
         parametros_bess=parametros_bess,
         perfil_costo=perfil_costo,
         perfil_demanda_kw=perfil_demanda_kw,
-        perfil_pv_kw=perfil_pv_kw,
-        perfil_ev_kw=None        
-    )
-    
-    # Se grafica el despacho de BESS
-    perfil_neto_kw = perfil_demanda_kw - perfil_pv_kw + perfil_bess_kw
-    f.graficar_perfiles_horarios(
-        perfil_demanda_kw=perfil_demanda_kw,
-        perfil_neto_kw=perfil_neto_kw,
-        perfil_pv_kw=perfil_pv_kw,
-        perfil_bess_kw=perfil_bess_kw,
-        perfil_costo=perfil_costo,
-        nombre_archivo="Resultados/pv_bess_perfiles"
+        perfil_pv_kw=perfil_der_kw if kind == "pv" else None,
+        perfil_ev_kw=perfil_der_kw if kind == "ev" else None
     )
 
-    # Volver a probar nuevos valores de PV, en steps de 10kW
-    perfil_pv_kw = perfil_pv_pu * 950 
-    perfil_neto_kw = perfil_demanda_kw - perfil_pv_kw + perfil_bess_kw
 
-    # Ejecutar flujo de potencia para cada hora y graficar
-    df, hora_max, carga_max, linea_max = f.loading_por_hora(perfil_neto_kw)
-    f.graficar_carga_por_linea(
-        df_loading_por_hora=df,
-        nombre_archivo="Resultados/pv_bess_perfil_lineas",
-        perfil_demanda_kw=perfil_demanda_kw,
-        perfil_neto_kw=perfil_neto_kw,
-        perfil_pv_kw=perfil_pv_kw
-    )
-
-    # Corremos el flujo para el caso máximo y generamos la figura de lineas
-    print(f"Hosting Capacity PV + BESS: {perfil_pv_kw.max()} kW")
-    df_resultado_critico = ejecutar_pf(perfil_neto_kw[hora_max], f"Resultados/pv_bess_hora{hora_max}")
-
-    print("---------- Finalizado: Hosting Capacity PV + BESS ----------")
+def armar_perfiles(hc_kw=None, despacho=None, perfil_pu=None, kind=None, perfil_demanda_kw=None):
+    # Perfiles horarios del escenario; sin hc_kw es el caso base (sin EV, PV ni BESS)
+    perfiles = {"kind": kind, "hc_kw": hc_kw, "demanda": perfil_demanda_kw, "der": None, "bess": None}
+    perfil_neto_kw = perfil_demanda_kw
+    if hc_kw is not None:
+        perfiles["der"] = perfil_pu * hc_kw
+        perfil_neto_kw = perfil_neto_kw + (perfiles["der"] if kind == "ev" else -perfiles["der"])
+    if despacho is not None:
+        perfiles["bess"] = despacho[1]
+        perfil_neto_kw = perfil_neto_kw + perfiles["bess"]
+    perfiles["neto"] = perfil_neto_kw
+    return perfiles
 
 
-# %% -------------------- Hosting capacity: EV ---------------------
-if case in ["ev", "all"]:
-    print("\n---------- Analizando: Hosting Capacity EV ----------")
+def carga_por_hora(perfiles):
+    # Flujo de potencia para cada hora: (CargaPorHora, hora_max, carga_max, linea_max)
+    return f.loading_por_hora(perfiles["neto"])
 
-    # En este caso hay que considerar una cierta capacidad instalada de EV, steps de 30kW                      
-    perfil_ev_kw = perfil_ev_pu * 360 
-    perfil_neto_kw = perfil_demanda_kw + perfil_ev_kw
 
-    # Ejecutar flujo de potencia para cada hora y graficar
-    df, hora_max, carga_max, linea_max = f.loading_por_hora(perfil_neto_kw)
+def graficar_lineas(perfiles, carga, nombre_archivo):
+    kind = perfiles["kind"]
     f.graficar_carga_por_linea(
-        df_loading_por_hora=df,
-        nombre_archivo="Resultados/ev_perfil_lineas",
-        perfil_demanda_kw=perfil_demanda_kw,
-        perfil_neto_kw=perfil_neto_kw,
-        perfil_ev_kw=perfil_ev_kw
+        df_loading_por_hora=carga[0],
+        nombre_archivo=nombre_archivo,
+        perfil_demanda_kw=perfiles["demanda"],
+        perfil_neto_kw=perfiles["neto"] if kind is not None else None,
+        perfil_pv_kw=perfiles["der"] if kind == "pv" else None,
+        perfil_ev_kw=perfiles["der"] if kind == "ev" else None
     )
+    return [f"{nombre_archivo}.png"]
 
-    # Corremos el flujo para el caso máximo y generamos la figura de lineas
-    print(f"Hosting Capacity EV: {perfil_ev_kw.max()} kW")
-    df_resultado_critico = ejecutar_pf(perfil_neto_kw[hora_max], f"Resultados/ev_hora{hora_max}")
 
-    print("---------- Finalizado: Hosting Capacity EV ----------")
-
-
-# %% -------------------- Hosting capacity: EV + BESS ---------------------
-if case in ["ev + bess", "all"]:
-    print("\n---------- Analizando: Hosting Capacity EV + BESS ----------")
-
-    # Capacidad de EV encontrada en etapa de HC (revisar si está correcto)
-    perfil_ev_kw = perfil_ev_pu * 360 
-
-    # Resolver optimización del despacho BESS
-    df_bess, perfil_bess_kw = f.resolver_despacho_bess(
-        parametros_bess=parametros_bess,
-        perfil_costo=perfil_costo,
-        perfil_demanda_kw=perfil_demanda_kw,
-        perfil_pv_kw=None,
-        perfil_ev_kw=perfil_ev_kw        
-    )
-    
-    # Se grafica el despacho de BESS
-    perfil_neto_kw = perfil_demanda_kw + perfil_ev_kw + perfil_bess_kw
+def graficar_despacho(hc_kw, despacho, perfil_pu, kind, perfil_demanda_kw, perfil_costo, nombre_archivo):
+    # Despacho BESS con la capacidad de la etapa de HC (antes de recalcularla)
+    perfiles = armar_perfiles(hc_kw, despacho, perfil_pu, kind, perfil_demanda_kw)
     f.graficar_perfiles_horarios(
         perfil_demanda_kw=perfil_demanda_kw,
-        perfil_neto_kw=perfil_neto_kw,
-        perfil_pv_kw=None,
-        perfil_ev_kw=perfil_ev_kw,
-        perfil_bess_kw=perfil_bess_kw,
+        perfil_neto_kw=perfiles["neto"],
+        perfil_pv_kw=perfiles["der"] if kind == "pv" else None,
+        perfil_ev_kw=perfiles["der"] if kind == "ev" else None,
+        perfil_bess_kw=perfiles["bess"],
         perfil_costo=perfil_costo,
-        nombre_archivo="Resultados/ev_bess_perfiles"
+        nombre_archivo=nombre_archivo
     )
+    return [f"{nombre_archivo}.png"]
 
-    # Volver a probar nuevos valores de EV, en steps de 10kW
-    perfil_ev_kw = perfil_ev_pu * 510 
-    perfil_neto_kw = perfil_demanda_kw + perfil_ev_kw + perfil_bess_kw
-
-    # Ejecutar flujo de potencia para cada hora y graficar
-    df, hora_max, carga_max, linea_max = f.loading_por_hora(perfil_neto_kw)
-    f.graficar_carga_por_linea(
-        df_loading_por_hora=df,
-        nombre_archivo="Resultados/ev_bess_perfil_lineas",
-        perfil_demanda_kw=perfil_demanda_kw,
-        perfil_neto_kw=perfil_neto_kw,
-        perfil_pv_kw=None,
-        perfil_ev_kw=perfil_ev_kw
-    )
 
+def flujo_hora_critica(perfiles, carga, nombre_archivo, formatos):
     # Corremos el flujo para el caso máximo y generamos la figura de lineas
-    print(f"Hosting Capacity EV + BESS: {perfil_ev_kw.max()} kW")
-    df_resultado_critico = ejecutar_pf(perfil_neto_kw[hora_max], f"Resultados/ev_bess_hora{hora_max}")
+    hora_max = carga[1]
+    base = f"{nombre_archivo}_hora{hora_max}"
+    df_resultado_critico = ejecutar_pf(perfiles["neto"][hora_max], base, formatos=formatos)
+    archivos = {"html": f"{base}_lineas.html", "xlsx": f"{base}.xlsx"}
+    return {
+        "hora": hora_max,
+        "demanda_neta_kw": perfiles["neto"][hora_max],
+        "df_line": df_resultado_critico,
+        "archivos": [archivos[formato] for formato in formatos],
+    }
+
+
+def guardar_almacen(carga, critico, despacho=None, escenario=None, ruta_almacen=ruta_almacen, run_id=None):
+    # Se escribe en cada ejecución: cada corrida tiene su partición en el almacén
+    almacen = AlmacenResultados(ruta_almacen, run_id)
+    almacen.guardar_cargas(escenario, carga[0])
+    if despacho is not None:
+        almacen.guardar_despacho(escenario, despacho[0])
+    almacen.guardar_critico(escenario, critico["hora"], critico["demanda_neta_kw"], critico["df_line"])
+
+
+# %% -------------------- Escenarios ---------------------
+ESCENARIOS = {
+    "base": (None, False),
+    "pv": ("pv", False),
+    "pv + bess": ("pv", True),
+    "ev": ("ev", False),
+    "ev + bess": ("ev", True),
+}
+
+def etapas_escenario(nombre, formatos=formatos_exportacion, ruta_almacen=ruta_almacen, run_id=None):
+    """
+    Arma el grafo de etapas de un escenario (lista ordenada de Etapa).
+
+    Args:
+        nombre: escenario de ESCENARIOS
+        formatos: archivos de la hora crítica además del almacén ("html", "xlsx")
+        ruta_almacen: raíz del almacén de resultados
+        run_id: corrida del almacén, compartida por los escenarios de una ejecución
+    """
+    kind, con_bess = ESCENARIOS[nombre]
+    archivo = f"Resultados/{nombre.replace(' + ', '_')}"
+    if kind is None:
+        etapas = [Etapa("perfiles", armar_perfiles, parametros={"perfil_demanda_kw": perfil_demanda_kw})]
+    else:
+        der = {"perfil_pu": perfiles_pu[kind], "kind": kind, "perfil_demanda_kw": perfil_demanda_kw}
+        etapas = [Etapa("hc", buscar_hc, parametros=der)]
+        if con_bess:
+            etapas += [
+                Etapa("despacho", despachar_bess, ["hc"],
+                      dict(der, perfil_costo=perfil_costo, parametros_bess=parametros_bess)),
+                Etapa("grafico_despacho", graficar_despacho, ["hc", "despacho"],
+                      dict(der, perfil_costo=perfil_costo, nombre_archivo=f"{archivo}_perfiles"), archivos=True),
+                Etapa("hc_bess", buscar_hc_bess, ["despacho"], der),
+                Etapa("perfiles", armar_perfiles, ["hc_bess", "despacho"], der),
+            ]
+        else:
+            etapas.append(Etapa("perfiles", armar_perfiles, ["hc"], der))
+
+    etapas += [
+        Etapa("carga", carga_por_hora, ["perfiles"]),
+        Etapa("grafico_lineas", graficar_lineas, ["perfiles", "carga"],
+              {"nombre_archivo": f"{archivo}_perfil_lineas"}, archivos=True),
+        Etapa("critico", flujo_hora_critica, ["perfiles", "carga"],
+              {"nombre_archivo": archivo, "formatos": tuple(formatos)}, archivos=lambda critico: critico["archivos"]),
+        Etapa("almacen", guardar_almacen, ["carga", "critico"] + (["despacho"] if con_bess else []),
+              {"escenario": nombre, "ruta_almacen": ruta_almacen, "run_id": run_id}, cachear=False),
+    ]
+    return etapas
+
+
+def ejecutar_escenario(
+    nombre,
+    formatos=formatos_exportacion,
+    forzar=forzar,
+    ruta_cache_pf=ruta_cache_pf,
+    ruta_cache_etapas=ruta_cache_etapas,
+    ruta_almacen=ruta_almacen,
+    run_id=None
+):
+    """
+    Ejecuta un escenario con su grafo de etapas.
+
+    Toda la configuración llega como argumento (no por variables globales), para
+    que los workers del pool la reciban igual con fork que con spawn.
+    """
+    global cache_pf
+    if cache_pf is None or cache_pf.ruta_disco != ruta_cache_pf:
+        cache_pf = configurar_cache(ruta_disco=ruta_cache_pf)
+    os.makedirs("Resultados", exist_ok=True)
+    print(f"\n---------- Analizando: {nombre} ----------")
+    etapas = etapas_escenario(nombre, formatos, ruta_almacen, run_id)
+    valores, estados = ejecutar_etapas(etapas, CacheEtapas(ruta_cache_etapas), forzar=forzar, escenario=nombre)
+    _, hora_max, carga_max, _ = valores["carga"]
+    hc_kw = valores["perfiles"]["hc_kw"]
+    if hc_kw is not None:
+        print(f"Hosting Capacity {nombre.upper()}: {hc_kw} kW")
+    reutilizadas = estados.index[estados["estado"] == "reutilizada"].tolist()
+    print(f"Etapas reutilizadas del cache: {', '.join(reutilizadas) if reutilizadas else 'ninguna'}")
+    print(f"---------- Finalizado: {nombre} ----------")
+    return {"hc_kw": hc_kw, "hora_max": hora_max, "carga_max": carga_max, "etapas": estados}
+
+
+# %% -------------------- Ejecución de escenarios ---------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hosting capacity de PV y EV, con y sin BESS, en la red CIGRE MV")
+    parser.add_argument("escenarios", nargs="*", metavar="ESCENARIO",
+                        help=f"escenarios a ejecutar ({', '.join(ESCENARIOS)} o all); por defecto '{case}'")
+    parser.add_argument("--workers", type=int, default=workers, help="procesos para escenarios en paralelo")
+    parser.add_argument("--formatos", nargs="*", choices=["html", "xlsx"], default=list(formatos_exportacion),
+                        help="archivos de la hora crítica además del almacén (Resultados/<caso>_horaXX.xlsx "
+                             "y _lineas.html); por defecto ninguno, usar '--formatos html xlsx' para la "
+                             "salida de versiones anteriores")
+    parser.add_argument("--forzar", action="store_true", default=forzar,
+                        help="recalcular todas las etapas; necesario tras actualizar librerías instaladas "
+                             "(pandapower, solvers), que la clave del cache no cubre")
+    parser.add_argument("--perfilar", action="store_true", default=perfilar, help="guardar perfil por etapas")
+    parser.add_argument("--listar", action="store_true", help="mostrar escenarios y etapas sin ejecutar")
+    args = parser.parse_args(argv)
+
+    casos = []
+    for c in args.escenarios or [case]:
+        if c == "all":
+            casos.extend(ESCENARIOS)
+        elif c in ESCENARIOS:
+            casos.append(c)
+        else:
+            parser.error(f"escenario desconocido '{c}' (opciones: {', '.join(ESCENARIOS)}, all)")
+    casos = list(dict.fromkeys(casos))
+
+    if args.listar:
+        for c in casos:
+            print(f"{c}: " + " -> ".join(e.nombre for e in etapas_escenario(c, tuple(args.formatos))))
+        return
+
+    if args.perfilar:
+        traza.activar()
+    # Todos los escenarios de esta ejecución comparten la corrida del almacén
+    configuracion = {"formatos": tuple(args.formatos), "forzar": args.forzar, "ruta_cache_pf": ruta_cache_pf,
+                     "ruta_cache_etapas": ruta_cache_etapas, "ruta_almacen": ruta_almacen,
+                     "run_id": time.strftime("%Y%m%d-%H%M%S")}
+    resultados = f.ejecutar_escenarios(
+        {c: functools.partial(ejecutar_escenario, c, **configuracion) for c in casos}, workers=args.workers
+    )
 
-    print("---------- Finalizado: Hosting Capacity EV + BESS ----------")
+    print("\n---------- Resumen ----------")
+    for c, r in resultados.items():
+        hc = "-" if r["hc_kw"] is None else f"{r['hc_kw']} kW"
+        calculadas = int((r["etapas"]["estado"] == "calculada").sum())
+        print(f"{c:>10}: HC = {hc}, carga máxima {r['carga_max']:.2f}% en hora {r['hora_max']} "
+              f"({calculadas} de {len(r['etapas'])} etapas calculadas)")
+    if cache_pf is not None:
+        print(f"Cache de flujos de potencia: {cache_pf.estadisticas()}")
+    if args.perfilar:
+        ruta_resumen, ruta_traza = traza.guardar("Resultados/perfil")
+        print(f"Perfil guardado en '{ruta_resumen}' y '{ruta_traza}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+import funciones as f
+from modulo_bess import DespachoBESS, valor_objetivo
+
+# Perfiles de 24 horas de proyecto.py y capacidades del orden de su hosting capacity
+DEMANDA_KW = np.array([65, 65, 65, 74, 75, 80, 100, 148, 148, 148, 148, 148,
+                       133, 123, 123, 123, 123, 148, 148, 148, 246, 246, 148, 74], dtype=float)
+PV_PU = np.array([0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.05, 0.05, 0.2, 0.35, 0.6, 0.8,
+                  0.95, 1.0, 0.9, 0.4, 0.2, 0.1, 0.05, 0.0, 0.0, 0.0, 0.0, 0.0])
+EV_PU = np.array([0.6, 0.7, 0.8, 0.7, 0.6, 0.5, 0.5, 0.4, 0.1, 0.1, 0.1, 0.1,
+                  0.1, 0.2, 0.2, 0.2, 0.2, 0.6, 0.7, 1.0, 1.0, 0.9, 0.7, 0.7])
+COSTO = np.array([100] * 3 + [50] * 4 + [100] * 4 + [50] * 6 + [100] * 7, dtype=float)
+HC_PV_KW = 800
+HC_EV_KW = 360
+
+PARAMETROS_BESS = {"E_MAX": 900, "E_MIN": 0, "E_INI": 5, "P_MAX": 150, "ETA_C": 1.0, "ETA_D": 1.0, "C_DEG": 15}
+EFICIENCIAS = {
+    "ideal": {"ETA_C": 1.0, "ETA_D": 1.0},
+    "con_perdidas": {"ETA_C": 0.95, "ETA_D": 0.9},
+}
+CASOS = {
+    "pv": (HC_PV_KW * PV_PU, None),
+    "ev": (None, HC_EV_KW * EV_PU),
+    "mixto": (HC_PV_KW * PV_PU, HC_EV_KW * EV_PU),
+}
+COLUMNAS = ["Periodo", "e_final", "p_c", "p_d", "g_buy", "g_sell", "p_solar", "p_bess"]
+
+
+def _solver_pyomo():
+    """Primer solver LP disponible para Pyomo (None si no hay ninguno)."""
+    import pyomo.environ as pyo
+    for nombre in ("glpk", "appsi_highs", "cbc"):
+        try:
+            if pyo.SolverFactory(nombre).available(exception_flag=False):
+                return nombre
+        except Exception:
+            continue
+    return None
+
+
+@pytest.fixture(scope="module")
+def solver_pyomo():
+    pytest.importorskip("pyomo.environ")
+    nombre = _solver_pyomo()
+    if nombre is None:
+        pytest.skip("No hay un solver LP instalado para Pyomo")
+    return nombre
+
+
+def _despacho_pyomo(solver, parametros, pv_kw, ev_kw):
+    """Despacho con Pyomo: resolver_despacho_bess si hay GLPK, si no el modelo persistente."""
+    if solver == "glpk":
+        return f.resolver_despacho_bess(parametros, COSTO, DEMANDA_KW, pv_kw, ev_kw, backend="pyomo")
+    return DespachoBESS(parametros, COSTO, DEMANDA_KW, pv_kw, ev_kw, solver=solver).resolver()
+
+
+@pytest.mark.parametrize("eficiencia", EFICIENCIAS)
+@pytest.mark.parametrize("caso", CASOS)
+def test_highs_igual_a_pyomo(solver_pyomo, caso, eficiencia):
+    parametros = {**PARAMETROS_BESS, **EFICIENCIAS[eficiencia]}
+    pv_kw, ev_kw = CASOS[caso]
+
+    df_highs, p_bess_highs = f.resolver_despacho_bess(parametros, COSTO, DEMANDA_KW, pv_kw, ev_kw, backend="highs")
+    df_pyomo, p_bess_pyomo = _despacho_pyomo(solver_pyomo, parametros, pv_kw, ev_kw)
+
+    # Mismo contrato que el modelo Pyomo
+    assert list(df_highs.columns) == COLUMNAS
+    assert list(df_highs.columns) == list(df_pyomo.columns)
+    assert len(p_bess_highs) == len(p_bess_pyomo) == len(DEMANDA_KW)
+    np.testing.assert_allclose(p_bess_highs, df_highs["p_bess"].to_numpy())
+
+    # El LP puede tener óptimos alternativos: se compara el objetivo, no el despacho
+    objetivo_highs = valor_objetivo(df_highs, parametros, COSTO)
+    objetivo_pyomo = valor_objetivo(df_pyomo, parametros, COSTO)
+    assert objetivo_highs == pytest.approx(objetivo_pyomo, rel=1e-9, abs=1e-6)